@@ -61,7 +61,56 @@ export const saveTranscription = catchAsyncError(async (req, res, next) => {
     }
 });
 
+// Upsert LiveKit agent events in the collection service (for real-time processing)
+// and save the finals in the database. Rows are unique per (meeting, segment), so a
+// final with a segmentId is saved every time it arrives and the database skips it if
+// it is already stored: a delivery retried after a failed insert is stored then, even
+// though the in-memory collection already has it. Finals without a segmentId (older
+// agents) are only saved the first time their segment is finalized. A failed insert
+// is thrown, so the agent gets an error status, keeps the batch and retries it.
+// Shared by the HTTP endpoint and the agent stream (agentStreamService.js).
+export const storeLiveKitEvents = async (meeting_id, events) => {
+    const finals = [];
+    for (const event of events) {
+        const finalized = transcriptionCollectionService.addTranscription(meeting_id, event);
+        if ((finalized || (event.type === 'final' && event.segmentId)) && event.text && event.text.trim()) {
+            finals.push(event);
+        }
+    }
+
+    if (finals.length > 0) {
+        try {
+            // Get meeting info to find user_id
+            const meeting = await prisma.meeting.findUnique({
+                where: { meeting_id },
+                select: { user_id: true }
+            });
+
+            if (meeting) {
+                // Save all finals of this request in one query
+                const { count } = await prisma.meetingTranscibtion.createMany({
+                    data: finals.map(event => ({
+                        meeting_id,
+                        user_id: meeting.user_id,
+                        transcribe: `[${event.participant}]: ${event.text}`,
+                        is_system_transcription: true,
+                        segment_id: event.segmentId || null,
+                        created_at: new Date()
+                    })),
+                    skipDuplicates: true
+                });
+                console.log(`✅ ${count} LiveKit transcription(s) saved to database for meeting ${meeting_id}`);
+            }
+        } catch (dbError) {
+            console.error('❌ Error saving LiveKit transcription to database:', dbError);
+            throw dbError;
+        }
+    }
+    return finals.length;
+};
+
 // New endpoint for LiveKit agent transcriptions
+// Accepts a single event object or a batch (array) of events in `transcription_data`
 export const handleLiveKitTranscription = catchAsyncError(async (req, res, next) => {
     const { meeting_id, transcription_data } = req.body;
 
@@ -69,36 +118,19 @@ export const handleLiveKitTranscription = catchAsyncError(async (req, res, next)
         return next(new ErrorHandler("Meeting ID and transcription data are required", 400));
     }
 
+    const isBatch = Array.isArray(transcription_data);
+    const events = isBatch ? transcription_data : [transcription_data];
+
     try {
-        // Add transcription to collection service (for real-time processing)
-        transcriptionCollectionService.addTranscription(meeting_id, transcription_data);
-
-        // Also save transcription immediately to database
-        if (transcription_data.type === 'final' && transcription_data.text && transcription_data.text.trim()) {
-            try {
-                // Get meeting info to find user_id
-                const meeting = await prisma.meeting.findUnique({
-                    where: { meeting_id },
-                    select: { user_id: true }
-                });
+        await storeLiveKitEvents(meeting_id, events);
 
-                if (meeting) {
-                    // Save transcription to database immediately
-                    await prisma.meetingTranscibtion.create({
-                        data: {
-                            meeting_id,
-                            user_id: meeting.user_id,
-                            transcribe: `[${transcription_data.participant}]: ${transcription_data.text}`,
-                            is_system_transcription: true,
-                            created_at: new Date()
-                        }
-                    });
-                    console.log(`✅ LiveKit transcription saved to database: ${transcription_data.text.substring(0, 50)}...`);
-                }
-            } catch (dbError) {
-                console.error('❌ Error saving LiveKit transcription to database:', dbError);
-                // Don't fail the request if DB save fails
-            }
+        if (isBatch) {
+            return res.status(200).json({
+                success: true,
+                message: "Transcriptions received and stored",
+                meeting_id: meeting_id,
+                count: events.length
+            });
         }
 
         res.status(200).json({
@@ -115,6 +147,89 @@ export const handleLiveKitTranscription = catchAsyncError(async (req, res, next)
     }
 });
 
+// Bulk upload of a meeting's complete transcript from the LiveKit agent at the end of the meeting
+// Segments already stored (by the live webhook or an earlier upload) are skipped by the
+// unique (meeting_id, segment_id) constraint, so the upload is safe after /end and after
+// a backend restart
+export const handleLiveKitTranscriptBulk = catchAsyncError(async (req, res, next) => {
+    const { meeting_id, segments } = req.body;
+
+    if (!meeting_id || !Array.isArray(segments)) {
+        return next(new ErrorHandler("Meeting ID and transcript segments are required", 400));
+    }
+
+    try {
+        const meeting = await prisma.meeting.findUnique({
+            where: { meeting_id },
+            select: { user_id: true, status: true }
+        });
+
+        // Once the meeting ended its collection was saved and freed; don't start a new one
+        // that nothing would free. Otherwise rebuild it from the agent's authoritative copy
+        const collecting = meeting && meeting.status !== 'COMPLETED';
+        const finals = [];
+        for (const segment of segments) {
+            if (!segment.text || !segment.text.trim()) {
+                continue;
+            }
+            const finalized = !collecting || transcriptionCollectionService.addTranscription(meeting_id, {
+                ...segment,
+                type: 'final',
+                seq: Number.MAX_SAFE_INTEGER
+            });
+            if (finalized) {
+                finals.push(segment);
+            }
+        }
+
+        let saved = 0;
+        if (meeting && finals.length > 0) {
+            ({ count: saved } = await prisma.meetingTranscibtion.createMany({
+                data: finals.map(segment => ({
+                    meeting_id,
+                    user_id: meeting.user_id,
+                    transcribe: `[${segment.participant}]: ${segment.text}`,
+                    is_system_transcription: true,
+                    segment_id: segment.segmentId || null,
+                    created_at: segment.at ? new Date(segment.at * 1000) : new Date()
+                })),
+                skipDuplicates: true
+            }));
+        }
+
+        console.log(`✅ Transcript of ${segments.length} segments received for meeting ${meeting_id}, ${saved} new`);
+
+        res.status(200).json({
+            success: true,
+            message: "Transcript received and stored",
+            meeting_id: meeting_id,
+            count: segments.length,
+            saved
+        });
+
+    } catch (error) {
+        console.error('❌ Error handling LiveKit transcript upload:', error);
+        return next(new ErrorHandler("Failed to handle transcript upload", 500));
+    }
+});
+
+// Start collecting a meeting's transcriptions; false if the meeting does not exist
+export const startLiveKitMeeting = async (meeting_id) => {
+    // Verify meeting exists
+    const meeting = await prisma.meeting.findUnique({
+        where: { meeting_id },
+        select: { meeting_id: true, status: true }
+    });
+
+    if (!meeting) {
+        return false;
+    }
+
+    // Start transcription collection
+    transcriptionCollectionService.startMeeting(meeting_id);
+    return true;
+};
+
 // Endpoint to start meeting transcription collection
 export const startMeetingTranscription = catchAsyncError(async (req, res, next) => {
     const { meeting_id } = req.params;
@@ -124,19 +239,10 @@ export const startMeetingTranscription = catchAsyncError(async (req, res, next)
     }
 
     try {
-        // Verify meeting exists
-        const meeting = await prisma.meeting.findUnique({
-            where: { meeting_id },
-            select: { meeting_id: true, status: true }
-        });
-
-        if (!meeting) {
+        if (!await startLiveKitMeeting(meeting_id)) {
             return next(new ErrorHandler("Meeting not found", 404));
         }
 
-        // Start transcription collection
-        transcriptionCollectionService.startMeeting(meeting_id);
-
         res.status(200).json({
             success: true,
             message: "Meeting transcription collection started",
@@ -66,6 +66,7 @@ import http from 'http';
 import { Server } from "socket.io";
 import initTranscribeServer from './config/transcribeServerConfig.js';
 import { initDirectTranscriptionServer } from './services/directTranscriptionService.js';
+import { initAgentStreamServer } from './services/agentStreamService.js';
 import passport from 'passport';
 import { ensureTopicsExist } from "./services/kafkaService.js";
 import { prisma } from './prisma/index.js';
@@ -266,6 +267,9 @@ chatNotificationService.setIO(chatIO);
 const directTranscribeIO = io.of('/transcription-direct');
 initDirectTranscriptionServer(directTranscribeIO);
 
+// Persistent websocket for LiveKit agent workers (optional, agents fall back to HTTP)
+initAgentStreamServer(httpserver);
+
 httpserver.listen(PORT, async () => {
     console.log(`server running: http://localhost:${PORT}`);
     
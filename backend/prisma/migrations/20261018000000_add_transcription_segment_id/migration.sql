@@ -0,0 +1,5 @@
+-- AlterTable
+ALTER TABLE "MeetingTranscibtion" ADD COLUMN "segment_id" TEXT;
+
+-- CreateIndex
+CREATE UNIQUE INDEX "MeetingTranscibtion_meeting_id_segment_id_key" ON "MeetingTranscibtion"("meeting_id", "segment_id");
@@ -5,6 +5,7 @@ import {
     updateMeetingStatus,
     getMeetingStats,
     handleLiveKitTranscription,
+    handleLiveKitTranscriptBulk,
     startMeetingTranscription,
     endMeetingTranscription,
     getTranscriptionStats
@@ -18,6 +19,7 @@ router.post('/save', authMiddleware, saveTranscription);
 
 // LiveKit agent transcription endpoints
 router.post('/livekit', handleLiveKitTranscription); // No auth - called by agent
+router.post('/livekit/bulk', handleLiveKitTranscriptBulk); // No auth - called by agent at meeting end
 router.post('/start/:meeting_id', startMeetingTranscription); // No auth - called by agent
 router.post('/end/:meeting_id', authMiddleware, endMeetingTranscription);
 router.get('/stats/:meeting_id', authMiddleware, getTranscriptionStats);
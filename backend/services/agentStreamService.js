@@ -0,0 +1,126 @@
+import { WebSocketServer } from 'ws';
+import { storeLiveKitEvents, startLiveKitMeeting } from '../controllers/transcriptionController.js';
+
+// Persistent websocket from LiveKit agent workers (see livekit/backend_stream.py).
+// A worker authenticates once with a `hello` and then sends the transcription
+// events and meeting starts of all its meetings over the one connection. Every
+// message has a sequence number and is acked once processed; messages are
+// processed in order, so acks are cumulative. The last processed sequence
+// number of each agent session is kept so a reconnecting worker can resume
+// without resending what was already stored.
+
+export const STREAM_PATH = '/api/v1/transcription/livekit/stream';
+
+// Sessions not seen for this long are forgotten; their worker falls back to a full resend
+const SESSION_TTL_MS = 10 * 60 * 1000;
+
+const sessions = new Map();
+
+const send = (ws, message) => {
+    if (ws.readyState === ws.OPEN) {
+        ws.send(JSON.stringify(message));
+    }
+};
+
+const handleMessage = async (message) => {
+    const { type, meeting_id } = message;
+    if (!meeting_id) {
+        return 400;
+    }
+    if (type === 'transcription') {
+        const { transcription_data } = message;
+        if (!transcription_data) {
+            return 400;
+        }
+        await storeLiveKitEvents(meeting_id, Array.isArray(transcription_data) ? transcription_data : [transcription_data]);
+        return 200;
+    }
+    if (type === 'start') {
+        return await startLiveKitMeeting(meeting_id) ? 200 : 404;
+    }
+    return 400;
+};
+
+const handleConnection = (ws) => {
+    let session = null;
+    // Messages are processed one at a time, in the order they arrived
+    let queue = Promise.resolve();
+
+    ws.on('message', (raw) => {
+        let message;
+        try {
+            message = JSON.parse(raw.toString());
+        } catch (error) {
+            console.error('❌ Malformed agent stream message:', error.message);
+            return;
+        }
+
+        if (!session) {
+            const apiKey = process.env.LIVEKIT_WEBHOOK_API_KEY;
+            if (message.type !== 'hello' || !message.session || (apiKey && message.api_key !== apiKey)) {
+                send(ws, { type: 'error', error: 'unauthorized' });
+                ws.close(4401, 'unauthorized');
+                return;
+            }
+            session = sessions.get(message.session) || { acked: 0 };
+            session.seenAt = Date.now();
+            sessions.set(message.session, session);
+            send(ws, { type: 'welcome', acked: session.acked });
+            console.log(`🔌 LiveKit agent stream connected (session ${message.session}, acked ${session.acked})`);
+            return;
+        }
+
+        const { seq } = message;
+        if (!Number.isInteger(seq)) {
+            console.error('❌ Agent stream message without a sequence number');
+            return;
+        }
+
+        queue = queue.then(async () => {
+            session.seenAt = Date.now();
+            // Resent after a reconnect but already processed
+            if (seq <= session.acked) {
+                send(ws, { type: 'ack', seq: session.acked });
+                return;
+            }
+            let status;
+            try {
+                status = await handleMessage(message);
+            } catch (error) {
+                console.error('❌ Error handling agent stream message:', error);
+                status = 500;
+            }
+            session.acked = seq;
+            send(ws, status === 200 ? { type: 'ack', seq } : { type: 'nack', seq, status });
+        });
+    });
+
+    ws.on('error', (error) => {
+        console.error('❌ LiveKit agent stream error:', error.message);
+    });
+};
+
+export const initAgentStreamServer = (httpserver) => {
+    console.log('🎤 Initializing LiveKit agent stream...');
+    const wss = new WebSocketServer({ noServer: true });
+    wss.on('connection', handleConnection);
+
+    httpserver.on('upgrade', (req, socket, head) => {
+        if (new URL(req.url, 'http://localhost').pathname !== STREAM_PATH) {
+            return; // Socket.IO handles its own upgrades
+        }
+        wss.handleUpgrade(req, socket, head, (ws) => wss.emit('connection', ws, req));
+    });
+
+    const cleanup = setInterval(() => {
+        const cutoff = Date.now() - SESSION_TTL_MS;
+        for (const [id, session] of sessions) {
+            if (session.seenAt < cutoff) {
+                sessions.delete(id);
+            }
+        }
+    }, 60 * 1000);
+    cleanup.unref();
+
+    return wss;
+};
@@ -2,33 +2,55 @@ import { prisma } from '../prisma/index.js';
 
 class TranscriptionCollectionService {
     constructor() {
-        this.transcriptions = new Map(); // meeting_id -> array of transcriptions
+        this.transcriptions = new Map(); // meeting_id -> Map of segmentId -> latest transcription of that segment
         this.meetingStartTimes = new Map(); // meeting_id -> start time
         this.meetingEndTimes = new Map(); // meeting_id -> end time
     }
 
     /**
-     * Add a transcription segment to the collection
+     * Add or update a transcription segment in the collection.
+     *
+     * The agent sends every interim and the final of one utterance with the same
+     * segmentId and an increasing seq, so each segment is kept once and replaced
+     * in place. Out-of-order or repeated updates (lower seq, or an interim after
+     * the final) are ignored.
      * @param {string} meetingId - The meeting ID
      * @param {Object} transcriptionData - Transcription data from LiveKit agent
+     * @returns {boolean} True if this update finalized the segment for the first time
      */
     addTranscription(meetingId, transcriptionData) {
         if (!this.transcriptions.has(meetingId)) {
-            this.transcriptions.set(meetingId, []);
+            this.transcriptions.set(meetingId, new Map());
         }
+        const segments = this.transcriptions.get(meetingId);
 
+        // Events from older agents carry no seq; their segmentId is only unique per event
+        const seq = Number.isInteger(transcriptionData.seq) ? transcriptionData.seq : 0;
+        const segmentId = transcriptionData.segmentId || `${transcriptionData.participant}_${Date.now()}_${segments.size}`;
+        const existing = segments.get(segmentId);
+
+        if (existing) {
+            if (existing.type === 'final' || seq < existing.seq) {
+                return false;
+            }
+        }
+
+        const now = new Date();
         const transcription = {
             type: transcriptionData.type, // 'interim' or 'final'
             text: transcriptionData.text,
             participant: transcriptionData.participant,
             trackSid: transcriptionData.trackSid,
-            segmentId: transcriptionData.segmentId,
-            timestamp: new Date(),
+            segmentId,
+            seq,
+            timestamp: existing ? existing.timestamp : now, // when the segment started
+            updatedAt: now,
             processed: false
         };
 
-        this.transcriptions.get(meetingId).push(transcription);
-        console.log(`📝 Added ${transcription.type} transcription for meeting ${meetingId}: ${transcription.text.substring(0, 50)}...`);
+        segments.set(segmentId, transcription);
+        console.log(`📝 ${existing ? 'Updated' : 'Added'} ${transcription.type} transcription for meeting ${meetingId}: ${transcription.text.substring(0, 50)}...`);
+        return transcription.type === 'final';
     }
 
     /**
@@ -60,7 +82,7 @@ class TranscriptionCollectionService {
      */
     async processAndSaveTranscriptions(meetingId, userId) {
         try {
-            const meetingTranscriptions = this.transcriptions.get(meetingId) || [];
+            const meetingTranscriptions = this.getTranscriptions(meetingId);
             
             if (meetingTranscriptions.length === 0) {
                 console.log(`📝 No transcriptions found for meeting ${meetingId}`);
@@ -210,7 +232,8 @@ class TranscriptionCollectionService {
      * @returns {Array} Array of transcriptions
      */
     getTranscriptions(meetingId) {
-        return this.transcriptions.get(meetingId) || [];
+        const segments = this.transcriptions.get(meetingId);
+        return segments ? Array.from(segments.values()) : [];
     }
 
     /**
@@ -229,7 +252,7 @@ class TranscriptionCollectionService {
      * @returns {Object} Meeting statistics
      */
     getMeetingStats(meetingId) {
-        const transcriptions = this.transcriptions.get(meetingId) || [];
+        const transcriptions = this.getTranscriptions(meetingId);
         const startTime = this.meetingStartTimes.get(meetingId);
         const endTime = this.meetingEndTimes.get(meetingId);
 
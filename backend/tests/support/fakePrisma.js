@@ -0,0 +1,99 @@
+import { randomUUID } from 'node:crypto';
+
+// In-memory stand-in for the parts of PrismaClient the transcription code uses.
+// `where` filters match on plain field equality; relation filters (`OR`, `participants`)
+// are ignored. Unique constraints from schema.prisma that the tests rely on are
+// enforced, including `skipDuplicates`.
+
+const UNIQUE = {
+    meetingTranscibtion: [['meeting_id', 'segment_id']]
+};
+
+const matches = (row, where = {}) => Object.entries(where).every(([field, value]) =>
+    field === 'OR' || (value !== null && typeof value === 'object') || row[field] === value);
+
+const select = (row, fields) => {
+    if (!row || !fields) {
+        return row ? { ...row } : null;
+    }
+    return Object.fromEntries(Object.keys(fields).filter(field => fields[field]).map(field => [field, row[field]]));
+};
+
+class Table {
+    constructor(name, idField) {
+        this.name = name;
+        this.idField = idField;
+        this.rows = [];
+    }
+
+    _conflicts(data) {
+        return (UNIQUE[this.name] || []).some(fields =>
+            // NULLs are distinct in a unique index, as in PostgreSQL
+            fields.every(field => data[field] !== null && data[field] !== undefined) &&
+            this.rows.some(row => fields.every(field => row[field] === data[field])));
+    }
+
+    _insert(data) {
+        const row = { [this.idField]: randomUUID(), created_at: new Date(), ...data };
+        this.rows.push(row);
+        return row;
+    }
+
+    async findUnique({ where, select: fields }) {
+        return select(this.rows.find(row => matches(row, where)), fields);
+    }
+
+    async findFirst({ where, select: fields }) {
+        return select(this.rows.find(row => matches(row, where)), fields);
+    }
+
+    async findMany({ where } = {}) {
+        return this.rows.filter(row => matches(row, where)).map(row => ({ ...row }));
+    }
+
+    async count({ where } = {}) {
+        return this.rows.filter(row => matches(row, where)).length;
+    }
+
+    async create({ data }) {
+        if (this._conflicts(data)) {
+            throw Object.assign(new Error(`Unique constraint failed on ${this.name}`), { code: 'P2002' });
+        }
+        return { ...this._insert(data) };
+    }
+
+    async createMany({ data, skipDuplicates = false }) {
+        let count = 0;
+        for (const item of data) {
+            if (this._conflicts(item)) {
+                if (skipDuplicates) {
+                    continue;
+                }
+                throw Object.assign(new Error(`Unique constraint failed on ${this.name}`), { code: 'P2002' });
+            }
+            this._insert(item);
+            count += 1;
+        }
+        return { count };
+    }
+
+    async update({ where, data }) {
+        const row = this.rows.find(candidate => matches(candidate, where));
+        if (!row) {
+            throw Object.assign(new Error(`No ${this.name} found`), { code: 'P2025' });
+        }
+        Object.assign(row, data);
+        return { ...row };
+    }
+}
+
+export class PrismaClient {
+    constructor() {
+        this.meeting = new Table('meeting', 'meeting_id');
+        this.meetingTranscibtion = new Table('meetingTranscibtion', 'meeting_transcribtion_id');
+    }
+
+    async $connect() {}
+
+    async $disconnect() {}
+}
@@ -0,0 +1,10 @@
+// Module resolve hook that points @prisma/client at fakePrisma.js, so controllers can
+// be tested without a database
+const fake = new URL('./fakePrisma.js', import.meta.url).href;
+
+export async function resolve(specifier, context, nextResolve) {
+    if (specifier === '@prisma/client') {
+        return { url: fake, shortCircuit: true };
+    }
+    return nextResolve(specifier, context);
+}
@@ -0,0 +1,4 @@
+// Loaded with `node --import`: replaces @prisma/client with the in-memory fake
+import { register } from 'node:module';
+
+register('./prismaLoader.js', import.meta.url);
@@ -0,0 +1,106 @@
+import { test, beforeEach } from 'node:test';
+import assert from 'node:assert/strict';
+
+import { prisma } from '../prisma/index.js';
+import transcriptionCollectionService from '../services/transcriptionCollectionService.js';
+import {
+    storeLiveKitEvents,
+    startLiveKitMeeting,
+    endMeetingTranscription,
+    handleLiveKitTranscriptBulk,
+    handleLiveKitTranscription
+} from '../controllers/transcriptionController.js';
+
+const MEETING_ID = 'meeting-1';
+const USER_ID = 7;
+
+const finals = [
+    { type: 'final', segmentId: 'TR_A-1', seq: 3, participant: 'alice', trackSid: 'TR_A', text: 'hello there' },
+    { type: 'final', segmentId: 'TR_B-1', seq: 2, participant: 'bob', trackSid: 'TR_B', text: 'hi alice' }
+];
+
+// Runs an Express handler and resolves with the response status and body (or the error passed to next)
+const call = (handler, req) => new Promise((resolve) => {
+    const res = {
+        statusCode: 200,
+        status(code) {
+            this.statusCode = code;
+            return this;
+        },
+        json(body) {
+            resolve({ status: this.statusCode, body });
+        }
+    };
+    handler(req, res, (error) => resolve({ status: error.statusCode || 500, error }));
+});
+
+const rows = () => prisma.meetingTranscibtion.count({ where: { meeting_id: MEETING_ID } });
+
+const bulkUpload = () => call(handleLiveKitTranscriptBulk, {
+    body: { meeting_id: MEETING_ID, segments: finals.map(({ type, seq, ...segment }) => ({ ...segment, at: 1 })) }
+});
+
+beforeEach(() => {
+    prisma.meeting.rows = [{ meeting_id: MEETING_ID, user_id: USER_ID, status: 'PENDING' }];
+    prisma.meetingTranscibtion.rows = [];
+    transcriptionCollectionService.clearAllTranscriptions();
+});
+
+test('bulk upload after /end stores no new rows and keeps no collection', async () => {
+    assert.equal(await startLiveKitMeeting(MEETING_ID), true);
+    await storeLiveKitEvents(MEETING_ID, finals);
+    assert.equal(await rows(), 2);
+
+    const ended = await call(endMeetingTranscription, { params: { meeting_id: MEETING_ID }, user: { user_id: USER_ID } });
+    assert.equal(ended.status, 200);
+    const afterEnd = await rows();
+
+    const uploaded = await bulkUpload();
+    assert.equal(uploaded.status, 200);
+    assert.equal(uploaded.body.saved, 0);
+    assert.equal(await rows(), afterEnd);
+    assert.deepEqual(transcriptionCollectionService.getTranscriptions(MEETING_ID), []);
+});
+
+test('finals delivered again after a backend restart are not stored twice', async () => {
+    await storeLiveKitEvents(MEETING_ID, finals);
+    // A restart loses the in-memory collection
+    transcriptionCollectionService.clearAllTranscriptions();
+
+    await storeLiveKitEvents(MEETING_ID, finals);
+    const uploaded = await bulkUpload();
+
+    assert.equal(uploaded.body.saved, 0);
+    assert.equal(await rows(), 2);
+});
+
+test('bulk upload stores the finals the live deliveries missed', async () => {
+    await storeLiveKitEvents(MEETING_ID, finals.slice(0, 1));
+
+    const uploaded = await bulkUpload();
+
+    assert.equal(uploaded.body.saved, 1);
+    assert.equal(await rows(), 2);
+});
+
+test('a failed insert answers 500 and the retried batch is stored', async () => {
+    const createMany = prisma.meetingTranscibtion.createMany;
+    prisma.meetingTranscibtion.createMany = async () => {
+        throw new Error('connection to the database lost');
+    };
+    const live = () => call(handleLiveKitTranscription, { body: { meeting_id: MEETING_ID, transcription_data: finals } });
+    try {
+        const failed = await live();
+        assert.equal(failed.status, 500);
+        assert.equal(await rows(), 0);
+    } finally {
+        prisma.meetingTranscibtion.createMany = createMany;
+    }
+
+    // The agent keeps the batch and delivers it again; the collection already has these finals
+    const retried = await live();
+    assert.equal(retried.status, 200);
+    assert.equal(await rows(), 2);
+    assert.equal((await live()).status, 200);
+    assert.equal(await rows(), 2);
+});
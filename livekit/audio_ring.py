@@ -0,0 +1,78 @@
+import os
+
+import numpy as np
+from livekit import rtc
+
+
+class AudioRingBuffer:
+    """The last `seconds` of audio pushed to a track's STT stream.
+
+    Samples are copied into one int16 buffer, allocated for the track's sample
+    rate and channel count when the first frame arrives, that is overwritten
+    in a circle; writing never allocates. A format change (rare) reallocates
+    it and forgets the old audio. `frames()` reads the newest audio back as
+    frames, for replay into a new STT stream.
+    """
+
+    def __init__(self, seconds=None):
+        self.seconds = seconds if seconds is not None else float(os.getenv("STT_FAILOVER_BUFFER_SECONDS", "10"))
+        self.sample_rate = None
+        self.num_channels = None
+        self._buffer = None
+        self._pos = 0
+        self._filled = 0
+
+    def _allocate(self, sample_rate, num_channels):
+        self.sample_rate = sample_rate
+        self.num_channels = num_channels
+        self._buffer = np.zeros(max(1, int(self.seconds * sample_rate)) * num_channels, dtype=np.int16)
+        self._pos = 0
+        self._filled = 0
+
+    def write(self, frame):
+        if frame.sample_rate != self.sample_rate or frame.num_channels != self.num_channels:
+            self._allocate(frame.sample_rate, frame.num_channels)
+        samples = np.frombuffer(frame.data, dtype=np.int16)
+        buffer = self._buffer
+        capacity = buffer.size
+        count = samples.size
+        if count >= capacity:
+            buffer[:] = samples[count - capacity:]
+            self._pos = 0
+            self._filled = capacity
+            return
+        end = self._pos + count
+        if end <= capacity:
+            buffer[self._pos:end] = samples
+        else:
+            split = capacity - self._pos
+            buffer[self._pos:] = samples[:split]
+            buffer[:count - split] = samples[split:]
+        self._pos = end % capacity
+        self._filled = min(capacity, self._filled + count)
+
+    @property
+    def duration(self):
+        """Seconds of audio held"""
+        if self._buffer is None:
+            return 0.0
+        return self._filled / self.num_channels / self.sample_rate
+
+    def frames(self, seconds=None, frame_ms=100):
+        """The newest `seconds` of audio (all of it if None) as frames of `frame_ms`, oldest first"""
+        if self._buffer is None or self._filled == 0:
+            return []
+        channels = self.num_channels
+        take = self._filled if seconds is None else min(self._filled, int(seconds * self.sample_rate) * channels)
+        take -= take % channels
+        start = (self._pos - take) % self._buffer.size
+        if start + take <= self._buffer.size:
+            samples = self._buffer[start:start + take]
+        else:
+            samples = np.concatenate((self._buffer[start:], self._buffer[:take - (self._buffer.size - start)]))
+        step = max(1, int(self.sample_rate * frame_ms / 1000)) * channels
+        return [
+            rtc.AudioFrame(samples[i:i + step].tobytes(), self.sample_rate, channels,
+                           min(step, take - i) // channels)
+            for i in range(0, take, step)
+        ]
@@ -0,0 +1,191 @@
+"""Optional persistent websocket from a worker process to the backend.
+
+One connection carries the transcription events and meeting start
+notifications of every meeting in the process. It is owned by the process's
+shared services (see ProcessServices in main.py), so a high-density worker,
+whose rooms are all threads of one process, has one connection for all of
+its meetings. In the default mode every room runs in a job process of its
+own, which shares nothing with the worker, so each room has its own stream. The agent authenticates once
+with a `hello`; each message after that has a sequence number, and the backend
+acknowledges the messages it has processed (acks are cumulative):
+
+    agent   {"type": "hello", "session": id, "api_key": key}
+    backend {"type": "welcome", "acked": last_seq}
+    agent   {"type": "transcription" | "start", "seq": n, "meeting_id": ..., ...}
+    backend {"type": "ack", "seq": n}  or  {"type": "nack", "seq": n, "status": 4xx/5xx}
+
+After a reconnect the agent sends the same session id, the backend answers with
+the last sequence number it processed, and unacknowledged messages are resent.
+The backend ignores messages it already processed. A message that is not
+acknowledged within the timeout, or that is sent while the stream is down, is
+delivered over HTTP instead; the backend upserts segments, so a message
+delivered both ways is stored once.
+"""
+import os
+import json
+import time
+import uuid
+import asyncio
+import logging
+from collections import OrderedDict
+
+import aiohttp
+
+import metrics
+
+logger = logging.getLogger("transcription-agent")
+
+
+def stream_enabled():
+    return os.getenv("BACKEND_STREAM", "false").lower() in ("1", "true", "yes", "websocket")
+
+
+def stream_url(backend_url):
+    """Websocket URL of the stream endpoint on `backend_url`"""
+    base = backend_url.rstrip("/")
+    if base.startswith("https://"):
+        base = "wss://" + base[len("https://"):]
+    elif base.startswith("http://"):
+        base = "ws://" + base[len("http://"):]
+    return base + os.getenv("BACKEND_STREAM_PATH", "/api/v1/transcription/livekit/stream")
+
+
+class BackendStream:
+    """Client side of the backend stream, with reconnect, resume and per-message acks"""
+
+    def __init__(self, url, api_key, get_session, ack_timeout=None, max_pending=None):
+        self.url = url
+        self.api_key = api_key
+        self._get_session = get_session
+        self.ack_timeout = ack_timeout if ack_timeout is not None \
+            else float(os.getenv("BACKEND_STREAM_ACK_TIMEOUT_SECONDS", "5"))
+        self.max_pending = max_pending if max_pending is not None \
+            else int(os.getenv("BACKEND_STREAM_MAX_PENDING", "1000"))
+        self.max_backoff = float(os.getenv("BACKEND_STREAM_MAX_BACKOFF_SECONDS", "30"))
+        self.session_id = uuid.uuid4().hex
+
+        self._seq = 0
+        # Sent messages waiting for their ack, in sequence order: seq -> (message, future)
+        self._pending = OrderedDict()
+        self._ws = None
+        self._task = None
+
+        # Stream statistics
+        self.connects = 0
+        self.resent = 0
+
+    @property
+    def connected(self):
+        return self._ws is not None and not self._ws.closed
+
+    def start(self):
+        """Connect in the background and keep reconnecting until closed (idempotent)"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="backend-stream")
+
+    async def request(self, message_type, payload, endpoint):
+        """Send one message and wait for its ack.
+
+        Returns 200 once acknowledged, the backend's status if it rejected the
+        message, or None if the message should go over HTTP instead.
+        """
+        if not self.connected or len(self._pending) >= self.max_pending:
+            metrics.BACKEND_STREAM_FALLBACKS.inc()
+            return None
+        self._seq += 1
+        seq = self._seq
+        message = {"type": message_type, "seq": seq, **payload}
+        future = asyncio.get_running_loop().create_future()
+        self._pending[seq] = (message, future)
+        started = time.perf_counter()
+        try:
+            # A failed send is retried after the reconnect, like any unacknowledged message
+            try:
+                await self._ws.send_str(json.dumps(message))
+            except Exception as e:
+                logger.warning(f"Backend stream send failed, waiting for reconnect: {e!r}")
+            status = await asyncio.wait_for(asyncio.shield(future), self.ack_timeout)
+        except asyncio.TimeoutError:
+            self._pending.pop(seq, None)
+            metrics.BACKEND_STREAM_FALLBACKS.inc()
+            return None
+        finally:
+            metrics.WEBHOOK_LATENCY.labels(endpoint).observe(time.perf_counter() - started)
+        if status is not None and status != 200:
+            metrics.WEBHOOK_ERRORS.labels(endpoint).inc()
+        return status
+
+    def _acked(self, acked):
+        while self._pending:
+            seq = next(iter(self._pending))
+            if seq > acked:
+                break
+            _, future = self._pending.pop(seq)
+            if not future.done():
+                future.set_result(200)
+
+    def _rejected(self, seq, status):
+        entry = self._pending.pop(seq, None)
+        if entry is not None and not entry[1].done():
+            entry[1].set_result(status)
+
+    async def _connect(self):
+        ws = await self._get_session().ws_connect(self.url, heartbeat=30, autoping=True)
+        try:
+            await ws.send_str(json.dumps({"type": "hello", "session": self.session_id, "api_key": self.api_key}))
+            welcome = await ws.receive_json(timeout=self.ack_timeout)
+            if welcome.get("type") != "welcome":
+                raise ConnectionError(f"backend refused the stream: {welcome.get('error', welcome)}")
+            # Messages the backend processed before the connection dropped are done
+            self._acked(int(welcome.get("acked", 0)))
+            # Resend the rest in order, before new messages can interleave with them
+            for message, _ in list(self._pending.values()):
+                await ws.send_str(json.dumps(message))
+                self.resent += 1
+        except BaseException:
+            await ws.close()
+            raise
+        return ws
+
+    async def _run(self):
+        backoff = 0.5
+        while True:
+            try:
+                ws = await self._connect()
+                self._ws = ws
+                self.connects += 1
+                backoff = 0.5
+                metrics.BACKEND_STREAM_CONNECTED.inc()
+                logger.info(f"[SUCCESS] Backend stream connected ({len(self._pending)} message(s) resent)")
+                try:
+                    async for msg in ws:
+                        if msg.type != aiohttp.WSMsgType.TEXT:
+                            continue
+                        data = json.loads(msg.data)
+                        if data.get("type") == "ack":
+                            self._acked(int(data["seq"]))
+                        elif data.get("type") == "nack":
+                            self._rejected(int(data["seq"]), int(data.get("status", 500)))
+                finally:
+                    self._ws = None
+                    metrics.BACKEND_STREAM_CONNECTED.dec()
+                    await ws.close()
+                logger.warning(f"Backend stream closed (code {ws.close_code}), reconnecting")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Backend stream unavailable, using HTTP: {e!r}")
+            metrics.BACKEND_STREAM_RECONNECTS.inc()
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, self.max_backoff)
+
+    async def aclose(self):
+        """Close the connection; messages still waiting for an ack go over HTTP"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        for _, future in self._pending.values():
+            if not future.done():
+                future.set_result(None)
+        self._pending.clear()
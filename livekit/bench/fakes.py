@@ -0,0 +1,543 @@
+"""Offline stand-ins for LiveKit, Deepgram and the backend.
+
+They let `main.transcribe_and_forward` (and `main.main`) run against recorded
+WAV files without a LiveKit server, a Deepgram key or the Node backend.
+"""
+import os
+import sys
+import json
+import time
+import wave
+import random
+import asyncio
+import contextlib
+import contextvars
+
+import numpy as np
+from aiohttp import web
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from livekit import rtc
+from livekit.agents import stt as lk_stt
+
+from wire_format import CompactDecoder, MAGIC
+
+FRAME_MS = 10
+
+
+def load_wav(path):
+    """Return (int16 samples shaped [n, channels], sample_rate) for a PCM16 WAV file"""
+    with wave.open(path, "rb") as wav:
+        if wav.getsampwidth() != 2:
+            raise ValueError(f"{path}: only 16-bit PCM WAV files are supported")
+        channels = wav.getnchannels()
+        sample_rate = wav.getframerate()
+        samples = np.frombuffer(wav.readframes(wav.getnframes()), dtype=np.int16)
+    return samples.reshape(-1, channels), sample_rate
+
+
+def synth_speech(seconds=30.0, sample_rate=48000, channels=1, seed=1):
+    """Speech-like test signal: voiced bursts of 1-4 s separated by 0.5-2 s of low noise"""
+    rng = np.random.default_rng(seed)
+    total = int(seconds * sample_rate)
+    out = rng.normal(0, 40, total)
+    pos = int(rng.uniform(0.3, 1.0) * sample_rate)
+    while pos < total:
+        length = int(rng.uniform(1.0, 4.0) * sample_rate)
+        t = np.arange(min(length, total - pos)) / sample_rate
+        pitch = rng.uniform(100, 220)
+        envelope = 0.5 + 0.5 * np.sin(2 * np.pi * 4 * t)
+        voiced = sum(np.sin(2 * np.pi * pitch * k * t) / k for k in range(1, 6))
+        out[pos:pos + t.size] += 4000 * envelope * voiced
+        pos += t.size + int(rng.uniform(0.5, 2.0) * sample_rate)
+    samples = np.clip(out, -32768, 32767).astype(np.int16)
+    return np.repeat(samples[:, None], channels, axis=1), sample_rate
+
+
+def find_utterances(samples, sample_rate, threshold_db=-40.0, min_gap=0.4):
+    """Speech regions (start, end) in seconds, from 100 ms RMS windows"""
+    mono = samples.mean(axis=1) if samples.ndim > 1 else samples
+    window = sample_rate // 10
+    count = mono.size // window
+    if count == 0:
+        return []
+    blocks = mono[:count * window].reshape(count, window).astype(np.float32)
+    level = 20 * np.log10(np.maximum(np.sqrt(np.mean(blocks * blocks, axis=1)), 1e-6) / 32768.0)
+    active = level >= threshold_db
+
+    regions = []
+    start = None
+    for i, is_active in enumerate(active):
+        if is_active and start is None:
+            start = i
+        elif not is_active and start is not None:
+            regions.append([start / 10, i / 10])
+            start = None
+    if start is not None:
+        regions.append([start / 10, count / 10])
+
+    merged = []
+    for region in regions:
+        if merged and region[0] - merged[-1][1] < min_gap:
+            merged[-1][1] = region[1]
+        else:
+            merged.append(region)
+    return [tuple(r) for r in merged]
+
+
+def repeat_utterances(utterances, duration):
+    """Numbered utterance script for audio that is looped every `duration` seconds"""
+    index = 0
+    offset = 0.0
+    while utterances:
+        for start, end in utterances:
+            yield index, (start + offset, end + offset)
+            index += 1
+        offset += duration
+
+
+class LatencyRecorder:
+    """Records when the fake STT emitted each transcript and when it was delivered"""
+
+    def __init__(self):
+        self.emitted = {}
+        self.room = []
+        self.backend = []
+        self.frames_pushed = 0
+        # Finals published in the room, by (track, text), to spot duplicates
+        self.room_finals = {}
+
+    def emitted_event(self, track_sid, kind, text, at=None):
+        self.emitted.setdefault((track_sid, kind, text), time.perf_counter() if at is None else at)
+
+    def reset_latencies(self):
+        self.room = []
+        self.backend = []
+
+    def delivered(self, channel, payload):
+        if not isinstance(payload, dict):
+            return
+        key = (payload.get("trackSid"), payload.get("type"), payload.get("text"))
+        if channel == "room" and payload.get("type") == "final":
+            self.room_finals[key] = self.room_finals.get(key, 0) + 1
+        emitted_at = self.emitted.get(key)
+        if emitted_at is not None:
+            getattr(self, channel).append(time.perf_counter() - emitted_at)
+
+
+class FakeAudioEvent:
+    def __init__(self, frame):
+        self.frame = frame
+
+
+class FakeAudioStream:
+    """Replays samples as 10 ms rtc.AudioFrames, paced at `speed` x real time (0 = unpaced).
+
+    With `loop` the samples are replayed until the stream is closed.
+    """
+
+    def __init__(self, samples, sample_rate, speed=1.0, on_end=None, loop=False):
+        self.samples = samples
+        self.sample_rate = sample_rate
+        self.speed = speed
+        self.on_end = on_end
+        self.loop = loop
+        self.frames = 0
+        self._closed = False
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        per_frame = self.sample_rate * FRAME_MS // 1000
+        channels = self.samples.shape[1]
+        started = time.perf_counter()
+        try:
+            while not self._closed:
+                for offset in range(0, self.samples.shape[0] - per_frame + 1, per_frame):
+                    if self._closed:
+                        break
+                    chunk = self.samples[offset:offset + per_frame]
+                    self.frames += 1
+                    yield FakeAudioEvent(rtc.AudioFrame(chunk.tobytes(), self.sample_rate, channels, per_frame))
+                    if self.speed > 0:
+                        due = started + self.frames * FRAME_MS / 1000 / self.speed
+                        await asyncio.sleep(max(0.0, due - time.perf_counter()))
+                    elif self.frames % 50 == 0:
+                        await asyncio.sleep(0)
+                if not self.loop:
+                    break
+        finally:
+            if self.on_end is not None:
+                self.on_end()
+
+    async def aclose(self):
+        self._closed = True
+
+
+class FakeSTTStream:
+    """Scripted STT stream: emits interims while an utterance is being pushed, then a final.
+
+    Events are driven by the amount of audio pushed, so they follow the replay
+    speed, and are delayed by the configured provider latencies (with jitter).
+    `utterances` is an iterable of (index, (start, end)) in audio seconds.
+    Latency is measured from when an event was due, so a late event loop counts.
+    With `fail_after` the stream fails like a dropped provider connection once
+    that many seconds were pushed. A replacement stream starts at
+    `audio_offset` on the utterance timeline. Both may be callables, read at
+    the first push. The latencies may be callables, read per event, to
+    model a provider whose latency changes over time.
+    """
+
+    def __init__(self, track_sid, utterances, recorder, interim_interval=0.3,
+                 interim_latency=0.15, final_latency=0.35, jitter=0.3, seed=0,
+                 fail_after=None, audio_offset=0.0):
+        self.track_sid = track_sid
+        self.fail_after = fail_after
+        self._audio_offset = audio_offset
+        self._offset = None
+        self._script = iter(utterances)
+        self._utterance = next(self._script, None)
+        self.recorder = recorder
+        self.interim_interval = interim_interval
+        self.interim_latency = interim_latency
+        self.final_latency = final_latency
+        self.jitter = jitter
+        self._rng = random.Random(seed)
+        self._audio_time = 0.0
+        self._next_interim = None
+        self._events = asyncio.Queue()
+        self._pending = set()
+        self._input_ended = False
+        self._audio_ended = False
+        self._closed = False
+
+    def _words(self, utterance_index, start, upto):
+        count = max(1, int((upto - start) * 3))
+        return " ".join(f"u{utterance_index}w{i}" for i in range(count))
+
+    def push_frame(self, frame):
+        if self._closed:
+            raise RuntimeError("stream is closed")
+        if self._offset is None:
+            self._offset = self._audio_offset() if callable(self._audio_offset) else self._audio_offset
+            self._audio_time = self._offset
+            if callable(self.fail_after):
+                self.fail_after = self.fail_after()
+            while self._utterance is not None and self._utterance[1][1] <= self._offset:
+                self._utterance = next(self._script, None)
+        self.recorder.frames_pushed += 1
+        self._audio_time += frame.samples_per_channel / frame.sample_rate
+        now = self._audio_time
+        if self.fail_after is not None and now - self._offset >= self.fail_after:
+            self._closed = True
+            self._events.put_nowait(ConnectionError("simulated STT connection failure"))
+            return
+        while self._utterance is not None:
+            index, (start, end) = self._utterance
+            if now < start:
+                return
+            if now >= end:
+                self._utterance = next(self._script, None)
+                self._next_interim = None
+                self._emit(lk_stt.SpeechEventType.FINAL_TRANSCRIPT, self._words(index, start, end), start, end,
+                           self.final_latency)
+                continue
+            if self._next_interim is None:
+                self._next_interim = start + self.interim_interval
+            if now >= self._next_interim:
+                self._next_interim += self.interim_interval
+                self._emit(lk_stt.SpeechEventType.INTERIM_TRANSCRIPT, self._words(index, start, now), start, now,
+                           self.interim_latency)
+            return
+
+    @staticmethod
+    def _latency(latency):
+        return latency() if callable(latency) else latency
+
+    def _emit(self, event_type, text, start_time, end_time, latency):
+        delay = max(0.0, self._latency(latency) * (1 + self._rng.uniform(-self.jitter, self.jitter)))
+        offset = self._offset or 0.0
+        event = lk_stt.SpeechEvent(
+            type=event_type,
+            alternatives=[lk_stt.SpeechData(language="en", text=text, start_time=max(0.0, start_time - offset),
+                                            end_time=end_time - offset)],
+        )
+        due = time.perf_counter() + delay
+        handle = asyncio.get_running_loop().call_later(delay, self._deliver, event, due)
+        self._pending.add(handle)
+
+    def _deliver(self, event, due):
+        self._pending = {h for h in self._pending if not h.cancelled() and h.when() > asyncio.get_running_loop().time()}
+        kind = "final" if event.type == lk_stt.SpeechEventType.FINAL_TRANSCRIPT else "interim"
+        self.recorder.emitted_event(self.track_sid, kind, event.alternatives[0].text, at=due)
+        self._events.put_nowait(event)
+        self._maybe_finish()
+
+    def end_of_audio(self):
+        """Called when the replayed audio runs out; the stream ends after pending events"""
+        if self._audio_ended:
+            return
+        self._audio_ended = True
+        if self._utterance is not None:
+            index, (start, end) = self._utterance
+            if self._audio_time > start:
+                self._emit(lk_stt.SpeechEventType.FINAL_TRANSCRIPT,
+                           self._words(index, start, self._audio_time), start, self._audio_time,
+                           self.final_latency)
+        self._utterance = None
+        self._input_ended = True
+        self._maybe_finish()
+
+    # Like the real stream: flush what was pushed and end after the pending events
+    end_input = end_of_audio
+
+    def _maybe_finish(self):
+        loop = asyncio.get_running_loop()
+        if self._input_ended and not any(h.when() > loop.time() for h in self._pending):
+            loop.call_later(self._latency(self.final_latency) * (1 + self.jitter) + 0.01, self._events.put_nowait, None)
+            self._input_ended = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        event = await self._events.get()
+        if event is None:
+            raise StopAsyncIteration
+        if isinstance(event, Exception):
+            raise event
+        return event
+
+    async def aclose(self):
+        self._closed = True
+        for handle in self._pending:
+            handle.cancel()
+        self._events.put_nowait(None)
+
+
+class FakeDataPacket:
+    def __init__(self, data, participant, topic=None):
+        self.data = data
+        self.participant = participant
+        self.topic = topic
+
+
+class FakeTrack:
+    def __init__(self, sid):
+        self.sid = sid
+        self.kind = rtc.TrackKind.KIND_AUDIO
+
+
+class FakeParticipant:
+    def __init__(self, identity, attributes=None):
+        self.identity = identity
+        self.attributes = attributes or {}
+
+
+class FakeLocalParticipant:
+    def __init__(self, recorder, publish_latency=0.002, room=None):
+        self.recorder = recorder
+        self.publish_latency = publish_latency
+        self.room = room
+        self.bytes_published = 0
+        self.messages_published = 0
+        self.lossy_messages = 0
+        # Bytes fanned out to receivers: an empty destination list means every remote participant
+        self.bytes_delivered = 0
+        self._decoder = CompactDecoder()
+
+    async def publish_data(self, payload, *, reliable=True, destination_identities=None, topic=""):
+        await asyncio.sleep(self.publish_latency)
+        self.bytes_published += len(payload)
+        self.messages_published += 1
+        if not reliable:
+            self.lossy_messages += 1
+        receivers = len(destination_identities) if destination_identities else \
+            len(self.room.remote_participants) if self.room is not None else 1
+        self.bytes_delivered += len(payload) * receivers
+        if payload[:len(MAGIC)] == MAGIC:
+            for item in self._decoder.decode(payload):
+                self.recorder.delivered("room", item)
+            return
+        try:
+            self.recorder.delivered("room", json.loads(payload))
+        except ValueError:
+            pass
+
+
+class FakeJobContext:
+    """Enough of agents.JobContext for `main`: connecting subscribes every participant's audio track"""
+
+    def __init__(self, room, participants, connect_latency=0.05):
+        self.room = room
+        self.participants = participants
+        self.connect_latency = connect_latency
+
+    async def connect(self, auto_subscribe=None):
+        await asyncio.sleep(self.connect_latency)
+        for participant, track in self.participants:
+            self.room.remote_participants[participant.identity] = participant
+            self.room.emit("track_subscribed", track, None, participant)
+
+
+class FakeRoom:
+    """Enough of rtc.Room for `transcribe_and_forward` and the event handlers in `main`"""
+
+    def __init__(self, name, recorder, publish_latency=0.002):
+        self.name = name
+        self.local_participant = FakeLocalParticipant(recorder, publish_latency, room=self)
+        self.remote_participants = {}
+        self._handlers = {}
+
+    def on(self, event, callback=None):
+        def register(fn):
+            self._handlers.setdefault(event, []).append(fn)
+            return fn
+        return register(callback) if callback is not None else register
+
+    def emit(self, event, *args):
+        for handler in self._handlers.get(event, []):
+            handler(*args)
+
+
+class StubBackend:
+    """Local aiohttp server implementing the agent-facing backend endpoints, including the stream"""
+
+    def __init__(self, recorder, latency=0.005, api_key=None):
+        self.recorder = recorder
+        self.latency = latency
+        self.api_key = api_key
+        self.requests = 0
+        self.events = 0
+        self.bulk_segments = 0
+        self.stream_connections = 0
+        self.stream_messages = 0
+        self._stream_sessions = {}
+        self._sockets = set()
+        self._runner = None
+        self.url = None
+
+    def _record(self, body):
+        items = body.get("transcription_data")
+        items = items if isinstance(items, list) else [items]
+        for item in items:
+            self.events += 1
+            self.recorder.delivered("backend", item)
+        return items
+
+    async def _transcription(self, request):
+        body = await request.json()
+        await asyncio.sleep(self.latency)
+        self.requests += 1
+        items = self._record(body)
+        return web.json_response({"success": True, "count": len(items)})
+
+    async def _bulk(self, request):
+        body = await request.json()  # aiohttp inflates the gzip request body
+        await asyncio.sleep(self.latency)
+        self.requests += 1
+        self.bulk_segments += len(body.get("segments", []))
+        return web.json_response({"success": True, "count": len(body.get("segments", []))})
+
+    async def _ok(self, request):
+        await request.read()
+        await asyncio.sleep(self.latency)
+        self.requests += 1
+        return web.json_response({"success": True})
+
+    async def _stream(self, request):
+        """Same protocol as backend/services/agentStreamService.js"""
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        hello = await ws.receive_json()
+        if hello.get("type") != "hello" or (self.api_key and hello.get("api_key") != self.api_key):
+            await ws.send_json({"type": "error", "error": "unauthorized"})
+            await ws.close(code=4401)
+            return ws
+        session = self._stream_sessions.setdefault(hello["session"], {"acked": 0})
+        await ws.send_json({"type": "welcome", "acked": session["acked"]})
+        self.stream_connections += 1
+        self._sockets.add(ws)
+        try:
+            async for msg in ws:
+                message = json.loads(msg.data)
+                seq = message["seq"]
+                if seq <= session["acked"]:
+                    await ws.send_json({"type": "ack", "seq": session["acked"]})
+                    continue
+                await asyncio.sleep(self.latency)
+                self.stream_messages += 1
+                if message["type"] == "transcription":
+                    self._record(message)
+                session["acked"] = seq
+                if not ws.closed:
+                    await ws.send_json({"type": "ack", "seq": seq})
+        finally:
+            self._sockets.discard(ws)
+        return ws
+
+    async def drop_streams(self):
+        """Close every open stream, as a backend restart or network blip would"""
+        for ws in list(self._sockets):
+            await ws.close()
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get("/", self._ok)
+        app.router.add_get("/api/v1/transcription/livekit/stream", self._stream)
+        app.router.add_post("/api/v1/transcription/livekit", self._transcription)
+        app.router.add_post("/api/v1/transcription/livekit/bulk", self._bulk)
+        app.router.add_post("/api/v1/transcription/{tail:.*}", self._ok)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://127.0.0.1:{port}"
+        return self.url
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+
+# Track whose transcribe_and_forward task (or one of its child tasks) is running
+_current_track = contextvars.ContextVar("current_track")
+
+
+@contextlib.contextmanager
+def patched_pipeline(main_module, audio_for_track, stt_for_track, backend_url=None):
+    """Route `main`'s AudioStream, STT pool and backend through the stand-ins.
+
+    `audio_for_track(track)` returns a FakeAudioStream and `stt_for_track(track)`
+    a FakeSTTStream. `transcribe_and_forward` opens the audio stream in its own
+    task, and every STT stream of the track (including ones reopened after a
+    mute or a failure) is acquired from that task or a task it started, so the
+    track is looked up in a context variable.
+    """
+    audio_stream_cls = main_module.rtc.AudioStream
+    pool_cls = main_module.stt_router.STTStreamPool
+    originals = (audio_stream_cls.__dict__["from_track"], pool_cls.acquire, pool_cls.start)
+
+    def from_track(*, track, **kwargs):
+        _current_track.set(track)
+        return audio_for_track(track)
+
+    audio_stream_cls.from_track = staticmethod(from_track)
+    pool_cls.acquire = lambda self: stt_for_track(_current_track.get())
+    pool_cls.start = lambda self: None
+    os.environ.setdefault("DEEPGRAM_API_KEY", "offline-benchmark")
+    if backend_url:
+        os.environ["BACKEND_URL"] = backend_url
+    try:
+        yield
+    finally:
+        audio_stream_cls.from_track, pool_cls.acquire, pool_cls.start = originals
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    return float(np.percentile(np.asarray(values), q))
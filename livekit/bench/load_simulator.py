@@ -0,0 +1,260 @@
+"""Multi-room load simulator for the transcription agent.
+
+Runs the real `main` entrypoint (and through it `transcribe_and_forward`) for a
+growing number of simulated rooms in one process, each with several talking
+participants, and reports per load step the event-to-delivery latency, CPU,
+RSS and event-loop lag. The first step that breaks a latency SLO is the
+capacity of one worker process.
+
+    python bench/load_simulator.py --participants 3 --rooms-per-step 2 --max-rooms 30
+
+Everything runs offline (scripted STT, fake rooms, local stub backend).
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import argparse
+import tempfile
+
+import psutil
+
+from fakes import (
+    LatencyRecorder, FakeAudioStream, FakeSTTStream, FakeTrack, FakeParticipant, FakeRoom, FakeJobContext,
+    StubBackend, patched_pipeline, load_wav, synth_speech, find_utterances, repeat_utterances, percentile,
+)
+
+# Keep spilled deliveries and load state out of the agent's real directories
+os.environ.setdefault("SPOOL_DIR", os.path.join(tempfile.gettempdir(), "transcription-load-spool"))
+os.environ.setdefault("LOAD_STATE_DIR", os.path.join(tempfile.gettempdir(), "transcription-load-state"))
+os.environ.setdefault("TRANSCRIPT_CHECKPOINT_DIR", os.path.join(tempfile.gettempdir(), "transcription-load-transcripts"))
+
+import main as agent
+from load import WorkerLoad
+
+
+class LoopLagMonitor:
+    """Samples how late the event loop wakes up from a fixed-interval sleep"""
+
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.samples = []
+        self._task = None
+
+    async def _run(self):
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, time.perf_counter() - started - self.interval))
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    def take(self):
+        samples, self.samples = self.samples, []
+        return samples
+
+    async def stop(self):
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+
+
+async def run_simulation(args):
+    recorder = LatencyRecorder()
+    backend = StubBackend(recorder, latency=args.backend_latency)
+    backend_url = await backend.start()
+
+    if args.wav:
+        samples, sample_rate = load_wav(args.wav)
+    else:
+        samples, sample_rate = synth_speech(args.seconds)
+    utterances = find_utterances(samples, sample_rate)
+    duration = samples.shape[0] / sample_rate
+
+    audio_streams = {}
+    stt_streams = {}
+
+    def audio_for_track(track):
+        stream = FakeAudioStream(samples, sample_rate, speed=1.0, loop=True)
+        audio_streams[track.sid] = stream
+        return stream
+
+    def stt_for_track(track):
+        stream = FakeSTTStream(
+            track.sid, repeat_utterances(utterances, duration), recorder,
+            interim_latency=args.interim_latency,
+            final_latency=args.final_latency,
+            seed=len(stt_streams),
+        )
+        audio_streams[track.sid].on_end = stream.end_of_audio
+        stt_streams[track.sid] = stream
+        return stream
+
+    worker_load = WorkerLoad()
+    process = psutil.Process()
+    process.cpu_percent(None)
+    lag = LoopLagMonitor()
+    lag.start()
+
+    rooms = []
+    jobs = []
+    steps = []
+    capacity = None
+
+    print_header()
+    with patched_pipeline(agent, audio_for_track, stt_for_track, backend_url):
+        while len(rooms) < args.max_rooms:
+            for _ in range(min(args.rooms_per_step, args.max_rooms - len(rooms))):
+                room_index = len(rooms)
+                room = FakeRoom(f"meeting-load-{room_index}", recorder, publish_latency=args.publish_latency)
+                participants = [
+                    (FakeParticipant(f"room{room_index}-participant{i}"), FakeTrack(f"TR_{room_index}_{i}"))
+                    for i in range(args.participants)
+                ]
+                rooms.append(room)
+                jobs.append(asyncio.create_task(agent.main(FakeJobContext(room, participants))))
+                # Stagger joins a little, like real dispatches
+                await asyncio.sleep(args.join_interval)
+
+            # Discard the join transient, then measure the step window
+            await asyncio.sleep(args.warmup)
+            recorder.reset_latencies()
+            lag.take()
+            frames_before = recorder.frames_pushed
+            process.cpu_percent(None)
+            peak_rss = process.memory_info().rss
+            window_started = time.perf_counter()
+            while time.perf_counter() - window_started < args.step_seconds:
+                await asyncio.sleep(0.25)
+                peak_rss = max(peak_rss, process.memory_info().rss)
+            window = time.perf_counter() - window_started
+
+            lag_samples = lag.take()
+            step = {
+                "rooms": len(rooms),
+                "streams": len(rooms) * args.participants,
+                "cpu_percent": process.cpu_percent(None),
+                "rss_mb": peak_rss / 2**20,
+                "stt_frames_per_second": (recorder.frames_pushed - frames_before) / window,
+                "expected_frames_per_second": len(rooms) * args.participants * 100.0,
+                "room_p50_ms": _ms(percentile(recorder.room, 50)),
+                "room_p99_ms": _ms(percentile(recorder.room, 99)),
+                "backend_p50_ms": _ms(percentile(recorder.backend, 50)),
+                "backend_p99_ms": _ms(percentile(recorder.backend, 99)),
+                "loop_lag_p99_ms": _ms(percentile(lag_samples, 99)),
+                "loop_lag_max_ms": _ms(max(lag_samples) if lag_samples else None),
+                "worker_load": worker_load.get_load(),
+            }
+            step["violations"] = slo_violations(step, args)
+            steps.append(step)
+            print_step(step)
+
+            if step["violations"] and capacity is None:
+                capacity = steps[-2]["streams"] if len(steps) > 1 else 0
+                if not args.keep_going:
+                    break
+
+        for room in rooms:
+            room.emit("disconnected")
+        await asyncio.gather(*jobs, return_exceptions=True)
+
+    await lag.stop()
+    await backend.stop()
+    return {"steps": steps, "capacity_streams": capacity, "slo": slo_config(args)}
+
+
+def slo_config(args):
+    return {
+        "room_p99_ms": args.slo_room_p99_ms,
+        "backend_p99_ms": args.slo_backend_p99_ms,
+        "loop_lag_p99_ms": args.slo_loop_lag_ms,
+        "min_frame_ratio": args.slo_min_frame_ratio,
+    }
+
+
+def slo_violations(step, args):
+    violations = []
+    for key, limit in (("room_p99_ms", args.slo_room_p99_ms),
+                       ("backend_p99_ms", args.slo_backend_p99_ms),
+                       ("loop_lag_p99_ms", args.slo_loop_lag_ms)):
+        if step[key] is not None and step[key] > limit:
+            violations.append(f"{key} {step[key]:.0f} > {limit:.0f}")
+    ratio = step["stt_frames_per_second"] / step["expected_frames_per_second"]
+    if ratio < args.slo_min_frame_ratio:
+        violations.append(f"STT got {ratio:.0%} of audio frames")
+    return violations
+
+
+def _ms(seconds):
+    return None if seconds is None else seconds * 1000.0
+
+
+COLUMNS = (
+    ("rooms", "rooms", 5, "d"), ("streams", "streams", 7, "d"), ("cpu%", "cpu_percent", 6, ".1f"),
+    ("rss MB", "rss_mb", 7, ".1f"), ("STT fr/s", "stt_frames_per_second", 9, ".0f"),
+    ("room p50", "room_p50_ms", 9, ".1f"), ("room p99", "room_p99_ms", 9, ".1f"),
+    ("bknd p99", "backend_p99_ms", 9, ".1f"), ("lag p99", "loop_lag_p99_ms", 8, ".1f"),
+    ("load", "worker_load", 5, ".2f"),
+)
+
+
+def print_header():
+    print("  ".join(f"{header:>{width}}" for header, _, width, _ in COLUMNS) + "  SLO")
+
+
+def print_step(step):
+    cells = []
+    for _, key, width, fmt in COLUMNS:
+        value = step[key]
+        cells.append(f"{'-':>{width}}" if value is None else f"{value:>{width}{fmt}}")
+    print("  ".join(cells) + "  " + ("; ".join(step["violations"]) or "ok"), flush=True)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--wav", help="16-bit PCM WAV file every participant replays in a loop")
+    parser.add_argument("--seconds", type=float, default=60.0, help="length of the synthetic signal")
+    parser.add_argument("--participants", type=int, default=3, help="talking participants per room")
+    parser.add_argument("--rooms-per-step", type=int, default=2, help="rooms added per load step")
+    parser.add_argument("--max-rooms", type=int, default=40, help="stop ramping at this many rooms")
+    parser.add_argument("--step-seconds", type=float, default=15.0, help="measurement window per step")
+    parser.add_argument("--warmup", type=float, default=3.0, help="seconds ignored after rooms join")
+    parser.add_argument("--join-interval", type=float, default=0.1, help="delay between room joins")
+    parser.add_argument("--interim-latency", type=float, default=0.15, help="simulated STT interim latency")
+    parser.add_argument("--final-latency", type=float, default=0.35, help="simulated STT final latency")
+    parser.add_argument("--publish-latency", type=float, default=0.002, help="simulated publish_data latency")
+    parser.add_argument("--backend-latency", type=float, default=0.005, help="stub backend response time")
+    parser.add_argument("--slo-room-p99-ms", type=float, default=500.0, help="p99 STT event to room publish")
+    parser.add_argument("--slo-backend-p99-ms", type=float, default=2000.0, help="p99 STT event to backend")
+    parser.add_argument("--slo-loop-lag-ms", type=float, default=100.0, help="p99 event-loop lag")
+    parser.add_argument("--slo-min-frame-ratio", type=float, default=0.95,
+                        help="minimum share of real-time audio frames reaching STT")
+    parser.add_argument("--keep-going", action="store_true", help="keep ramping after the first SLO breach")
+    parser.add_argument("--save", help="write all steps as JSON to this file")
+    parser.add_argument("--verbose", action="store_true", help="keep the agent's INFO logging")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if not args.verbose:
+        logging.getLogger("transcription-agent").setLevel(logging.WARNING)
+
+    result = asyncio.run(run_simulation(args))
+
+    if result["capacity_streams"] is None:
+        print(f"No SLO breach up to {result['steps'][-1]['streams']} streams")
+    else:
+        print(f"SLOs hold up to {result['capacity_streams']} streams "
+              f"({args.participants} per room) in one process")
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+        print(f"Saved result to {args.save}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,219 @@
+"""Offline replay benchmark for transcribe_and_forward.
+
+Replays WAV files through the real `main.transcribe_and_forward` with scripted
+STT events, a fake room and a local stub backend, and reports throughput, CPU,
+event-to-delivery latency and memory. Nothing leaves the machine.
+
+    python bench/replay_benchmark.py recording.wav --streams 8 --save run.json
+    python bench/replay_benchmark.py recording.wav --streams 8 --baseline run.json
+
+Without WAV files a synthetic speech-like signal is used.
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+import argparse
+import resource
+
+import psutil
+
+from fakes import (
+    LatencyRecorder, FakeAudioStream, FakeSTTStream, FakeTrack, FakeParticipant, FakeRoom, FakeDataPacket,
+    StubBackend, patched_pipeline, load_wav, synth_speech, find_utterances, percentile,
+)
+
+import main as agent
+from wire_format import FORMAT_ATTRIBUTE, COMPACT_FORMAT
+from caption_delivery import CONTROL_TOPIC
+
+
+def load_sources(paths, seconds):
+    if not paths:
+        return [("synthetic", *synth_speech(seconds))]
+    return [(os.path.basename(path), *load_wav(path)) for path in paths]
+
+
+async def run_benchmark(args):
+    recorder = LatencyRecorder()
+    backend = StubBackend(recorder, latency=args.backend_latency)
+    backend_url = await backend.start()
+    room = FakeRoom(args.room, recorder, publish_latency=args.publish_latency)
+    for i in range(args.listeners):
+        attributes = {FORMAT_ATTRIBUTE: COMPACT_FORMAT} if i < args.compact_listeners else {}
+        room.remote_participants[f"listener-{i}"] = FakeParticipant(f"listener-{i}", attributes)
+
+    sources = load_sources(args.wav, args.seconds)
+    audio_streams = {}
+    stt_streams = {}
+
+    def audio_for_track(track):
+        name, samples, sample_rate = sources[int(track.sid.rsplit("_", 1)[1]) % len(sources)]
+        stream = FakeAudioStream(samples, sample_rate, speed=args.speed)
+        stream.utterances = list(enumerate(find_utterances(samples, sample_rate)))
+        audio_streams[track.sid] = stream
+        return stream
+
+    def stt_for_track(track):
+        audio = audio_streams[track.sid]
+        replacing = track.sid in stt_streams
+        stream = FakeSTTStream(
+            track.sid, audio.utterances, recorder,
+            interim_interval=args.interim_interval,
+            interim_latency=args.interim_latency,
+            final_latency=args.final_latency,
+            seed=len(stt_streams),
+            # The first stream of each track fails; its replacement continues the track's timeline
+            fail_after=None if replacing else args.stt_fail_after,
+            audio_offset=(lambda: job.stt_sessions[track.sid].origin(job.stt_sessions[track.sid].stream)) if replacing else 0.0,
+        )
+        audio.on_end = stream.end_of_audio
+        stt_streams[track.sid] = stream
+        return stream
+
+    process = psutil.Process()
+    rss_before = process.memory_info().rss
+    peak_rss = rss_before
+    cpu_before = time.process_time()
+    started = time.perf_counter()
+
+    with patched_pipeline(agent, audio_for_track, stt_for_track, backend_url):
+        job = agent.JobState(room)
+        for i in range(args.caption_subscribers):
+            job.caption_policy.handle_control(FakeDataPacket(
+                json.dumps({"captions": True}).encode(), room.remote_participants[f"listener-{i}"], CONTROL_TOPIC))
+        tasks = [
+            asyncio.create_task(agent.transcribe_and_forward(
+                FakeParticipant(f"participant-{i}"), FakeTrack(f"TR_bench_{i}"), job))
+            for i in range(args.streams)
+        ]
+        done = asyncio.ensure_future(asyncio.gather(*tasks))
+        while not done.done():
+            peak_rss = max(peak_rss, process.memory_info().rss)
+            await asyncio.wait([done], timeout=0.25)
+        await done
+
+        # Let the batched backend deliveries drain, then release the shared services
+        await job.aclose(timeout=10.0)
+
+    elapsed = time.perf_counter() - started
+    cpu = time.process_time() - cpu_before
+    await backend.stop()
+
+    frames = sum(stream.frames for stream in audio_streams.values())
+    return {
+        "streams": args.streams,
+        "speed": args.speed,
+        "sources": [name for name, _, _ in sources],
+        "elapsed_seconds": elapsed,
+        "frames": frames,
+        "frames_per_second": frames / elapsed if elapsed else 0.0,
+        "frames_pushed_to_stt": recorder.frames_pushed,
+        "cpu_seconds": cpu,
+        "cpu_seconds_per_stream": cpu / args.streams,
+        "cpu_percent_per_stream": 100.0 * cpu / elapsed / args.streams if elapsed else 0.0,
+        "room_messages": room.local_participant.messages_published,
+        "room_bytes": room.local_participant.bytes_published,
+        "room_lossy_messages": room.local_participant.lossy_messages,
+        "room_bytes_delivered": room.local_participant.bytes_delivered,
+        "room_finals": len(recorder.room_finals),
+        "room_duplicate_finals": sum(count - 1 for count in recorder.room_finals.values()),
+        "backend_requests": backend.requests,
+        "backend_events": backend.events,
+        "backend_bulk_segments": backend.bulk_segments,
+        "backend_stream_messages": backend.stream_messages,
+        "room_latency_p50_ms": _ms(percentile(recorder.room, 50)),
+        "room_latency_p99_ms": _ms(percentile(recorder.room, 99)),
+        "backend_latency_p50_ms": _ms(percentile(recorder.backend, 50)),
+        "backend_latency_p99_ms": _ms(percentile(recorder.backend, 99)),
+        "rss_growth_mb": (peak_rss - rss_before) / 2**20,
+        "peak_rss_mb": max(peak_rss, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024) / 2**20,
+    }
+
+
+def _ms(seconds):
+    return None if seconds is None else seconds * 1000.0
+
+
+# Metrics where a lower value is better; everything else is reported without a verdict
+LOWER_IS_BETTER = (
+    "cpu_seconds_per_stream", "cpu_percent_per_stream", "room_messages", "room_bytes", "room_bytes_delivered", "room_duplicate_finals", "backend_requests",
+    "room_latency_p50_ms", "room_latency_p99_ms", "backend_latency_p50_ms", "backend_latency_p99_ms",
+    "rss_growth_mb", "peak_rss_mb",
+)
+
+
+def print_report(result, baseline=None):
+    print(f"Replayed {result['streams']} stream(s) of {', '.join(result['sources'])} at {result['speed']}x")
+    for key, value in result.items():
+        if key in ("streams", "speed", "sources"):
+            continue
+        line = f"  {key:<28} {_fmt(value):>12}"
+        if baseline is not None and isinstance(value, (int, float)) and isinstance(baseline.get(key), (int, float)):
+            base = baseline[key]
+            change = (value - base) / base * 100.0 if base else 0.0
+            verdict = ""
+            if key in LOWER_IS_BETTER and abs(change) >= 5:
+                verdict = "better" if change < 0 else "WORSE"
+            elif key == "frames_per_second" and abs(change) >= 5:
+                verdict = "better" if change > 0 else "WORSE"
+            line += f"   baseline {_fmt(base):>12}  {change:+7.1f}% {verdict}"
+        print(line)
+
+
+def _fmt(value):
+    if value is None:
+        return "-"
+    if isinstance(value, float):
+        return f"{value:.2f}"
+    return str(value)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("wav", nargs="*", help="16-bit PCM WAV files to replay (round-robin across streams)")
+    parser.add_argument("--streams", type=int, default=1, help="concurrent tracks to replay")
+    parser.add_argument("--speed", type=float, default=1.0, help="replay speed, 0 = as fast as possible")
+    parser.add_argument("--seconds", type=float, default=30.0, help="length of the synthetic signal")
+    parser.add_argument("--room", default="meeting-bench", help="room name (meeting id = name without 'meeting-')")
+    parser.add_argument("--interim-interval", type=float, default=0.3, help="seconds of audio between interims")
+    parser.add_argument("--interim-latency", type=float, default=0.15, help="simulated STT interim latency")
+    parser.add_argument("--final-latency", type=float, default=0.35, help="simulated STT final latency")
+    parser.add_argument("--listeners", type=int, default=1, help="non-talking participants in the room")
+    parser.add_argument("--compact-listeners", type=int, default=0,
+                        help="listeners that opt in to the compact format (needs TRANSCRIPTION_COMPACT_FORMAT=true)")
+    parser.add_argument("--caption-subscribers", type=int, default=0,
+                        help="listeners that opt in to captions with a control message (needs CAPTION_OPT_IN=true)")
+    parser.add_argument("--stt-fail-after", type=float,
+                        help="fail each track's first STT stream after this many seconds of audio")
+    parser.add_argument("--publish-latency", type=float, default=0.002, help="simulated publish_data latency")
+    parser.add_argument("--backend-latency", type=float, default=0.005, help="stub backend response time")
+    parser.add_argument("--save", help="write the result as JSON to this file")
+    parser.add_argument("--baseline", help="compare against a result saved with --save")
+    parser.add_argument("--verbose", action="store_true", help="keep the agent's INFO logging")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if not args.verbose:
+        logging.getLogger("transcription-agent").setLevel(logging.WARNING)
+
+    result = asyncio.run(run_benchmark(args))
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_report(result, baseline)
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+        print(f"Saved result to {args.save}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,225 @@
+"""Offline simulator for STT provider routing.
+
+Registers a simulated provider, `sim`, whose models follow configurable latency
+profiles, and starts tracks one after another through the real `STTRouter`. It
+reports which option each track was routed to, the latencies the router
+measured per option and, with --hedge, which option won each utterance.
+
+    python bench/routing_simulator.py --option fast=0.15,0.3@12=0.2,1.5 --option steady=0.2,0.5
+    python bench/routing_simulator.py --option fast=0.15,0.3@8=down@20=0.15,0.3 --option steady=0.2,0.5
+    python bench/routing_simulator.py --option a=0.15,0.4 --option b=0.15,0.4 --hedge
+
+A profile is `interim,final` latency in seconds, optionally followed by
+`@T=interim,final` (or `@T=down`: streams fail after half a second of audio)
+changes from T seconds into the run. Nothing leaves the machine.
+"""
+import os
+import sys
+import time
+import asyncio
+import logging
+import argparse
+
+from fakes import LatencyRecorder, FakeAudioStream, FakeSTTStream, synth_speech, find_utterances
+
+import stt_router
+from stt_router import STTRouter, HedgedStream, FIRST_INTERIM, FINAL
+
+SAMPLE_RATE = 16000
+
+
+def parse_profile(spec):
+    """[(from_second, (interim, final) or None if down)] from `0.15,0.3@12=0.2,1.5@20=down`"""
+    first, *changes = spec.split("@")
+    steps = [(0.0, tuple(float(v) for v in first.split(",")))]
+    for change in changes:
+        at, _, latencies = change.partition("=")
+        steps.append((float(at), None if latencies == "down" else tuple(float(v) for v in latencies.split(","))))
+    return steps
+
+
+class SimulatedProvider:
+    """Scripted STT client of the `sim` provider; streams follow the model's latency profile"""
+
+    def __init__(self, model, profiles, utterances, recorder, clock):
+        self.model = model
+        self.steps = profiles[model]
+        self.utterances = utterances
+        self.recorder = recorder
+        self.clock = clock
+        self.streams = 0
+
+    def state(self):
+        now = self.clock()
+        current = self.steps[0][1]
+        for at, latencies in self.steps:
+            if now >= at:
+                current = latencies
+        return current
+
+    def _latency(self, index):
+        def latency():
+            state = self.state()
+            return state[index] if state is not None else 0.1
+        return latency
+
+    def stream(self):
+        self.streams += 1
+        return FakeSTTStream(
+            self.model, self.utterances, self.recorder,
+            interim_latency=self._latency(0), final_latency=self._latency(1), jitter=0.2,
+            seed=f"{self.model}-{self.streams}",
+            # Decided when the stream is used, not when the pool pre-opened it
+            fail_after=lambda: 0.5 if self.state() is None else None,
+        )
+
+    async def aclose(self):
+        pass
+
+
+async def run_track(router, samples, speed, record):
+    """Push one track through a routed stream, reacquiring a stream if it fails"""
+    audio = FakeAudioStream(samples, SAMPLE_RATE, speed=speed)
+    stream = router.acquire()
+    record["options"].append(_options(stream))
+
+    async def consume(current):
+        try:
+            async for _ in current:
+                pass
+        except Exception:
+            pass
+
+    consumer = asyncio.create_task(consume(stream))
+    audio.on_end = lambda: stream.end_input()
+    async for event in audio:
+        try:
+            stream.push_frame(event.frame)
+        except Exception:
+            # Like a failover in TrackSTTSession, minus the replay of buffered audio
+            record["failovers"] += 1
+            await stream.aclose()
+            stream = router.acquire()
+            record["options"].append(_options(stream))
+            consumer = asyncio.create_task(consume(stream))
+    await asyncio.wait_for(consumer, 30)
+    if isinstance(stream, HedgedStream):
+        for key, wins in stream.wins.items():
+            record["wins"][key] = record["wins"].get(key, 0) + wins
+        record["dropped"] += stream.dropped
+    await stream.aclose()
+
+
+def _options(stream):
+    streams = stream.streams if isinstance(stream, HedgedStream) else [stream]
+    return "+".join(routed.option.key for routed in streams)
+
+
+async def run_simulation(args):
+    profiles = {}
+    for spec in args.option:
+        model, _, profile = spec.partition("=")
+        profiles[model] = parse_profile(profile)
+
+    recorder = LatencyRecorder()
+    samples, _ = synth_speech(args.track_seconds, sample_rate=SAMPLE_RATE)
+    utterances = list(enumerate(find_utterances(samples, SAMPLE_RATE)))
+    started = time.monotonic()
+
+    def clock():
+        return time.monotonic() - started
+
+    stt_router.register_provider(
+        "sim", lambda model, http_session: SimulatedProvider(model, profiles, utterances, recorder, clock))
+    router = STTRouter(
+        options=[("sim", model) for model in profiles], hedge=args.hedge, min_samples=args.min_samples,
+        window=args.window, max_age=args.max_age, cooldown=args.cooldown, state_file="",
+    )
+    router.start()
+
+    records = []
+    tasks = []
+    for i in range(args.tracks):
+        record = {"track": i, "started": clock(), "options": [], "failovers": 0, "wins": {}, "dropped": 0}
+        records.append(record)
+        tasks.append(asyncio.create_task(run_track(router, samples, args.speed, record)))
+        await asyncio.sleep(args.interval)
+    await asyncio.gather(*tasks)
+
+    result = {
+        "tracks": records,
+        "options": {
+            option.key: {
+                "routed": option.routed,
+                "failures": option.failures,
+                "first_interim_ms": _ms(option.latency[FIRST_INTERIM].median()),
+                "final_ms": _ms(option.latency[FINAL].median()),
+                "samples": option.samples,
+            }
+            for option in router.options
+        },
+    }
+    await router.aclose()
+    return result
+
+
+def _ms(seconds):
+    return None if seconds is None else seconds * 1000.0
+
+
+def print_report(result, hedge):
+    print("Track routing")
+    for record in result["tracks"]:
+        line = f"  t={record['started']:6.1f}s  track {record['track']:<3} {' -> '.join(record['options'])}"
+        if hedge:
+            wins = ", ".join(f"{key} {count}" for key, count in sorted(record["wins"].items()))
+            line += f"   wins: {wins or '-'}"
+        print(line)
+    print("Options (rolling window at the end of the run)")
+    for key, stats in result["options"].items():
+        print(f"  {key:<16} routed {stats['routed']:>3}  failures {stats['failures']:>2}  "
+              f"first interim p50 {_fmt(stats['first_interim_ms'])} ms  final p50 {_fmt(stats['final_ms'])} ms  "
+              f"({stats['samples']} samples)")
+    if hedge:
+        wins = {}
+        for record in result["tracks"]:
+            for key, count in record["wins"].items():
+                wins[key] = wins.get(key, 0) + count
+        total = sum(wins.values())
+        dropped = sum(record["dropped"] for record in result["tracks"])
+        print(f"Hedged utterances: {total} kept, {dropped} duplicate finals dropped")
+        for key, count in sorted(wins.items()):
+            print(f"  {key:<16} won {count} ({count / total * 100.0:.0f}%)")
+
+
+def _fmt(value):
+    return "-" if value is None else f"{value:.0f}"
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--option", action="append", required=True,
+                        help="simulated model and latency profile, e.g. fast=0.15,0.3@12=0.2,1.5 (repeatable)")
+    parser.add_argument("--tracks", type=int, default=12, help="tracks to start")
+    parser.add_argument("--interval", type=float, default=2.0, help="seconds between track starts")
+    parser.add_argument("--track-seconds", type=float, default=8.0, help="audio per track")
+    parser.add_argument("--speed", type=float, default=2.0, help="replay speed of each track")
+    parser.add_argument("--hedge", action="store_true", help="transcribe each track with the two best options")
+    parser.add_argument("--min-samples", type=int, default=3, help="finals needed before an option is ranked")
+    parser.add_argument("--window", type=int, default=20, help="latency samples kept per option")
+    parser.add_argument("--max-age", type=float, default=300.0, help="seconds a latency sample counts")
+    parser.add_argument("--cooldown", type=float, default=10.0, help="seconds a failed option is skipped")
+    parser.add_argument("--verbose", action="store_true", help="keep the agent's INFO logging")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.ERROR)
+    os.environ.setdefault("STT_POOL_SIZE", "1")
+    result = asyncio.run(run_simulation(args))
+    print_report(result, args.hedge)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
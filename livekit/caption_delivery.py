@@ -0,0 +1,67 @@
+"""Delivery policy for captions published on the lk.transcription data topic.
+
+Finals are always sent on the reliable data channel. Interims are superseded
+within a fraction of a second, so with CAPTION_INTERIMS_LOSSY they go on the
+lossy channel instead, where a lost or late interim never holds up the ones
+after it (compact listeners resync at the next keyframe, see wire_format.py). With CAPTION_OPT_IN, captions are only sent to participants that
+asked for them with a control message on CONTROL_TOPIC:
+
+    {"captions": true}     start receiving captions
+    {"captions": false}    stop receiving captions
+"""
+import os
+import json
+import logging
+
+logger = logging.getLogger("transcription-agent")
+
+CONTROL_TOPIC = "lk.transcription.control"
+
+# Larger interims go on the reliable channel; lossy packets are not fragmented
+LOSSY_MAX_BYTES = 1300
+
+
+def _env_flag(name, default):
+    return os.getenv(name, default).lower() in ("1", "true", "yes")
+
+
+class CaptionDeliveryPolicy:
+    """Decides the channel and the recipients of each caption in one room"""
+
+    def __init__(self, interims_lossy=None, opt_in=None):
+        self.interims_lossy = interims_lossy if interims_lossy is not None \
+            else _env_flag("CAPTION_INTERIMS_LOSSY", "true")
+        self.opt_in = opt_in if opt_in is not None else _env_flag("CAPTION_OPT_IN", "false")
+        self.subscribers = set()
+
+    def reliable(self, payload, size):
+        """Whether a caption of `size` bytes is sent on the reliable channel"""
+        return payload["type"] == "final" or not self.interims_lossy or size > LOSSY_MAX_BYTES
+
+    def recipients(self, room):
+        """Identities to send captions to, or None for everyone in the room"""
+        if not self.opt_in:
+            return None
+        # Subscribers that left are skipped; they are dropped on participant_disconnected
+        return [identity for identity in self.subscribers if identity in room.remote_participants]
+
+    def handle_control(self, packet):
+        """Apply a control message from a participant; returns the new opt-in state, or None if ignored"""
+        if packet.topic != CONTROL_TOPIC or packet.participant is None:
+            return None
+        try:
+            message = json.loads(packet.data)
+            wanted = message["captions"]
+        except (ValueError, TypeError, KeyError):
+            logger.warning(f"Ignoring malformed caption control message from {packet.participant.identity}")
+            return None
+        if not isinstance(wanted, bool):
+            return None
+        if wanted:
+            self.subscribers.add(packet.participant.identity)
+        else:
+            self.subscribers.discard(packet.participant.identity)
+        return wanted
+
+    def participant_left(self, identity):
+        self.subscribers.discard(identity)
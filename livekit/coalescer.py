@@ -0,0 +1,150 @@
+import os
+import asyncio
+import logging
+
+logger = logging.getLogger("transcription-agent")
+
+
+class _Channel:
+    """Throttle state for one output channel (room or backend)"""
+
+    def __init__(self, name, send, max_rate):
+        self.name = name
+        self.send = send
+        self.min_interval = 1.0 / max_rate if max_rate > 0 else 0.0
+        self.last_sent_at = None
+        self.pending = None
+        self.timer = None
+        self.lock = asyncio.Lock()
+        self.sent = 0
+        self.suppressed = 0
+
+
+class TranscriptSegments:
+    """Segment IDs and sequence numbers of one track's transcripts.
+
+    Every interim and the final of one utterance share a segment ID, and `seq`
+    counts the updates of that segment. Each STT stream has its own open
+    segment: a stream that takes over after a failover or a resume starts a
+    new segment, and the stream before it can still finish its own. IDs are
+    `<prefix>_<n>`, with `n` counting the track's segments across streams.
+    """
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self._count = 0
+        self._open = {}
+
+    def next(self, stream, final):
+        """Segment fields for the next transcript of `stream`; a final closes its segment"""
+        segment = self._open.get(stream)
+        if segment is None:
+            self._count += 1
+            segment = self._open[stream] = [f"{self.prefix}_{self._count}", 0]
+        fields = {"segmentId": segment[0], "seq": segment[1]}
+        segment[1] += 1
+        if final:
+            del self._open[stream]
+        return fields
+
+    def release(self, stream):
+        """Forget the open segment of a stream that delivers no more transcripts"""
+        self._open.pop(stream, None)
+
+
+class InterimCoalescer:
+    """Coalesces one participant's interim transcripts before they are published.
+
+    - Interims whose text is unchanged (identical to, or a prefix of, the previous
+      interim) are dropped.
+    - Interims are throttled to a maximum rate per channel. While throttled, only
+      the latest interim is kept and it is sent once the interval has passed.
+    - Before a final is sent, any interim still held back is sent first.
+    """
+
+    def __init__(self, send_room, send_backend, room_max_rate=None, backend_max_rate=None):
+        if room_max_rate is None:
+            room_max_rate = float(os.getenv("INTERIM_ROOM_MAX_RATE", "10"))
+        if backend_max_rate is None:
+            backend_max_rate = float(os.getenv("INTERIM_BACKEND_MAX_RATE", "2"))
+        self.channels = [
+            _Channel("room", send_room, room_max_rate),
+            _Channel("backend", send_backend, backend_max_rate),
+        ]
+        self._last_text = None
+        self._flush_tasks = set()
+        self.duplicates_dropped = 0
+
+    async def interim(self, payload):
+        """Offer an interim transcript to every channel"""
+        text = payload["text"].strip()
+        if not text or (self._last_text is not None and self._last_text.startswith(text)):
+            self.duplicates_dropped += 1
+            return
+        self._last_text = text
+
+        loop = asyncio.get_running_loop()
+        for channel in self.channels:
+            now = loop.time()
+            wait = 0.0
+            if channel.last_sent_at is not None:
+                wait = channel.last_sent_at + channel.min_interval - now
+
+            if wait <= 0 and channel.timer is None:
+                async with channel.lock:
+                    await self._send(channel, payload)
+                continue
+
+            # Throttled: keep only the latest interim and send it when the interval expires
+            if channel.pending is not None:
+                channel.suppressed += 1
+            channel.pending = payload
+            if channel.timer is None:
+                channel.timer = loop.call_later(max(wait, 0.0), self._schedule_flush, channel)
+
+    async def final(self, payload):
+        """Send the latest held-back interim (if any) followed by the final transcript"""
+        self._last_text = None
+        for channel in self.channels:
+            self._cancel_timer(channel)
+            async with channel.lock:
+                if channel.pending is not None:
+                    pending, channel.pending = channel.pending, None
+                    await self._send(channel, pending)
+                await self._send(channel, payload)
+                # A new utterance starts unthrottled
+                channel.last_sent_at = None
+
+    def _schedule_flush(self, channel):
+        channel.timer = None
+        task = asyncio.create_task(self._flush(channel))
+        self._flush_tasks.add(task)
+        task.add_done_callback(self._flush_tasks.discard)
+
+    async def _flush(self, channel):
+        async with channel.lock:
+            if channel.pending is None:
+                return
+            pending, channel.pending = channel.pending, None
+            await self._send(channel, pending)
+
+    async def _send(self, channel, payload):
+        try:
+            await channel.send(payload)
+        except Exception as e:
+            logger.error(f"Failed to send transcript to {channel.name}: {e}")
+        channel.last_sent_at = asyncio.get_running_loop().time()
+        channel.sent += 1
+
+    def _cancel_timer(self, channel):
+        if channel.timer is not None:
+            channel.timer.cancel()
+            channel.timer = None
+
+    async def aclose(self):
+        """Drop held-back interims and wait for in-progress flushes"""
+        for channel in self.channels:
+            self._cancel_timer(channel)
+            channel.pending = None
+        if self._flush_tasks:
+            await asyncio.gather(*list(self._flush_tasks), return_exceptions=True)
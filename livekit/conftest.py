@@ -0,0 +1,2 @@
+# test_config.py is an interactive environment check (`python test_config.py`), not a test module
+collect_ignore = ["test_config.py", ".venv"]
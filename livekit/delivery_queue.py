@@ -0,0 +1,149 @@
+import os
+import asyncio
+import logging
+
+logger = logging.getLogger("transcription-agent")
+
+
+class TranscriptionDeliveryQueue:
+    """Groups transcription events for one meeting into batched backend requests.
+
+    Events are buffered until either `max_batch_size` events are waiting or the
+    oldest one has lingered for `max_linger` seconds. Finals flush immediately.
+    Only one request per meeting is in flight at a time, so events reach the
+    backend in the order they were produced.
+
+    If `spill` is given, batches the backend rejects and events that overflow
+    the backlog are handed to it (e.g. a durable spool) instead of being dropped.
+    """
+
+    def __init__(self, meeting_id, send_batch, max_batch_size=None, max_linger=None, max_pending=None, spill=None):
+        self.meeting_id = meeting_id
+        self._send_batch = send_batch
+        self._spill = spill
+        self.max_batch_size = max_batch_size or int(os.getenv("TRANSCRIPTION_BATCH_MAX_SIZE", "32"))
+        self.max_linger = max_linger if max_linger is not None else float(os.getenv("TRANSCRIPTION_BATCH_LINGER_MS", "50")) / 1000
+        self.max_pending = max_pending or int(os.getenv("TRANSCRIPTION_QUEUE_MAX_PENDING", "1000"))
+
+        self._pending = []
+        self._first_enqueued_at = None
+        self._flush_now = False
+        self._closed = False
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+        # Delivery statistics
+        self.events_enqueued = 0
+        self.events_dropped = 0
+        self.events_spilled = 0
+        self.batches_sent = 0
+        self.batches_failed = 0
+
+    def start(self):
+        """Start the background flush loop"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def __len__(self):
+        return len(self._pending)
+
+    def put(self, transcription_data):
+        """Queue a transcription event; never blocks the caller"""
+        if self._closed:
+            logger.warning(f"Delivery queue for meeting {self.meeting_id} is closed, dropping event")
+            return
+
+        if not self._pending:
+            self._first_enqueued_at = asyncio.get_running_loop().time()
+        self._pending.append(transcription_data)
+        self.events_enqueued += 1
+
+        if len(self._pending) > self.max_pending:
+            self._trim()
+
+        if transcription_data.get("type") == "final" or len(self._pending) >= self.max_batch_size:
+            self._flush_now = True
+        self._wakeup.set()
+
+    def _trim(self):
+        """Spill, or drop, the oldest events once the backlog is full"""
+        overflow = len(self._pending) - self.max_pending
+        if self._spill is not None:
+            spilled, self._pending = self._pending[:overflow], self._pending[overflow:]
+            self._spill_events(spilled)
+            return
+
+        # Without a spill target, drop the oldest interims first
+        kept = []
+        for item in self._pending:
+            if overflow > 0 and item.get("type") == "interim":
+                overflow -= 1
+                continue
+            kept.append(item)
+        if overflow > 0:
+            kept = kept[overflow:]
+        self.events_dropped += len(self._pending) - len(kept)
+        self._pending = kept
+        logger.warning(f"Delivery backlog full for meeting {self.meeting_id}, dropped {self.events_dropped} events so far")
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while not (self._closed and not self._pending):
+            if not self._pending:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            # Linger for more events unless a flush is already due
+            if not self._flush_now and not self._closed:
+                remaining = self._first_enqueued_at + self.max_linger - loop.time()
+                if remaining > 0:
+                    self._wakeup.clear()
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), timeout=remaining)
+                        continue
+                    except asyncio.TimeoutError:
+                        pass
+
+            batch = self._pending[:self.max_batch_size]
+            del self._pending[:len(batch)]
+            self._flush_now = (
+                len(self._pending) >= self.max_batch_size
+                or any(item.get("type") == "final" for item in self._pending)
+            )
+            if self._pending:
+                self._first_enqueued_at = loop.time()
+
+            try:
+                delivered = await self._send_batch(self.meeting_id, batch)
+            except Exception as e:
+                delivered = False
+                logger.error(f"[ERROR] Error delivering transcription batch for meeting {self.meeting_id}: {e!r}")
+            if delivered:
+                self.batches_sent += 1
+            else:
+                self.batches_failed += 1
+                self._spill_events(batch)
+
+    def _spill_events(self, events):
+        if self._spill is None or not events:
+            return
+        try:
+            self._spill(self.meeting_id, events)
+            self.events_spilled += len(events)
+        except Exception as e:
+            self.events_dropped += len(events)
+            logger.error(f"[ERROR] Failed to spill transcriptions for meeting {self.meeting_id}: {e!r}")
+
+    async def aclose(self, timeout=10.0):
+        """Flush whatever is still buffered and stop the flush loop"""
+        self._closed = True
+        self._wakeup.set()
+        if self._task is None:
+            return
+        try:
+            await asyncio.wait_for(self._task, timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Delivery queue for meeting {self.meeting_id} did not drain within timeout, "
+                           f"{len(self._pending)} events not delivered")
+            self._task.cancel()
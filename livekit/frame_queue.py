@@ -0,0 +1,193 @@
+import os
+import time
+import asyncio
+import logging
+
+import numpy as np
+
+logger = logging.getLogger("transcription-agent")
+
+DROP_OLDEST = "oldest"
+DROP_SILENCE = "silence"
+
+
+def frame_level_db(frame):
+    """RMS level of an int16 audio frame in dBFS"""
+    samples = np.frombuffer(frame.data, dtype=np.int16).astype(np.float32)
+    if samples.size == 0:
+        return -120.0
+    rms = np.sqrt(np.mean(samples * samples))
+    return float(20.0 * np.log10(max(rms, 1e-6) / 32768.0))
+
+
+def stt_backlog(stt_stream):
+    """Number of frames the STT stream has accepted but not yet sent upstream"""
+    # push_frame never blocks; the backlog lives in the stream's input channel
+    backlog = getattr(stt_stream, "backlog", None)
+    if backlog is not None:
+        return backlog()  # Wrapped streams (see stt_router.py)
+    input_ch = getattr(stt_stream, "_input_ch", None)
+    return input_ch.qsize() if input_ch is not None else 0
+
+
+def stt_drained(stt_stream):
+    """Future resolved when the STT stream next sends a frame upstream, or None if it cannot tell"""
+    drained = getattr(stt_stream, "drained", None)
+    if drained is not None:
+        return drained()  # Wrapped streams (see stt_router.py)
+    input_ch = getattr(stt_stream, "_input_ch", None)
+    waiters = getattr(input_ch, "_puts", None)
+    if waiters is None:
+        return None
+    waiter = asyncio.get_running_loop().create_future()
+    if input_ch.closed:
+        waiter.set_exception(ConnectionError("STT stream input is closed"))
+        return waiter
+    # The input channel is unbounded, so it has no blocked senders of its own:
+    # each receive wakes the first waiting "sender", which is this future
+    waiters.append(waiter)
+    waiter.add_done_callback(lambda _: waiter.cancelled() and waiter in waiters and waiters.remove(waiter))
+    return waiter
+
+
+class FrameQueue:
+    """Bounded ring buffer of audio frames between track ingest and the STT stream.
+
+    `put` never blocks. When the buffer is full a frame is dropped according to
+    the drop policy:
+
+    - "oldest": drop the oldest queued frame;
+    - "silence": drop the oldest queued silent frame, or the oldest frame if
+      every queued frame is speech.
+
+    `depth` and `oldest_age()` describe how far behind the consumer is.
+    `wait_for_stt()` holds the consumer while the STT stream is backed up.
+    """
+
+    def __init__(self, capacity=None, drop_policy=None, silence_threshold_db=None):
+        self.capacity = capacity or int(os.getenv("FRAME_QUEUE_MAX_FRAMES", "200"))
+        self.drop_policy = drop_policy or os.getenv("FRAME_QUEUE_DROP_POLICY", DROP_OLDEST)
+        if self.drop_policy not in (DROP_OLDEST, DROP_SILENCE):
+            logger.warning(f"Unknown frame queue drop policy {self.drop_policy!r}, using {DROP_OLDEST!r}")
+            self.drop_policy = DROP_OLDEST
+        self.silence_threshold_db = silence_threshold_db if silence_threshold_db is not None \
+            else float(os.getenv("VAD_THRESHOLD_DB", "-50"))
+
+        self._frames = [None] * self.capacity
+        self._enqueued_at = [0.0] * self.capacity
+        self._speech = [True] * self.capacity
+        self._head = 0
+        self._size = 0
+        self._closed = False
+        self._not_empty = asyncio.Event()
+        self._activity = asyncio.Event()
+
+        # Queue statistics
+        self.frames_in = 0
+        self.frames_dropped = 0
+        self.max_depth = 0
+
+    @property
+    def depth(self):
+        return self._size
+
+    def oldest_age(self):
+        """Seconds the oldest queued frame has been waiting"""
+        if self._size == 0:
+            return 0.0
+        return time.monotonic() - self._enqueued_at[self._head]
+
+    def stats(self):
+        return {
+            "depth": self._size,
+            "oldest_age": self.oldest_age(),
+            "frames_in": self.frames_in,
+            "frames_dropped": self.frames_dropped,
+            "max_depth": self.max_depth,
+        }
+
+    def put(self, frame, is_speech=None):
+        """Queue a frame, dropping one per the drop policy if the buffer is full"""
+        if self._closed:
+            return
+        if self.drop_policy == DROP_SILENCE and is_speech is None:
+            is_speech = frame_level_db(frame) >= self.silence_threshold_db
+
+        self.frames_in += 1
+        if self._size == self.capacity:
+            self._drop_one()
+
+        index = (self._head + self._size) % self.capacity
+        self._frames[index] = frame
+        self._enqueued_at[index] = time.monotonic()
+        self._speech[index] = True if is_speech is None else bool(is_speech)
+        self._size += 1
+        self.max_depth = max(self.max_depth, self._size)
+        self._not_empty.set()
+        self._activity.set()
+
+    def _drop_one(self):
+        victim = 0
+        if self.drop_policy == DROP_SILENCE:
+            for offset in range(self._size):
+                if not self._speech[(self._head + offset) % self.capacity]:
+                    victim = offset
+                    break
+
+        # Shift the frames in front of the victim one slot towards the tail
+        for offset in range(victim, 0, -1):
+            dst = (self._head + offset) % self.capacity
+            src = (self._head + offset - 1) % self.capacity
+            self._frames[dst] = self._frames[src]
+            self._enqueued_at[dst] = self._enqueued_at[src]
+            self._speech[dst] = self._speech[src]
+        self._frames[self._head] = None
+        self._head = (self._head + 1) % self.capacity
+        self._size -= 1
+
+        self.frames_dropped += 1
+        if self.frames_dropped == 1 or self.frames_dropped % 100 == 0:
+            logger.warning(f"STT is falling behind, dropped {self.frames_dropped} audio frames "
+                           f"(queue depth {self._size}, oldest {self.oldest_age():.2f}s)")
+
+    async def get(self):
+        """Return the next frame, or None once the queue is closed and empty"""
+        while self._size == 0:
+            if self._closed:
+                return None
+            self._not_empty.clear()
+            await self._not_empty.wait()
+
+        frame = self._frames[self._head]
+        self._frames[self._head] = None
+        self._head = (self._head + 1) % self.capacity
+        self._size -= 1
+        return frame
+
+    async def wait_for_stt(self, stt_stream, max_backlog, current=None):
+        """Wait until `stt_stream` has at most `max_backlog` unsent frames.
+
+        Instead of polling, this wakes when the stream sends a frame upstream,
+        when a frame is queued and when the queue is closed. It also returns
+        once the queue or the stream's input is closed, or `current()` is
+        false, e.g. after a failover replaced the stream.
+        """
+        while not self._closed and (current is None or current()) and stt_backlog(stt_stream) > max_backlog:
+            self._activity.clear()
+            wakeups = [asyncio.ensure_future(self._activity.wait())]
+            drained = stt_drained(stt_stream)
+            if drained is not None:
+                wakeups.append(drained)
+            try:
+                done, _ = await asyncio.wait(wakeups, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                for wakeup in wakeups:
+                    wakeup.cancel()
+            if any(not wakeup.cancelled() and wakeup.exception() is not None for wakeup in done):
+                return  # The stream's input was closed; it will not drain any more
+
+    def close(self):
+        """Stop accepting frames; `get` drains what is left and then returns None"""
+        self._closed = True
+        self._not_empty.set()
+        self._activity.set()
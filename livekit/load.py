@@ -0,0 +1,189 @@
+import os
+import json
+import time
+import logging
+import threading
+
+import psutil
+
+logger = logging.getLogger("transcription-agent")
+
+
+# Set by WorkerLoad in the worker's main process; job processes inherit it
+WORKER_DIR_ENV = "LOAD_STATE_WORKER_DIR"
+
+
+def _base_dir(directory=None):
+    return os.path.abspath(directory or os.getenv("LOAD_STATE_DIR", "load_state"))
+
+
+def _state_dir(directory=None):
+    """State directory of the current worker: `<LOAD_STATE_DIR>/worker-<pid of the worker>`"""
+    if directory:
+        return os.path.abspath(directory)
+    return os.environ.get(WORKER_DIR_ENV) or _base_dir()
+
+
+def _is_state_file(name):
+    # `<pid>.json`, or a temporary file `_write` left behind
+    return name.endswith(".json") or (".json." in name and name.endswith(".tmp"))
+
+
+class ProcessLoad:
+    """Publishes the load of one job process for the worker's load function.
+
+    Jobs run in child processes (or, in high-density mode, in threads with
+    their own event loops) but the worker computes its load in the main
+    process. `loop_lag()` returns the worst recent lag of the process's event
+    loops, as measured by its watchdog (see watchdog.py); a writer thread
+    periodically stores the process's active audio streams and worst loop lag
+    in `<pid>.json` in its worker's state directory. The directory is resolved
+    when the first job starts, after the worker has set it up.
+    """
+
+    def __init__(self, loop_lag, directory=None, interval=None):
+        self._loop_lag = loop_lag
+        self._directory = directory
+        self.directory = None
+        self.path = None
+        self.interval = interval or float(os.getenv("LOAD_SAMPLE_INTERVAL_SECONDS", "0.5"))
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._writer = None
+
+    @property
+    def streams(self):
+        with self._lock:
+            return sum(len(job["tasks"]) for job in self._jobs.values())
+
+    @property
+    def loop_lag(self):
+        return self._loop_lag()
+
+    def job_started(self, transcription_tasks):
+        """Count the transcription tasks of a new job until `job_finished`"""
+        job = {"tasks": transcription_tasks}
+        with self._lock:
+            self._jobs[id(transcription_tasks)] = job
+            if self._writer is None:
+                self.directory = _state_dir(self._directory)
+                self.path = os.path.join(self.directory, f"{os.getpid()}.json")
+                self._writer = threading.Thread(target=self._write_loop, name="load-state-writer", daemon=True)
+                self._writer.start()
+
+    def job_finished(self, transcription_tasks):
+        with self._lock:
+            self._jobs.pop(id(transcription_tasks), None)
+        self._write()
+
+    def _write_loop(self):
+        while True:
+            self._write()
+            time.sleep(self.interval)
+
+    def _write(self):
+        if self.path is None:
+            return
+        with self._lock:
+            jobs = len(self._jobs)
+        state = {"streams": self.streams, "loop_lag": self.loop_lag, "jobs": jobs, "updated": time.time()}
+        tmp_path = f"{self.path}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(state, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.error(f"[ERROR] Failed to write load state {self.path}: {e}")
+
+
+class WorkerLoad:
+    """Load function for WorkerOptions: a 0..1 score from the busiest resource.
+
+    The score is the maximum of active audio streams, event-loop lag (worst job
+    process), CPU and memory, each relative to its configured limit. Once it
+    reaches LOAD_THRESHOLD the worker is reported as full and LiveKit stops
+    dispatching new rooms to it.
+    """
+
+    def __init__(self, directory=None):
+        self.threshold = float(os.getenv("LOAD_THRESHOLD", "0.75"))
+        self.max_streams = int(os.getenv("LOAD_MAX_STREAMS", "50"))
+        self.max_loop_lag = float(os.getenv("LOAD_MAX_LOOP_LAG_MS", "100")) / 1000.0
+        self.max_memory_percent = float(os.getenv("LOAD_MAX_MEMORY_PERCENT", "90"))
+        self.stale_after = float(os.getenv("LOAD_STATE_STALE_SECONDS", "10"))
+
+        self._cpu_samples = []
+        self._overloaded = False
+        self.components = {}
+
+        # Each worker has its own directory, so workers sharing LOAD_STATE_DIR on one host
+        # don't count each other's streams; its job processes find it through the environment
+        self.base_directory = _base_dir(directory)
+        self.directory = os.path.join(self.base_directory, f"worker-{os.getpid()}")
+        os.environ[WORKER_DIR_ENV] = self.directory
+        os.makedirs(self.directory, exist_ok=True)
+        # State files of a previous worker with this pid, and directories of dead workers, are meaningless
+        self._clear(self.directory)
+        for name in os.listdir(self.base_directory):
+            pid = name[len("worker-"):]
+            if name.startswith("worker-") and pid.isdigit() and not psutil.pid_exists(int(pid)):
+                self._clear(os.path.join(self.base_directory, name), remove=True)
+        psutil.cpu_percent(None)
+
+    @staticmethod
+    def _clear(directory, remove=False):
+        """Delete the load state files in `directory` (nothing else), and the directory if `remove`"""
+        try:
+            for name in os.listdir(directory):
+                if _is_state_file(name):
+                    os.remove(os.path.join(directory, name))
+            if remove:
+                os.rmdir(directory)
+        except OSError:
+            pass
+
+    def _read_states(self):
+        states = []
+        now = time.time()
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                pid = int(name[:-len(".json")])
+                if not psutil.pid_exists(pid):
+                    os.remove(path)
+                    continue
+                with open(path, "r", encoding="utf-8") as f:
+                    state = json.load(f)
+            except (ValueError, OSError):
+                continue
+            if now - state.get("updated", 0) <= self.stale_after:
+                states.append(state)
+        return states
+
+    def get_load(self, worker=None):
+        """Current load score; called by the worker from its executor"""
+        states = self._read_states()
+        self._cpu_samples = (self._cpu_samples + [psutil.cpu_percent(None)])[-5:]
+
+        self.components = {
+            "streams": sum(s.get("streams", 0) for s in states) / self.max_streams if self.max_streams else 0.0,
+            "loop_lag": max((s.get("loop_lag", 0.0) for s in states), default=0.0) / self.max_loop_lag,
+            "cpu": sum(self._cpu_samples) / len(self._cpu_samples) / 100.0,
+            "memory": psutil.virtual_memory().percent / self.max_memory_percent,
+        }
+        load = min(1.0, max(self.components.values()))
+
+        overloaded = load >= self.threshold
+        if overloaded != self._overloaded:
+            self._overloaded = overloaded
+            details = ", ".join(f"{name} {value:.2f}" for name, value in self.components.items())
+            if overloaded:
+                logger.warning(f"Worker load {load:.2f} reached threshold {self.threshold}, "
+                               f"not accepting new rooms ({details})")
+            else:
+                logger.info(f"Worker load {load:.2f} below threshold {self.threshold}, "
+                            f"accepting new rooms ({details})")
+        return load
@@ -0,0 +1,150 @@
+import io
+import os
+import sys
+import json
+import time
+import queue
+import atexit
+import logging
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+# Structured fields attached to records with `extra=` or `logging.LoggerAdapter`
+CONTEXT_FIELDS = ("meeting_id", "participant", "track")
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, with the room/participant/track context when present"""
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for field in CONTEXT_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class SizeAndTimeRotatingFileHandler(RotatingFileHandler):
+    """Rotates when the file reaches `maxBytes` or, if `interval` is set, once it is that many seconds old"""
+
+    def __init__(self, filename, interval=0, **kwargs):
+        super().__init__(filename, **kwargs)
+        self.interval = interval
+        self._opened_at = time.time()
+
+    def shouldRollover(self, record):
+        if self.interval and time.time() - self._opened_at >= self.interval:
+            return True
+        return super().shouldRollover(record)
+
+    def doRollover(self):
+        super().doRollover()
+        self._opened_at = time.time()
+
+
+class DroppingQueueHandler(QueueHandler):
+    """Hands records to the listener thread; when its queue is full records are dropped, never waited for"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class SampledLog:
+    """Per-room rate limit for high-volume log lines such as interim transcripts.
+
+    `allow()` is checked before the message is built, so suppressed lines cost
+    nothing. The next line that is let through reports how many were skipped.
+    """
+
+    def __init__(self, rate=None):
+        self.rate = rate if rate is not None else float(os.getenv("LOG_INTERIM_MAX_RATE", "1"))
+        self._tokens = 1.0
+        self._updated = time.monotonic()
+        self.suppressed = 0
+
+    def allow(self):
+        if self.rate <= 0:
+            return True
+        now = time.monotonic()
+        self._tokens = min(1.0, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        if self._tokens < 1.0:
+            self.suppressed += 1
+            return False
+        self._tokens -= 1.0
+        return True
+
+    def take_suppressed(self):
+        """Number of lines skipped since the last one that was logged"""
+        suppressed, self.suppressed = self.suppressed, 0
+        return suppressed
+
+
+_listener = None
+
+
+def configure_logging():
+    """Set up the agent's console and rotating file logging.
+
+    With LOG_ASYNC (the default) handlers run on a background thread behind a
+    bounded queue, so the event loop never waits for console or disk I/O.
+    """
+    global _listener
+
+    # Nothing to do if the host process (e.g. a LiveKit job process) already configured logging
+    if logging.getLogger().handlers:
+        return
+
+    formatter = (JsonFormatter() if os.getenv("LOG_FORMAT", "text").lower() == "json"
+                 else logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+
+    # UTF-8 encoded stdout wrapper for Windows compatibility
+    utf8_stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+    handlers = [logging.StreamHandler(utf8_stdout)]
+
+    log_file = os.getenv("LOG_FILE", "livekit_agent.log")
+    if log_file:
+        handlers.append(SizeAndTimeRotatingFileHandler(
+            log_file,
+            interval=float(os.getenv("LOG_ROTATE_HOURS", "24")) * 3600,
+            maxBytes=int(float(os.getenv("LOG_MAX_MB", "50")) * 2**20),
+            backupCount=int(os.getenv("LOG_BACKUP_COUNT", "5")),
+            encoding='utf-8',
+            delay=True,
+        ))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    if os.getenv("LOG_ASYNC", "true").lower() in ("1", "true", "yes"):
+        log_queue = queue.Queue(maxsize=int(os.getenv("LOG_QUEUE_SIZE", "10000")))
+        _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+        _listener.start()
+        atexit.register(stop_logging)
+        queue_handler = DroppingQueueHandler(log_queue)
+        # Only merges the message arguments; the listener's handlers do the real formatting
+        queue_handler.setFormatter(logging.Formatter("%(message)s"))
+        handlers = [queue_handler]
+
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper(), handlers=handlers)
+
+
+def stop_logging():
+    """Flush queued records and stop the background logging thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -1,133 +1,551 @@
 import os
 import logging
-import signal
 import sys
+import gzip
 import json
 import time
-import requests
+import threading
+import aiohttp
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# Must be imported before livekit, which imports prometheus_client
+import metrics
+
 import asyncio
 from livekit import agents, rtc
 from livekit.agents import AutoSubscribe
 from livekit.agents import stt as lk_stt
-from livekit.plugins import deepgram  # plugin import
-
-# Enhanced logger configuration with UTF-8 encoding
-import io
-import codecs
-
-# Create UTF-8 encoded stdout wrapper for Windows compatibility
-utf8_stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
-
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(utf8_stdout),
-        logging.FileHandler('livekit_agent.log', encoding='utf-8')
-    ]
-)
-logger = logging.getLogger("transcription-agent")
 
-# Global variables for graceful shutdown
-shutdown_event = asyncio.Event()
-active_tasks = set()
+from coalescer import InterimCoalescer, TranscriptSegments
+from delivery_queue import TranscriptionDeliveryQueue
+from spool import DeliverySpool
+import stt_router
+from stt_router import STTRouter
+from stt_session import TrackSTTSession
+from vad import SpeechGate, vad_enabled
+from frame_queue import FrameQueue
+from load import ProcessLoad, WorkerLoad
+from prewarm import PrewarmedResolver, prewarm
+from wire_format import CompactEncoder, compact_enabled, split_recipients
+from caption_delivery import CaptionDeliveryPolicy
+from transcript_buffer import MeetingTranscript, bulk_only
+from log_config import SampledLog, configure_logging
+from watchdog import LoopWatchdog
+import tracing
+from backend_stream import BackendStream, stream_enabled, stream_url
+
+# Console and rotating file logging, written from a background thread
+configure_logging()
+logger = logging.getLogger("transcription-agent")
 
 class WebhookService:
     def __init__(self):
         self.backend_url = os.getenv("BACKEND_URL", "http://localhost:8978")
         self.api_key = os.getenv("LIVEKIT_WEBHOOK_API_KEY", "your-webhook-api-key")
+        
+        # Connection pool settings (shared by every job in this worker process)
+        self.max_connections = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "100"))
+        self.max_connections_per_host = int(os.getenv("WEBHOOK_MAX_CONNECTIONS_PER_HOST", "10"))
+        self.keepalive_timeout = float(os.getenv("WEBHOOK_KEEPALIVE_SECONDS", "30"))
+        self.timeout = aiohttp.ClientTimeout(
+            total=float(os.getenv("WEBHOOK_TIMEOUT_SECONDS", "5")),
+            connect=float(os.getenv("WEBHOOK_CONNECT_TIMEOUT_SECONDS", "2")),
+        )
+        self._session = None
+        # Optional persistent websocket to the backend; HTTP is used while it is down
+        self.stream = BackendStream(stream_url(self.backend_url), self.api_key, self._get_session) \
+            if stream_enabled() else None
+    
+    def _get_session(self):
+        """Return the pooled keep-alive HTTP session, creating it on first use"""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.max_connections,
+                limit_per_host=self.max_connections_per_host,
+                keepalive_timeout=self.keepalive_timeout,
+                ttl_dns_cache=300,
+                resolver=PrewarmedResolver(),
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=self.timeout,
+                headers={
+                    "Content-Type": "application/json",
+                    "X-API-Key": self.api_key
+                },
+            )
+        return self._session
+    
+    async def _post(self, path, payload, endpoint, compress=False):
+        """POST JSON (optionally gzip-encoded) to the backend and return the response status code"""
+        session = self._get_session()
+        started = time.perf_counter()
+        if compress:
+            request = session.post(f"{self.backend_url}{path}",
+                                   data=gzip.compress(json.dumps(payload).encode("utf-8")),
+                                   headers={"Content-Encoding": "gzip"})
+        else:
+            request = session.post(f"{self.backend_url}{path}", json=payload)
+        try:
+            async with request as response:
+                # Drain the body so the connection goes back to the pool
+                await response.read()
+        except Exception:
+            metrics.WEBHOOK_ERRORS.labels(endpoint).inc()
+            raise
+        finally:
+            metrics.WEBHOOK_LATENCY.labels(endpoint).observe(time.perf_counter() - started)
+        if response.status != 200:
+            metrics.WEBHOOK_ERRORS.labels(endpoint).inc()
+        return response.status
+    
+    async def _send(self, path, payload, endpoint, message_type):
+        """Send a message over the backend stream when it is connected, otherwise POST it"""
+        if self.stream is not None:
+            status = await self.stream.request(message_type, payload, endpoint)
+            if status is not None:
+                return status
+        return await self._post(path, payload, endpoint)
     
-    async def send_transcription(self, meeting_id, transcription_data):
-        """Send transcription data to backend"""
+    async def send_transcription_batch(self, meeting_id, transcription_batch):
+        """Send a batch of transcription events to backend in one request"""
+        return await self.post_transcription_batch(meeting_id, transcription_batch) == 200
+    
+    async def post_transcription_batch(self, meeting_id, transcription_batch):
+        """Send a batch of transcription events; returns the backend's status, or None if it was not reached"""
         try:
-            url = f"{self.backend_url}/api/v1/transcription/livekit"
-            headers = {
-                "Content-Type": "application/json",
-                "X-API-Key": self.api_key
+            payload = {
+                "meeting_id": meeting_id,
+                "transcription_data": transcription_batch
             }
             
+            status = await self._send("/api/v1/transcription/livekit", payload, "transcription", "transcription")
+            
+            if status == 200:
+                logger.info(f"[SUCCESS] {len(transcription_batch)} transcriptions sent to backend for meeting {meeting_id}")
+            else:
+                logger.error(f"[ERROR] Backend rejected transcription batch: {status}")
+            return status
+                
+        except Exception as e:
+            logger.error(f"[ERROR] Error sending transcription batch to backend: {e!r}")
+            return None
+    
+    async def send_transcript_bulk(self, meeting_id, segments):
+        """Upload a meeting's complete transcript of finals in one request"""
+        try:
             payload = {
                 "meeting_id": meeting_id,
-                "transcription_data": transcription_data
+                "segments": segments
             }
             
-            response = requests.post(url, json=payload, headers=headers, timeout=5)
+            status = await self._post("/api/v1/transcription/livekit/bulk", payload, "bulk", compress=True)
             
-            if response.status_code == 200:
-                logger.info(f"[SUCCESS] Transcription sent to backend for meeting {meeting_id}")
+            if status == 200:
+                logger.info(f"[SUCCESS] Transcript of {len(segments)} segments uploaded for meeting {meeting_id}")
                 return True
             else:
-                logger.error(f"[ERROR] Backend rejected transcription: {response.status_code}")
+                logger.error(f"[ERROR] Backend rejected transcript upload: {status}")
                 return False
                 
         except Exception as e:
-            logger.error(f"[ERROR] Error sending transcription to backend: {e}")
+            logger.error(f"[ERROR] Error uploading transcript to backend: {e!r}")
             return False
     
+    async def warm_up(self):
+        """Open a pooled connection to the backend before the first transcription needs it"""
+        try:
+            session = self._get_session()
+            async with session.get(f"{self.backend_url}/") as response:
+                await response.read()
+        except Exception as e:
+            logger.warning(f"Could not pre-connect to backend: {e!r}")
+    
     async def notify_meeting_started(self, meeting_id):
         """Notify backend that meeting has started"""
         try:
-            url = f"{self.backend_url}/api/v1/transcription/start/{meeting_id}"
-            headers = {
-                "Content-Type": "application/json",
-                "X-API-Key": self.api_key
-            }
-            
-            response = requests.post(url, json={}, headers=headers, timeout=5)
+            status = await self._send(f"/api/v1/transcription/start/{meeting_id}", {"meeting_id": meeting_id},
+                                      "start", "start")
             
-            if response.status_code == 200:
+            if status == 200:
                 logger.info(f"[SUCCESS] Meeting start notification sent for meeting {meeting_id}")
                 return True
             else:
-                logger.error(f"[ERROR] Backend rejected meeting start notification: {response.status_code}")
+                logger.error(f"[ERROR] Backend rejected meeting start notification: {status}")
                 return False
                 
         except Exception as e:
-            logger.error(f"[ERROR] Error sending meeting start notification: {e}")
+            logger.error(f"[ERROR] Error sending meeting start notification: {e!r}")
             return False
+    
+    def start_stream(self):
+        """Connect the backend stream in the background, if enabled"""
+        if self.stream is not None:
+            self.stream.start()
+    
+    async def aclose(self):
+        """Close the backend stream and the pooled HTTP session"""
+        if self.stream is not None:
+            await self.stream.aclose()
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+class ProcessServices:
+    """Clients shared by every job of this process, on an event loop of their own.
+
+    By default each job has its own process. In high-density mode jobs run as
+    threads of one process, each thread with its own event loop. aiohttp
+    sessions and asyncio primitives cannot cross loops, so the backend client
+    (HTTP session and backend stream) and the delivery spool run on a service
+    thread, and jobs hand work to them with `call` and `submit`. They start
+    with the process's first job and close when its last job ends. STT
+    streams are read on the job's own loop, so each job has its own STT router.
+    """
+
+    def __init__(self):
+        self.webhook_service = WebhookService()
+        # Durable spool for deliveries the backend could not take, replayed in the background
+        self.delivery_spool = DeliverySpool(self.webhook_service.post_transcription_batch)
+        self.jobs = 0
+        self._warm_up = None
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run, name="shared-services", daemon=True)
+        self._thread.start()
+        self.submit(self._start)
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def _start(self):
+        # Replay deliveries spooled by this or a previous worker
+        self.delivery_spool.start()
+        self.webhook_service.start_stream()
+        watchdog.start()
+        # Open a pooled backend connection before the first transcription needs it
+        self._warm_up = self.loop.create_task(self.webhook_service.warm_up())
+
+    def submit(self, callback, *args):
+        """Run `callback(*args)` on the service loop without waiting for it"""
+        self.loop.call_soon_threadsafe(callback, *args)
+
+    async def call(self, coro):
+        """Run a coroutine on the service loop and return its result to the calling loop"""
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, self.loop))
+
+    async def _close(self):
+        self._warm_up.cancel()
+        await asyncio.gather(self._warm_up, return_exceptions=True)
+        await watchdog.stop()
+        await self.delivery_spool.aclose()
+        await self.webhook_service.aclose()
+
+    async def aclose(self):
+        await self.call(self._close())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        await asyncio.to_thread(self._thread.join)
+        self.loop.close()
+
+# Reports stalls of every event loop in this process with the stack that caused them
+watchdog = LoopWatchdog()
+
+# Shared services of this process, while it runs jobs
+_services = None
+_services_lock = threading.Lock()
+
+def acquire_services():
+    """Return this process's shared services, starting them for its first job"""
+    global _services
+    with _services_lock:
+        if _services is None:
+            _services = ProcessServices()
+        _services.jobs += 1
+        return _services
+
+async def release_services(services):
+    """Release a job's hold on the shared services, closing them after the process's last job"""
+    global _services
+    with _services_lock:
+        services.jobs -= 1
+        if services.jobs > 0:
+            return
+        if _services is services:
+            _services = None
+    await services.aclose()
+
+class JobState:
+    """State owned by one room's job: shutdown signal, tasks, delivery queue and transcript"""
+
+    def __init__(self, room):
+        self.room = room
+        self.meeting_id = room.name.replace("meeting-", "") if room.name.startswith("meeting-") else room.name
+        self.services = acquire_services()
+        # STT clients with pre-opened streams for newly subscribed tracks,
+        # routed to the fastest healthy provider option
+        self.stt_router = STTRouter()
+        self.shutdown_event = asyncio.Event()
+        self.active_tasks = set()
+        self.transcription_tasks = set()
+        self.delivery_queue = None
+        self.dispatched_at = time.monotonic()
+        self.first_caption_at = None
+        # Channel and recipients of room captions (see caption_delivery.py)
+        self.caption_policy = CaptionDeliveryPolicy()
+        # Opt-in binary encoding of room captions (see wire_format.py)
+        self.compact_encoder = CompactEncoder(lossy_interims=self.caption_policy.interims_lossy) \
+            if compact_enabled() else None
+        # Rate limit for the room's interim transcript log lines
+        self.interim_log = SampledLog()
+        # Transcription task (with its participant) and STT session of every subscribed track
+        self.track_tasks = {}
+        self.stt_sessions = {}
+        # Finals of the meeting, checkpointed to disk and uploaded in one request at the end
+        self.transcript = MeetingTranscript(self.meeting_id)
+        self.bulk_only = bulk_only()
+        # Open backend.delivery spans by id() of the queued payload (only while tracing)
+        self._delivery_spans = {}
+
+    def track_task(self, task):
+        """Keep a background task in `active_tasks` until it finishes"""
+        self.active_tasks.add(task)
+        task.add_done_callback(self.active_tasks.discard)
+        return task
+
+    def _publish(self, data, payload, destination_identities):
+        reliable = self.caption_policy.reliable(payload, len(data))
+        metrics.PUBLISH_MESSAGES.labels("reliable" if reliable else "lossy").inc()
+        return self.room.local_participant.publish_data(
+            data, reliable=reliable, destination_identities=destination_identities, topic="lk.transcription")
+
+    async def publish_transcript(self, payload):
+        """Publish a transcript on lk.transcription; compact-encoded for participants that opted in.
+
+        Returns False when no participant opted in to captions.
+        """
+        recipients = self.caption_policy.recipients(self.room)
+        if recipients == []:
+            metrics.PUBLISH_SKIPPED.inc()
+            return False
+        data = json.dumps(payload).encode("utf-8")
+        if self.compact_encoder is None:
+            await self._publish(data, payload, recipients or [])
+            metrics.PUBLISH_BYTES.labels("json").inc(len(data))
+            return True
+
+        # Every payload goes through the encoder so per-track delta state stays in step
+        packet = self.compact_encoder.encode(payload)
+        compact, legacy = split_recipients(self.room, recipients)
+        # An empty destination list means everyone, so lists are only passed when narrowing
+        narrowed = recipients is not None
+        sends = []
+        if compact:
+            sends.append(self._publish(packet, payload, compact if legacy or narrowed else []))
+            metrics.PUBLISH_BYTES.labels("compact").inc(len(packet))
+        if legacy or not compact:
+            sends.append(self._publish(data, payload, legacy if compact or narrowed else []))
+            metrics.PUBLISH_BYTES.labels("json").inc(len(data))
+        await asyncio.gather(*sends)
+        return True
+
+    def add_track_task(self, participant, track, task):
+        """Register a track's transcription task until it finishes"""
+        self.transcription_tasks.add(task)
+        self.track_tasks[track.sid] = (participant.identity, task)
+        def discard(done):
+            self.transcription_tasks.discard(done)
+            if self.track_tasks.get(track.sid, (None, None))[1] is done:
+                del self.track_tasks[track.sid]
+        task.add_done_callback(discard)
+
+    def stop_tracks(self, track_sid=None, identity=None):
+        """Tear down the transcription of one track, or of every track of a participant"""
+        stopped = 0
+        for sid, (owner, task) in list(self.track_tasks.items()):
+            if sid == track_sid or (identity is not None and owner == identity):
+                if not task.done():
+                    task.cancel()
+                    stopped += 1
+        return stopped
+
+    def set_track_muted(self, track_sid, muted):
+        """Suspend or resume the STT stream of a muted or unmuted track"""
+        session = self.stt_sessions.get(track_sid)
+        if session is not None and session.muted != muted:
+            session.set_muted(muted)
+            return True
+        return False
+
+    def span_attributes(self, payload):
+        """Tracing attributes of one transcript event"""
+        return {
+            "meeting_id": self.meeting_id,
+            "participant": payload["participant"],
+            "track": payload["trackSid"],
+            "segment": payload.get("segmentId"),
+            "seq": payload.get("seq"),
+            "type": payload["type"],
+        }
+
+    def caption_published(self):
+        """Record dispatch-to-first-caption latency once per job"""
+        if self.first_caption_at is None:
+            self.first_caption_at = time.monotonic()
+            latency = self.first_caption_at - self.dispatched_at
+            metrics.DISPATCH_TO_FIRST_CAPTION.observe(latency)
+            logger.info(f"First caption in room {self.room.name} {latency:.2f}s after dispatch")
+
+    def deliver_transcription(self, payload):
+        """Queue a transcription for batched delivery without holding up the STT event loop"""
+        if payload["type"] == "final":
+            self.transcript.add(payload)
+        if self.bulk_only:
+            return
+        if self.delivery_queue is None:
+            self.delivery_queue = TranscriptionDeliveryQueue(
+                self.meeting_id,
+                self._send_batch,
+                spill=self._spill_batch,
+            )
+            self.delivery_queue.start()
+        delivery_span = tracing.start_span("backend.delivery", **self.span_attributes(payload))
+        if delivery_span is not None:
+            self._delivery_spans[id(payload)] = delivery_span
+        self.delivery_queue.put(payload)
+
+    def _end_delivery_spans(self, batch, outcome):
+        if not self._delivery_spans:
+            return
+        for payload in batch:
+            tracing.end_span(self._delivery_spans.pop(id(payload), None), outcome=outcome, batch_size=len(batch),
+                             error=None if outcome == "delivered" else outcome)
+
+    async def _send_batch(self, meeting_id, batch):
+        delivered = await self.services.call(self.services.webhook_service.send_transcription_batch(meeting_id, batch))
+        self._end_delivery_spans(batch, "delivered" if delivered else "rejected")
+        return delivered
 
-# Initialize webhook service
-webhook_service = WebhookService()
+    def _spill_batch(self, meeting_id, batch):
+        self._end_delivery_spans(batch, "spooled")
+        self.services.submit(self.services.delivery_spool.append, meeting_id, batch)
 
-async def transcribe_and_forward(participant: rtc.RemoteParticipant, track: rtc.Track, room: rtc.Room):
+    async def aclose(self, timeout=10.0):
+        """Flush buffered backend deliveries, upload the meeting's transcript if the backend may lack some of it,
+        and release the job's STT router and shared services"""
+        # Every final reached the backend live unless a batch failed, was spooled or was dropped
+        complete = not self.bulk_only and not self.transcript.resumed
+        if self.delivery_queue is not None:
+            queue = self.delivery_queue
+            await queue.aclose(timeout=timeout)
+            complete = complete and not (queue.batches_failed or queue.events_dropped or queue.events_spilled
+                                         or len(queue))
+            self.delivery_queue = None
+        # Events dropped from a full queue were never sent
+        for delivery_span in self._delivery_spans.values():
+            tracing.end_span(delivery_span, outcome="dropped", error="dropped")
+        self._delivery_spans.clear()
+        if complete:
+            await self.transcript.discard()
+        else:
+            await self.transcript.upload(self._send_transcript_bulk)
+        await self.stt_router.aclose()
+        await release_services(self.services)
+
+    async def _send_transcript_bulk(self, meeting_id, segments):
+        return await self.services.call(self.services.webhook_service.send_transcript_bulk(meeting_id, segments))
+
+# Active streams and event-loop lag of this process, read by the worker's load function
+process_load = ProcessLoad(lambda: watchdog.loop_lag)
+
+async def transcribe_and_forward(participant: rtc.RemoteParticipant, track: rtc.Track, job: JobState):
     """Handle transcription for a participant's audio track with enhanced error handling"""
+    room = job.room
+    shutdown_event = job.shutdown_event
+    log = logging.LoggerAdapter(logger, {"meeting_id": job.meeting_id, "participant": participant.identity,
+                                         "track": track.sid})
     audio_stream = None
-    stt_stream = None
-    forward_task = None
+    stt_session = None
+    coalescer = None
+    pump_task = None
+    metrics_task = None
+    track_metrics = None
+    
+    # Root span of this track's pipeline; tasks created below inherit it as their parent
+    track_span = tracing.start_span("transcribe_and_forward", meeting_id=job.meeting_id,
+                                    participant=participant.identity, track=track.sid)
+    span_token = tracing.activate(track_span)
     
     try:
-        logger.info(f"Starting transcription for participant: {participant.identity}")
+        log.info(f"Starting transcription for participant: {participant.identity}")
         
-        # Validate Deepgram API key
-        if not os.getenv("DEEPGRAM_API_KEY"):
-            logger.error("DEEPGRAM_API_KEY not found in environment variables")
+        # Validate STT API keys
+        missing = job.stt_router.missing_credentials()
+        if missing:
+            log.error(f"{', '.join(missing)} not found in environment variables")
             return
             
-        # stream audio frames from this track
-        audio_stream = rtc.AudioStream.from_track(track=track)
-        
-        # Deepgram STT with error handling
-        try:
-            stt = deepgram.STT(model="nova-2")
-            stt_stream = stt.stream()
-        except Exception as e:
-            logger.error(f"Failed to initialize Deepgram STT: {e}")
-            return
+        # Stream audio frames from this track, converted by the SDK (in native code) to mono
+        # at the STT sample rate in AUDIO_CHUNK_MS frames, so the STT stream has nothing to resample
+        audio_stream = rtc.AudioStream.from_track(
+            track=track,
+            sample_rate=int(os.getenv("AUDIO_TARGET_SAMPLE_RATE", "16000")),
+            num_channels=1,
+            frame_size_ms=int(os.getenv("AUDIO_CHUNK_MS", "50")),
+        )
+
+        async def publish_to_room(payload):
+            """Publish a transcript to the LiveKit room"""
+            started = time.perf_counter()
+            with tracing.span("room.publish", **job.span_attributes(payload)):
+                try:
+                    published = await job.publish_transcript(payload)
+                except Exception:
+                    metrics.PUBLISH_ERRORS.inc()
+                    raise
+                finally:
+                    metrics.PUBLISH_LATENCY.observe(time.perf_counter() - started)
+            if published:
+                job.caption_published()
 
-        async def forward_transcriptions():
+        async def send_to_backend(payload):
+            """Send a transcript to the backend for collection"""
+            job.deliver_transcription(payload)
+
+        # Drops unchanged interims and rate-limits them per channel
+        coalescer = InterimCoalescer(publish_to_room, send_to_backend)
+
+        # Maps STT audio timestamps back to push times for latency metrics
+        # STT stream time restarts with every stream the session opens
+        push_clocks = {}
+
+        # One segment ID per utterance, from its first interim through its final;
+        # `seq` orders the updates so downstream can replace a segment in place
+        segments = TranscriptSegments(f"{participant.identity}_{int(time.time()*1000)}")
+
+        async def forward_transcriptions(stt_stream):
+            push_clock = push_clocks.setdefault(stt_stream, metrics.PushClock())
             try:
                 async for event in stt_stream:
                     if shutdown_event.is_set():
-                        logger.info("Shutdown signal received, stopping transcription forwarding")
+                        log.info("Shutdown signal received, stopping transcription forwarding")
                         break
+                    metrics.STT_EVENTS.labels(event.type.value).inc()
                         
+                    if event.type in (lk_stt.SpeechEventType.INTERIM_TRANSCRIPT,
+                                      lk_stt.SpeechEventType.FINAL_TRANSCRIPT) and not stt_session.accept_event(
+                            stt_stream, event.type == lk_stt.SpeechEventType.FINAL_TRANSCRIPT,
+                            event.alternatives[0].end_time):
+                        continue  # Replayed audio that was already transcribed before a failover
+
                     if event.type == lk_stt.SpeechEventType.INTERIM_TRANSCRIPT:
                         text = event.alternatives[0].text
-                        logger.info(f"Interim transcript from {participant.identity}: {text}")
+                        # Interims are logged at a sampled per-room rate; the message is only built when kept
+                        if job.interim_log.allow():
+                            suppressed = job.interim_log.take_suppressed()
+                            log.info(f"Interim transcript from {participant.identity}: {text}"
+                                     + (f" ({suppressed} interims not logged)" if suppressed else ""))
                         try:
                             # INTERIM
                             payload = {
@@ -135,24 +553,22 @@ async def transcribe_and_forward(participant: rtc.RemoteParticipant, track: rtc.
                                 "text": text,
                                 "participant": participant.identity,
                                 "trackSid": track.sid,
-                                "segmentId": f"{participant.identity}_{int(time.time()*1000)}",
+                                **segments.next(stt_stream, final=False),
                             }
                             
-                            # Publish to LiveKit room
-                            await room.local_participant.publish_data(
-                                json.dumps(payload).encode("utf-8"),
-                                topic="lk.transcription",
-                            )
-                            
-                            # Send to backend for collection
-                            meeting_id = room.name.replace("meeting-", "") if room.name.startswith("meeting-") else room.name
-                            await webhook_service.send_transcription(meeting_id, payload)
+                            with tracing.span("stt.event", **job.span_attributes(payload)):
+                                await coalescer.interim(payload)
                         except Exception as e:
-                            logger.error(f"Failed to publish interim transcript: {e}")
+                            log.error(f"Failed to publish interim transcript: {e}")
                             
                     elif event.type == lk_stt.SpeechEventType.FINAL_TRANSCRIPT:
                         text = event.alternatives[0].text
-                        logger.info(f"Final transcript from {participant.identity}: {text}")
+                        pushed_at = push_clock.pushed_at(event.alternatives[0].end_time)
+                        frame_to_final = None
+                        if pushed_at is not None and event.alternatives[0].end_time > 0:
+                            frame_to_final = time.monotonic() - pushed_at
+                            metrics.FRAME_TO_FINAL_LATENCY.observe(frame_to_final)
+                        log.info(f"Final transcript from {participant.identity}: {text}")
                         try:
                             # FINAL
                             payload = {
@@ -160,72 +576,157 @@ async def transcribe_and_forward(participant: rtc.RemoteParticipant, track: rtc.
                                 "text": text,
                                 "participant": participant.identity,
                                 "trackSid": track.sid,
-                                "segmentId": f"{participant.identity}_{int(time.time()*1000)}",
+                                **segments.next(stt_stream, final=True),
                             }
                             
-                            # Publish to LiveKit room
-                            await room.local_participant.publish_data(
-                                json.dumps(payload).encode("utf-8"),
-                                topic="lk.transcription",
-                            )
-                            
-                            # Send to backend for collection
-                            meeting_id = room.name.replace("meeting-", "") if room.name.startswith("meeting-") else room.name
-                            await webhook_service.send_transcription(meeting_id, payload)
+                            # stt_latency_ms: last audio of the utterance pushed to final received
+                            with tracing.span("stt.event", **job.span_attributes(payload),
+                                              stt_latency_ms=None if frame_to_final is None else frame_to_final * 1000):
+                                await coalescer.final(payload)
                         except Exception as e:
-                            logger.error(f"Failed to publish final transcript: {e}")
+                            log.error(f"Failed to publish final transcript: {e}")
                             
             except Exception as e:
-                logger.error(f"Error in transcription forwarding: {e}")
+                log.error(f"Error in transcription forwarding: {e}")
+            finally:
+                push_clocks.pop(stt_stream, None)
+                segments.release(stt_stream)
 
-        forward_task = asyncio.create_task(forward_transcriptions())
-        active_tasks.add(forward_task)
-        forward_task.add_done_callback(active_tasks.discard)
+        # STT stream of the fastest provider option (pre-opened by its pool). The session ends the
+        # stream while the track is muted or, with VAD, silent, and reopens it on demand;
+        # a failed stream is replaced and recent audio replayed into the new one
+        stt_session = TrackSTTSession(
+            job.stt_router.acquire, forward_transcriptions,
+            suspend_after=None if vad_enabled() else 0,
+            name=f"stt-events {room.name}/{participant.identity}",
+            track_task=job.track_task,
+            on_push=lambda stream, frame: push_clocks.setdefault(stream, metrics.PushClock()).pushed(frame),
+            stopping=shutdown_event.is_set,
+        )
+        try:
+            stt_session.open()
+        except Exception as e:
+            log.error(f"Failed to initialize STT: {e}")
+            return
+        job.stt_sessions[track.sid] = stt_session
+        if getattr(track, "muted", False):
+            stt_session.set_muted(True)
+
+        # Optional voice-activity gate, so no silence is streamed to Deepgram
+        speech_gate = SpeechGate() if vad_enabled() else None
+
+        # Bounded buffer between ingest and STT: a stalled provider turns into
+        # dropped audio and bounded lag instead of unbounded memory growth
+        frame_queue = FrameQueue()
+        max_stt_backlog = int(os.getenv("STT_MAX_BACKLOG_FRAMES", "50"))
+
+        def enqueue_frames(frames):
+            for frame in frames:
+                if speech_gate is None:
+                    frame_queue.put(frame)
+                else:
+                    for gated_frame in speech_gate.process(frame):
+                        if speech_gate.in_speech:
+                            stt_session.speech_seen()
+                        frame_queue.put(gated_frame, is_speech=speech_gate.in_speech)
+
+        async def pump_frames():
+            try:
+                while True:
+                    frame = await frame_queue.get()
+                    if frame is None:
+                        break
+                    # Muted, or suspended for silence with no speech yet
+                    if not stt_session.accepts_audio():
+                        continue
+                    stt_stream = stt_session.stream
+                    # Hold frames in the bounded queue while the STT stream is backed up
+                    if stt_stream is not None:
+                        await frame_queue.wait_for_stt(
+                            stt_stream, max_stt_backlog, lambda: stt_session.stream is stt_stream)
+                        if not stt_session.accepts_audio():
+                            continue  # Suspended while waiting
+                    stt_session.push(frame)
+            except Exception as e:
+                log.error(f"Error pushing audio frame: {e}")
+
+        pump_task = job.track_task(asyncio.create_task(
+            pump_frames(), name=f"audio-pump {room.name}/{participant.identity}"))
+
+        track_metrics = metrics.TrackMetrics(room.name, track.sid, frame_queue)
+        metrics_task = asyncio.create_task(track_metrics.run())
 
         # Process audio frames with error handling
         try:
             async for audio_event in audio_stream:
                 if shutdown_event.is_set():
-                    logger.info("Shutdown signal received, stopping audio processing")
+                    log.info("Shutdown signal received, stopping audio processing")
                     break
+                if pump_task.done():
+                    break
+                track_metrics.frame_ingested()
                     
                 try:
-                    stt_stream.push_frame(audio_event.frame)
+                    enqueue_frames((audio_event.frame,))
                 except Exception as e:
-                    logger.error(f"Error pushing audio frame: {e}")
+                    log.error(f"Error processing audio frame: {e}")
                     break
         except Exception as e:
-            logger.error(f"Error processing audio stream: {e}")
+            log.error(f"Error processing audio stream: {e}")
 
-        # Wait for forwarding task to complete
-        if forward_task and not forward_task.done():
+        frame_queue.close()
+        if not pump_task.done():
             try:
-                await asyncio.wait_for(forward_task, timeout=5.0)
+                await asyncio.wait_for(pump_task, timeout=2.0)
             except asyncio.TimeoutError:
-                logger.warning("Transcription forwarding task timed out")
-                forward_task.cancel()
+                pump_task.cancel()
+
+        if frame_queue.frames_dropped:
+            log.warning(f"Dropped {frame_queue.frames_dropped}/{frame_queue.frames_in} audio frames "
+                           f"for {participant.identity} (max queue depth {frame_queue.max_depth})")
+
+        if speech_gate is not None and speech_gate.frames_in:
+            log.info(f"VAD forwarded {speech_gate.frames_forwarded}/{speech_gate.frames_in} frames "
+                        f"for {participant.identity}")
+
+        # Let the STT stream deliver the last transcripts, then close it
+        await stt_session.aclose()
                 
     except Exception as e:
-        logger.exception(f"Critical error in transcription for {participant.identity}: {e}")
+        log.exception(f"Critical error in transcription for {participant.identity}: {e}")
     finally:
         # Enhanced cleanup with error handling
         cleanup_tasks = []
         
         if audio_stream:
             cleanup_tasks.append(audio_stream.aclose())
-        if stt_stream:
-            cleanup_tasks.append(stt_stream.aclose())
-        if forward_task and not forward_task.done():
-            forward_task.cancel()
-            cleanup_tasks.append(forward_task)
+        if stt_session:
+            # Unsubscribed, disconnected or failed: no waiting for pending transcripts
+            job.stt_sessions.pop(track.sid, None)
+            cleanup_tasks.append(stt_session.aclose(graceful=False))
+        if pump_task and not pump_task.done():
+            pump_task.cancel()
+            cleanup_tasks.append(pump_task)
+        if metrics_task:
+            metrics_task.cancel()
+            cleanup_tasks.append(metrics_task)
             
         if cleanup_tasks:
             try:
                 await asyncio.gather(*cleanup_tasks, return_exceptions=True)
             except Exception as e:
-                logger.error(f"Error during cleanup: {e}")
+                log.error(f"Error during cleanup: {e}")
+
+        if coalescer:
+            await coalescer.aclose()
+
+        if track_metrics:
+            track_metrics.close()
+        
+        tracing.deactivate(span_token)
+        tracing.end_span(track_span)
                 
-        logger.info(f"Transcription cleanup completed for {participant.identity}")
+        log.info(f"Transcription cleanup completed for {participant.identity}")
 
 async def main(ctx: agents.JobContext):
     """Transcription agent entrypoint with enhanced error handling and graceful shutdown"""
@@ -236,30 +737,73 @@ async def main(ctx: agents.JobContext):
 
     room = ctx.room
     
+    # Per-room state; other rooms may be running in this process
+    job = JobState(room)
+    meeting_id = job.meeting_id
+    log = logging.LoggerAdapter(logger, {"meeting_id": meeting_id})
+    services = job.services
+    watchdog.start()
+    
+    # Open STT streams while the room connection is being set up
+    try:
+        job.stt_router.start()
+    except Exception as e:
+        log.error(f"Failed to pre-open STT streams: {e}")
+    
+    # Continue the transcript of a meeting whose previous job did not finish its upload
+    job.transcript.load()
+    job.transcript.start()
+    
     # Track active transcription tasks
-    transcription_tasks = set()
+    transcription_tasks = job.transcription_tasks
+    
+    process_load.job_started(transcription_tasks)
+    metrics.ACTIVE_ROOMS.inc()
+    gauges_task = asyncio.create_task(metrics.sample_job_gauges(job))
 
     @room.on("track_subscribed")
     def on_track_subscribed(track, publication, participant):
         if track.kind == rtc.TrackKind.KIND_AUDIO:
-            logger.info(f"Audio track subscribed from {participant.identity}")
-            task = asyncio.create_task(transcribe_and_forward(participant, track, room))
-            transcription_tasks.add(task)
-            task.add_done_callback(transcription_tasks.discard)
+            log.info(f"Audio track subscribed from {participant.identity}")
+            task = asyncio.create_task(transcribe_and_forward(participant, track, job),
+                                       name=f"transcribe {room.name}/{participant.identity}")
+            job.add_track_task(participant, track, task)
 
     @room.on("track_unsubscribed")
     def on_track_unsubscribed(track, publication, participant):
         if track.kind == rtc.TrackKind.KIND_AUDIO:
-            logger.info(f"Audio track unsubscribed from {participant.identity}")
+            log.info(f"Audio track unsubscribed from {participant.identity}")
+            # Release the audio stream and STT connection now, not when the iterator runs dry
+            job.stop_tracks(track_sid=track.sid)
+
+    @room.on("track_muted")
+    def on_track_muted(participant, publication):
+        if job.set_track_muted(publication.sid, True):
+            log.info(f"Audio track of {participant.identity} muted, STT stream suspended")
+
+    @room.on("track_unmuted")
+    def on_track_unmuted(participant, publication):
+        if job.set_track_muted(publication.sid, False):
+            log.info(f"Audio track of {participant.identity} unmuted, STT stream resumed")
+
+    @room.on("data_received")
+    def on_data_received(packet):
+        wanted = job.caption_policy.handle_control(packet)
+        if wanted is not None:
+            log.info(f"Captions {'enabled' if wanted else 'disabled'} for {packet.participant.identity}")
 
     @room.on("participant_disconnected")
     def on_participant_disconnected(participant):
-        logger.info(f"Participant {participant.identity} disconnected")
+        log.info(f"Participant {participant.identity} disconnected")
+        job.caption_policy.participant_left(participant.identity)
+        stopped = job.stop_tracks(identity=participant.identity)
+        if stopped:
+            log.info(f"Stopped transcription of {stopped} track(s) of {participant.identity}")
 
     @room.on("disconnected")
     def on_disconnected():
-        logger.info("Room disconnected, initiating cleanup...")
-        shutdown_event.set()
+        log.info("Room disconnected, initiating cleanup...")
+        job.shutdown_event.set()
 
     try:
         # Connect to room with retry logic
@@ -269,34 +813,36 @@ async def main(ctx: agents.JobContext):
         while retry_count < max_retries:
             try:
                 await ctx.connect(auto_subscribe=AutoSubscribe.AUDIO_ONLY)
-                logger.info("Transcription agent connected and listening for audio tracks")
+                connect_latency = time.monotonic() - job.dispatched_at
+                metrics.JOB_CONNECT_LATENCY.observe(connect_latency)
+                log.info(f"Transcription agent connected and listening for audio tracks ({connect_latency:.2f}s after dispatch)")
                 
-                # Notify backend that meeting has started
-                meeting_id = room.name.replace("meeting-", "") if room.name.startswith("meeting-") else room.name
-                await webhook_service.notify_meeting_started(meeting_id)
+                # Notify backend that meeting has started, without holding up transcription
+                job.track_task(asyncio.create_task(
+                    services.call(services.webhook_service.notify_meeting_started(meeting_id))))
                 
                 break
             except Exception as e:
                 retry_count += 1
-                logger.error(f"Connection attempt {retry_count} failed: {e}")
+                log.error(f"Connection attempt {retry_count} failed: {e}")
                 if retry_count < max_retries:
                     await asyncio.sleep(2 ** retry_count)  # Exponential backoff
                 else:
-                    logger.error("Max connection retries reached, giving up")
+                    log.error("Max connection retries reached, giving up")
                     raise
 
         # Wait for shutdown signal or room disconnection
-        await shutdown_event.wait()
+        await job.shutdown_event.wait()
         
     except Exception as e:
-        logger.exception(f"Critical error in main agent loop: {e}")
+        log.exception(f"Critical error in main agent loop: {e}")
     finally:
         # Graceful cleanup
-        logger.info("Starting graceful shutdown...")
+        log.info("Starting graceful shutdown...")
         
         # Cancel all active transcription tasks
         if transcription_tasks:
-            logger.info(f"Cancelling {len(transcription_tasks)} active transcription tasks")
+            log.info(f"Cancelling {len(transcription_tasks)} active transcription tasks")
             for task in transcription_tasks:
                 if not task.done():
                     task.cancel()
@@ -308,14 +854,23 @@ async def main(ctx: agents.JobContext):
                     timeout=10.0
                 )
             except asyncio.TimeoutError:
-                logger.warning("Some transcription tasks did not complete within timeout")
-        
-        logger.info("Transcription agent shutdown completed")
+                log.warning("Some transcription tasks did not complete within timeout")
+
+        # Flush buffered backend deliveries and upload the transcript, then release the shared clients
+        await job.aclose(timeout=10.0)
+        await watchdog.stop()
+
+        gauges_task.cancel()
+        await asyncio.gather(gauges_task, return_exceptions=True)
+        metrics.ACTIVE_ROOMS.dec()
+        process_load.job_finished(transcription_tasks)
+
+        log.info("Transcription agent shutdown completed")
 
 def setup_environment():
     """Validate and setup environment variables"""
-    required_vars = ["DEEPGRAM_API_KEY", "LIVEKIT_URL", "LIVEKIT_API_KEY", "LIVEKIT_API_SECRET"]
-    missing_vars = []
+    required_vars = ["LIVEKIT_URL", "LIVEKIT_API_KEY", "LIVEKIT_API_SECRET"]
+    missing_vars = stt_router.missing_credentials()
     
     for var in required_vars:
         if not os.getenv(var):
@@ -335,19 +890,36 @@ if __name__ == "__main__":
         logger.error("Environment validation failed, exiting...")
         sys.exit(1)
     
+    # Serve pipeline metrics aggregated across job processes
+    metrics.start_metrics_server()
+    
+    # Report real load so saturated workers stop receiving new rooms
+    worker_load = WorkerLoad()
+    
+    # High-density mode hosts rooms as threads of one process instead of a process per room
+    high_density = os.getenv("HIGH_DENSITY_MODE", "false").lower() in ("1", "true", "yes")
+    
     # Run the agent with enhanced error handling and explicit dispatch
     try:
         # Run the agent with automatic dispatch (no agent_name)
-        agents.cli.run_app(
-            agents.WorkerOptions(
-                entrypoint_fnc=main,
-                # No agent_name = automatic dispatch to all new rooms
-                permissions=agents.WorkerPermissions(
-                    can_publish_data=True, 
-                    can_subscribe=True
-                ),
-            )
+        worker_options = agents.WorkerOptions(
+            entrypoint_fnc=main,
+            prewarm_fnc=prewarm,
+            load_fnc=worker_load.get_load,
+            load_threshold=worker_load.threshold,
+            # No agent_name = automatic dispatch to all new rooms
+            permissions=agents.WorkerPermissions(
+                can_publish_data=True, 
+                can_subscribe=True
+            ),
         )
+        if high_density:
+            worker_options.job_executor_type = agents.JobExecutorType.THREAD
+            logger.info("High-density mode: rooms run as threads of one worker process")
+        elif stream_enabled():
+            # The stream belongs to a process; job processes share nothing with each other
+            logger.info("Backend stream without high-density mode: one connection per room's job process")
+        agents.cli.run_app(worker_options)
     except KeyboardInterrupt:
         logger.info("Agent interrupted by user")
     except Exception as e:
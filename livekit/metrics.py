@@ -0,0 +1,277 @@
+"""Prometheus metrics for the transcription pipeline.
+
+Jobs run in child processes, so metrics use prometheus_client's multiprocess
+mode: every process writes its samples to PROMETHEUS_MULTIPROC_DIR and the
+worker's main process serves the aggregate on METRICS_PORT. This module must be
+imported before anything else imports prometheus_client (livekit.agents does).
+"""
+import os
+import glob
+import time
+import asyncio
+import logging
+import threading
+from bisect import bisect_left
+
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+
+if METRICS_PORT and "PROMETHEUS_MULTIPROC_DIR" not in os.environ:
+    os.environ["PROMETHEUS_MULTIPROC_DIR"] = os.path.abspath(os.getenv("METRICS_MULTIPROC_DIR", "prometheus_multiproc"))
+if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+    os.makedirs(os.environ["PROMETHEUS_MULTIPROC_DIR"], exist_ok=True)
+
+import psutil
+from prometheus_client import Counter, Gauge, Histogram, CollectorRegistry, start_http_server
+from prometheus_client import multiprocess
+from prometheus_client.mmap_dict import MmapedDict
+
+logger = logging.getLogger("transcription-agent")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 5.0, 10.0)
+
+FRAMES_INGESTED = Counter(
+    "transcription_frames_ingested_total", "Audio frames received from subscribed tracks")
+FRAMES_DROPPED = Counter(
+    "transcription_frames_dropped_total", "Audio frames dropped by the bounded frame queue")
+TRACK_INGEST_RATE = Gauge(
+    "transcription_track_ingest_frames_per_second", "Audio frame ingest rate per track",
+    ["room", "track"], multiprocess_mode="livesum")
+
+STT_EVENTS = Counter(
+    "transcription_stt_events_total", "Speech events received from the STT stream", ["type"])
+FRAME_TO_FINAL_LATENCY = Histogram(
+    "transcription_frame_to_final_seconds",
+    "Time from pushing the last audio frame of an utterance to receiving its final transcript",
+    buckets=LATENCY_BUCKETS)
+
+PUBLISH_LATENCY = Histogram(
+    "transcription_publish_data_seconds", "Latency of publish_data on the transcription topic",
+    buckets=LATENCY_BUCKETS)
+PUBLISH_ERRORS = Counter(
+    "transcription_publish_data_errors_total", "Failed publish_data calls")
+PUBLISH_BYTES = Counter(
+    "transcription_publish_data_bytes_total", "Bytes published on the transcription topic", ["format"])
+PUBLISH_MESSAGES = Counter(
+    "transcription_publish_data_messages_total", "Packets published on the transcription topic", ["channel"])
+PUBLISH_SKIPPED = Counter(
+    "transcription_publish_data_skipped_total", "Captions not published because no participant opted in")
+WEBHOOK_LATENCY = Histogram(
+    "transcription_webhook_seconds", "Latency of backend webhook requests", ["endpoint"],
+    buckets=LATENCY_BUCKETS)
+WEBHOOK_ERRORS = Counter(
+    "transcription_webhook_errors_total", "Failed or rejected backend webhook requests", ["endpoint"])
+BACKEND_STREAM_CONNECTED = Gauge(
+    "transcription_backend_stream_connected", "Open websocket streams to the backend",
+    multiprocess_mode="livesum")
+BACKEND_STREAM_RECONNECTS = Counter(
+    "transcription_backend_stream_reconnects_total", "Failed or dropped backend stream connections")
+BACKEND_STREAM_FALLBACKS = Counter(
+    "transcription_backend_stream_fallbacks_total", "Backend messages sent over HTTP because the stream was down or slow")
+
+STT_OPEN_STREAMS = Gauge(
+    "transcription_stt_open_streams", "STT streams currently open for subscribed tracks",
+    multiprocess_mode="livesum")
+STT_SUSPENSIONS = Counter(
+    "transcription_stt_suspensions_total", "STT streams ended because the track was muted or silent", ["reason"])
+STT_RESUMES = Counter(
+    "transcription_stt_resumes_total", "STT streams reopened after a suspension", ["reason"])
+STT_FAILOVERS = Counter(
+    "transcription_stt_failovers_total", "STT streams that failed and were replaced")
+STT_PROVIDER_LATENCY = Histogram(
+    "transcription_stt_provider_latency_seconds",
+    "Time from pushing audio to receiving the first interim or the final transcript covering it, per STT option",
+    ["provider", "kind"], buckets=LATENCY_BUCKETS)
+STT_ROUTED = Counter(
+    "transcription_stt_routed_total", "STT streams handed out per provider option", ["provider"])
+STT_PROVIDER_FAILURES = Counter(
+    "transcription_stt_provider_failures_total", "STT stream failures per provider option", ["provider"])
+STT_HEDGE_WINS = Counter(
+    "transcription_stt_hedge_wins_total", "Hedged utterances finalized first by each provider option", ["provider"])
+
+LOOP_LAG = Histogram(
+    "transcription_event_loop_lag_seconds", "Delay of the event loop watchdog's periodic tick",
+    buckets=LATENCY_BUCKETS)
+LOOP_STALLS = Counter(
+    "transcription_event_loop_stalls_total", "Event loop stalls longer than LOOP_STALL_THRESHOLD_MS")
+LOOP_STALL_DURATION = Histogram(
+    "transcription_event_loop_stall_seconds", "Duration of event loop stalls",
+    buckets=LATENCY_BUCKETS)
+
+JOB_CONNECT_LATENCY = Histogram(
+    "transcription_job_connect_seconds", "Time from job dispatch to the room connection being ready",
+    buckets=LATENCY_BUCKETS)
+DISPATCH_TO_FIRST_CAPTION = Histogram(
+    "transcription_dispatch_to_first_caption_seconds",
+    "Time from job dispatch to the first caption published in the room",
+    buckets=LATENCY_BUCKETS + (20.0, 30.0, 60.0))
+
+ACTIVE_ROOMS = Gauge(
+    "transcription_active_rooms", "Rooms with a running transcription job", multiprocess_mode="livesum")
+ACTIVE_TRACKS = Gauge(
+    "transcription_active_tracks", "Audio tracks being transcribed", multiprocess_mode="livesum")
+ACTIVE_TASKS = Gauge(
+    "transcription_active_tasks", "Background forwarding and delivery tasks", multiprocess_mode="livesum")
+
+FRAME_QUEUE_DEPTH = Gauge(
+    "transcription_frame_queue_depth", "Frames waiting between ingest and STT",
+    ["room", "track"], multiprocess_mode="livesum")
+FRAME_QUEUE_OLDEST_AGE = Gauge(
+    "transcription_frame_queue_oldest_age_seconds", "Age of the oldest frame waiting for STT",
+    ["room", "track"], multiprocess_mode="livemax")
+DELIVERY_QUEUE_DEPTH = Gauge(
+    "transcription_delivery_queue_depth", "Transcription events waiting for backend delivery",
+    ["room"], multiprocess_mode="livesum")
+
+
+class PushClock:
+    """Maps STT stream time (seconds of audio pushed) back to when that audio was pushed"""
+
+    def __init__(self, max_points=3000):
+        self.max_points = max_points
+        self._audio_times = []
+        self._pushed_at = []
+        self._audio_time = 0.0
+
+    def pushed(self, frame):
+        self._audio_time += frame.samples_per_channel / frame.sample_rate
+        self._audio_times.append(self._audio_time)
+        self._pushed_at.append(time.monotonic())
+        if len(self._audio_times) > 2 * self.max_points:
+            del self._audio_times[:self.max_points]
+            del self._pushed_at[:self.max_points]
+
+    def pushed_at(self, audio_time):
+        """Monotonic time the frame containing `audio_time` was pushed, or None if unknown"""
+        index = bisect_left(self._audio_times, audio_time)
+        if not self._audio_times or index >= len(self._audio_times):
+            return self._pushed_at[-1] if self._audio_times else None
+        if index == 0 and audio_time < self._audio_times[0] - 1.0:
+            return None
+        return self._pushed_at[index]
+
+
+class TrackMetrics:
+    """Per-track gauges, refreshed by `run()` while the track is transcribed"""
+
+    def __init__(self, room_name, track_sid, frame_queue):
+        self.labels = (room_name, track_sid)
+        self.frame_queue = frame_queue
+        self.frames = 0
+
+    def frame_ingested(self):
+        self.frames += 1
+        FRAMES_INGESTED.inc()
+
+    async def run(self, interval=None):
+        interval = interval or float(os.getenv("METRICS_SAMPLE_INTERVAL_SECONDS", "1"))
+        last_frames, last_dropped, last_time = 0, 0, time.monotonic()
+        while True:
+            await asyncio.sleep(interval)
+            now = time.monotonic()
+            TRACK_INGEST_RATE.labels(*self.labels).set((self.frames - last_frames) / (now - last_time))
+            FRAME_QUEUE_DEPTH.labels(*self.labels).set(self.frame_queue.depth)
+            FRAME_QUEUE_OLDEST_AGE.labels(*self.labels).set(self.frame_queue.oldest_age())
+            FRAMES_DROPPED.inc(self.frame_queue.frames_dropped - last_dropped)
+            last_frames, last_dropped, last_time = self.frames, self.frame_queue.frames_dropped, now
+
+    def close(self):
+        for gauge in (TRACK_INGEST_RATE, FRAME_QUEUE_DEPTH, FRAME_QUEUE_OLDEST_AGE):
+            gauge.labels(*self.labels).set(0)
+            gauge.remove(*self.labels)
+
+
+async def sample_job_gauges(job, interval=None):
+    """Refresh room-level gauges for one job until cancelled.
+
+    Several jobs can share a process, so process-wide gauges are moved by the
+    job's own change instead of being set.
+    """
+    interval = interval or float(os.getenv("METRICS_SAMPLE_INTERVAL_SECONDS", "1"))
+    room_name = job.room.name
+    tracks = tasks = 0
+    try:
+        while True:
+            ACTIVE_TRACKS.inc(len(job.transcription_tasks) - tracks)
+            ACTIVE_TASKS.inc(len(job.active_tasks) - tasks)
+            tracks, tasks = len(job.transcription_tasks), len(job.active_tasks)
+            queue = job.delivery_queue
+            DELIVERY_QUEUE_DEPTH.labels(room_name).set(len(queue) if queue is not None else 0)
+            await asyncio.sleep(interval)
+    finally:
+        ACTIVE_TRACKS.dec(tracks)
+        ACTIVE_TASKS.dec(tasks)
+        DELIVERY_QUEUE_DEPTH.labels(room_name).set(0)
+        DELIVERY_QUEUE_DEPTH.remove(room_name)
+
+
+def _pid(db_file):
+    """Pid of the process that wrote `<type>_[<mode>_]<pid>.db`, or None for an archive"""
+    try:
+        return int(os.path.basename(db_file).rsplit("_", 1)[1][:-len(".db")])
+    except ValueError:
+        return None
+
+
+class _LiveProcessCollector:
+    """Multiprocess collector that first folds the files of job processes that exited.
+
+    Every job process leaves its own files. Live gauges of an exited process
+    are dropped; its counters and histograms are added to `<type>_archive.db`
+    and its files removed, so the directory holds one file per type and
+    running process instead of growing with every meeting.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._collector = multiprocess.MultiProcessCollector(None, path)
+        # Scrapes are served by several threads; one folds while the others wait
+        self._lock = threading.Lock()
+
+    def collect(self):
+        with self._lock:
+            self._fold_dead_processes()
+            return self._collector.collect()
+
+    def _fold_dead_processes(self):
+        dead = {}
+        for db_file in glob.glob(os.path.join(self.path, "*.db")):
+            pid = _pid(db_file)
+            if pid is not None and not psutil.pid_exists(pid):
+                dead.setdefault(os.path.basename(db_file).split("_", 1)[0], []).append(db_file)
+        for typ, db_files in dead.items():
+            if typ == "gauge":
+                for pid in {_pid(db_file) for db_file in db_files}:
+                    multiprocess.mark_process_dead(pid, self.path)
+                continue
+            archive = MmapedDict(os.path.join(self.path, f"{typ}_archive.db"))
+            try:
+                for db_file in db_files:
+                    for key, value, timestamp, _ in MmapedDict.read_all_values_from_file(db_file):
+                        archive.write_value(key, archive.read_value(key)[0] + value, timestamp)
+                    os.remove(db_file)
+            except OSError as e:
+                logger.warning(f"Could not fold metrics of exited processes into {typ}_archive.db: {e!r}")
+            finally:
+                archive.close()
+
+
+def start_metrics_server():
+    """Serve aggregated metrics from the worker's main process (no-op unless METRICS_PORT is set)"""
+    if not METRICS_PORT:
+        return False
+
+    path = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+    # Samples left by processes of a previous run of the worker, and its archives, are stale
+    for db_file in glob.glob(os.path.join(path, "*.db")):
+        pid = _pid(db_file)
+        if pid is None or not psutil.pid_exists(pid):
+            try:
+                os.remove(db_file)
+            except OSError:
+                pass
+    registry = CollectorRegistry()
+    registry.register(_LiveProcessCollector(path))
+    start_http_server(METRICS_PORT, addr=METRICS_HOST, registry=registry)
+    logger.info(f"Metrics available at http://{METRICS_HOST}:{METRICS_PORT}/metrics")
+    return True
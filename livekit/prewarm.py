@@ -0,0 +1,99 @@
+import os
+import time
+import socket
+import logging
+from urllib.parse import urlparse
+
+import numpy as np
+from aiohttp.abc import AbstractResolver
+from aiohttp.resolver import DefaultResolver
+from livekit import rtc
+
+from vad import SpeechGate
+
+logger = logging.getLogger("transcription-agent")
+
+DEEPGRAM_URL = "https://api.deepgram.com/v1/listen"
+
+# (host, port) -> (resolved at, aiohttp resolve results), filled by `prewarm`
+_dns_cache = {}
+
+
+def _host_port(url):
+    parsed = urlparse(url)
+    default_port = 443 if parsed.scheme in ("https", "wss") else 80
+    return parsed.hostname, parsed.port or default_port
+
+
+def resolve(url):
+    """Resolve a URL's host ahead of time for `PrewarmedResolver`"""
+    host, port = _host_port(url)
+    if not host:
+        return 0
+    infos = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    results = []
+    for family, _, proto, _, address in infos:
+        if family not in (socket.AF_INET, socket.AF_INET6):
+            continue
+        results.append({
+            "hostname": host,
+            "host": address[0],
+            "port": address[1],
+            "family": family,
+            "proto": proto,
+            "flags": socket.AI_NUMERICHOST | socket.AI_NUMERICSERV,
+        })
+    _dns_cache[(host, port)] = (time.monotonic(), results)
+    return len(results)
+
+
+class PrewarmedResolver(AbstractResolver):
+    """aiohttp resolver that answers from addresses resolved during prewarm.
+
+    Hosts that were not prewarmed, or whose entry is older than
+    PREWARM_DNS_TTL_SECONDS, go through aiohttp's default resolver.
+    """
+
+    def __init__(self, ttl=None):
+        self.ttl = ttl if ttl is not None else float(os.getenv("PREWARM_DNS_TTL_SECONDS", "300"))
+        self._fallback = DefaultResolver()
+
+    async def resolve(self, host, port=0, family=socket.AF_INET):
+        entry = _dns_cache.get((host, port))
+        if entry is not None and time.monotonic() - entry[0] < self.ttl:
+            results = [r for r in entry[1] if family == socket.AF_UNSPEC or r["family"] == family]
+            if results:
+                return results
+        return await self._fallback.resolve(host, port, family)
+
+    async def close(self):
+        await self._fallback.close()
+
+
+def _warm_audio():
+    """Run one frame through the VAD code path (NumPy kernels)"""
+    samples = np.zeros(800, dtype=np.int16)
+    frame = rtc.AudioFrame(samples.tobytes(), 16000, 1, 800)
+    SpeechGate().process(frame)
+
+
+def prewarm(proc):
+    """Worker prewarm hook: runs once per job process before any room is assigned"""
+    started = time.perf_counter()
+
+    # The Deepgram plugin registers itself on import; make sure it happens here, not in a job
+    from livekit.plugins import deepgram  # noqa: F401
+
+    for url in (os.getenv("BACKEND_URL", "http://localhost:8978"), DEEPGRAM_URL):
+        try:
+            resolve(url)
+        except OSError as e:
+            logger.warning(f"Prewarm could not resolve {url}: {e}")
+
+    try:
+        _warm_audio()
+    except Exception as e:
+        logger.warning(f"Prewarm of audio processing failed: {e}")
+
+    proc.userdata["prewarmed_at"] = time.time()
+    logger.info(f"[SUCCESS] Job process prewarmed in {(time.perf_counter() - started) * 1000:.0f} ms")
@@ -0,0 +1,345 @@
+import os
+import re
+import json
+import time
+import random
+import struct
+import asyncio
+import logging
+import threading
+
+logger = logging.getLogger("transcription-agent")
+
+# Every record is a 4-byte big-endian length followed by a JSON payload
+RECORD_HEADER = struct.Struct(">I")
+
+
+class TranscriptionSpool:
+    """Append-only spool file of undelivered transcription batches for one meeting.
+
+    The replay position is kept in a sidecar `.offset` file, so a restarted
+    worker resumes where the previous one stopped. A `.lock` file marks which
+    process owns the spool; owners refresh it and locks that stop being
+    refreshed are considered stale. `sync` runs in an executor thread while
+    `close` runs on the event loop, so the two are serialized by a lock.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.offset_path = path + ".offset"
+        self.lock_path = path + ".lock"
+        self._file = None
+        self._file_lock = threading.Lock()
+        self.dirty = False
+        self.locked = False
+
+    def try_lock(self, stale_after):
+        """Claim the spool for this process; returns False if another live process owns it"""
+        if self.locked:
+            return True
+        try:
+            fd = os.open(self.lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(self.lock_path) < stale_after:
+                    return False
+                os.remove(self.lock_path)
+                fd = os.open(self.lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except OSError:
+                return False
+        except OSError:
+            return False
+        with os.fdopen(fd, "w") as f:
+            f.write(str(os.getpid()))
+        self.locked = True
+        return True
+
+    def touch_lock(self):
+        if self.locked:
+            try:
+                os.utime(self.lock_path)
+            except OSError:
+                pass
+
+    def unlock(self):
+        self.close()
+        if self.locked:
+            try:
+                os.remove(self.lock_path)
+            except OSError:
+                pass
+            self.locked = False
+
+    def append(self, record):
+        """Append one record; durable once the next fsync has run"""
+        if self._file is None:
+            self._file = open(self.path, "ab")
+        data = json.dumps(record).encode("utf-8")
+        self._file.write(RECORD_HEADER.pack(len(data)) + data)
+        self._file.flush()
+        self.dirty = True
+
+    def sync(self):
+        with self._file_lock:
+            if self._file is not None and self.dirty:
+                self.dirty = False
+                os.fsync(self._file.fileno())
+
+    def close(self):
+        with self._file_lock:
+            if self._file is not None:
+                if self.dirty:
+                    self.dirty = False
+                    os.fsync(self._file.fileno())
+                self._file.close()
+                self._file = None
+
+    def size(self):
+        try:
+            return os.path.getsize(self.path)
+        except OSError:
+            return 0
+
+    def committed_offset(self):
+        try:
+            with open(self.offset_path, "r") as f:
+                return int(f.read().strip() or 0)
+        except (OSError, ValueError):
+            return 0
+
+    def commit(self, offset):
+        """Record that everything before `offset` has been delivered"""
+        tmp_path = self.offset_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write(str(offset))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.offset_path)
+
+    def read_records(self, offset, limit):
+        """Read up to `limit` complete records starting at `offset`.
+
+        Returns a list of (end_offset, record). A truncated record at the tail
+        (from a crash mid-write) is left for a later read.
+        """
+        records = []
+        try:
+            with open(self.path, "rb") as f:
+                f.seek(offset)
+                while len(records) < limit:
+                    header = f.read(RECORD_HEADER.size)
+                    if len(header) < RECORD_HEADER.size:
+                        break
+                    (length,) = RECORD_HEADER.unpack(header)
+                    data = f.read(length)
+                    if len(data) < length:
+                        break
+                    offset += RECORD_HEADER.size + length
+                    try:
+                        records.append((offset, json.loads(data.decode("utf-8"))))
+                    except ValueError:
+                        logger.error(f"[ERROR] Skipping corrupt spool record in {self.path} at offset {offset}")
+                        records.append((offset, None))
+        except FileNotFoundError:
+            pass
+        return records
+
+    def dead_letter(self, record):
+        """Append a record that will never be delivered to `<spool>.dead` (same format; rename to replay)"""
+        data = json.dumps(record).encode("utf-8")
+        with open(self.path[:-len(".spool")] + ".dead", "ab") as f:
+            f.write(RECORD_HEADER.pack(len(data)) + data)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def remove(self):
+        """Delete the drained spool and its offset file"""
+        self.close()
+        for path in (self.path, self.offset_path):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def _rejected(status):
+    """Whether the backend refused a batch itself; timeouts and rate limits are worth retrying"""
+    return status is not None and 400 <= status < 500 and status not in (408, 429)
+
+
+class DeliverySpool:
+    """Durable per-meeting spool for failed or overflowing backend deliveries.
+
+    Appends are buffered writes fsync'd in batches off the event loop. A
+    background replayer drains every spool in the directory (including ones
+    left behind by a previous worker) with exponential backoff and a bounded
+    number of meetings replaying at once. `send_batch(meeting_id, batch)`
+    returns the backend's HTTP status, or None if the backend was not reached.
+    Unreachable backends and server errors are retried for as long as they
+    last; only a record the backend rejects (4xx) `max_attempts` times is
+    moved to a dead-letter file.
+    """
+
+    def __init__(self, send_batch, directory=None):
+        self._send_batch = send_batch
+        self.directory = directory or os.getenv("SPOOL_DIR", "spool")
+        self.fsync_interval = float(os.getenv("SPOOL_FSYNC_INTERVAL_MS", "200")) / 1000
+        self.replay_concurrency = int(os.getenv("SPOOL_REPLAY_CONCURRENCY", "2"))
+        self.replay_batch = int(os.getenv("SPOOL_REPLAY_BATCH", "16"))
+        self.scan_interval = float(os.getenv("SPOOL_SCAN_INTERVAL_SECONDS", "5"))
+        self.initial_backoff = float(os.getenv("SPOOL_REPLAY_BACKOFF_INITIAL_SECONDS", "1"))
+        self.max_backoff = float(os.getenv("SPOOL_REPLAY_BACKOFF_MAX_SECONDS", "60"))
+        self.max_attempts = int(os.getenv("SPOOL_REPLAY_MAX_ATTEMPTS", "10"))
+        self.lock_stale_after = float(os.getenv("SPOOL_LOCK_STALE_SECONDS", "60"))
+
+        self._spools = {}
+        self._replaying = {}
+        self._semaphore = None
+        self._tasks = set()
+        self._wakeup = None
+        self._started = False
+
+        # Spool statistics
+        self.records_spooled = 0
+        self.records_replayed = 0
+        self.records_dead = 0
+
+    def _spool_for(self, name):
+        spool = self._spools.get(name)
+        if spool is None:
+            spool = TranscriptionSpool(os.path.join(self.directory, f"{name}.spool"))
+            self._spools[name] = spool
+        return spool
+
+    @staticmethod
+    def _file_name(meeting_id):
+        return re.sub(r"[^A-Za-z0-9_-]", "_", str(meeting_id))
+
+    def start(self):
+        """Start the fsync and replay loops (idempotent)"""
+        if self._started:
+            return
+        self._started = True
+        os.makedirs(self.directory, exist_ok=True)
+        self._semaphore = asyncio.Semaphore(self.replay_concurrency)
+        self._wakeup = asyncio.Event()
+        for coro in (self._fsync_loop(), self._scan_loop()):
+            task = asyncio.create_task(coro)
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    def append(self, meeting_id, transcription_batch):
+        """Spool a batch that could not be delivered; never blocks on fsync"""
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            spool = self._spool_for(self._file_name(meeting_id))
+            if not spool.try_lock(self.lock_stale_after):
+                # Another live worker owns this meeting's spool; use a per-process file instead
+                spool = self._spool_for(f"{self._file_name(meeting_id)}.{os.getpid()}")
+                spool.try_lock(self.lock_stale_after)
+            spool.append({"meeting_id": meeting_id, "transcription_data": transcription_batch})
+            self.records_spooled += 1
+        except OSError as e:
+            logger.error(f"[ERROR] Failed to spool transcriptions for meeting {meeting_id}: {e}")
+            return
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _fsync_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.fsync_interval)
+            for spool in list(self._spools.values()):
+                # One failing spool must not end the loop; other workers would take over live spools
+                try:
+                    spool.touch_lock()
+                    if spool.dirty:
+                        await loop.run_in_executor(None, spool.sync)
+                except Exception as e:
+                    logger.error(f"[ERROR] Failed to fsync spool {spool.path}: {e!r}")
+
+    async def _scan_loop(self):
+        while True:
+            self._scan()
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.scan_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def _scan(self):
+        """Start a replay task for every spool with undelivered records"""
+        try:
+            names = [f[:-len(".spool")] for f in os.listdir(self.directory) if f.endswith(".spool")]
+        except OSError:
+            return
+        for name in names:
+            if name in self._replaying:
+                continue
+            spool = self._spool_for(name)
+            if not spool.try_lock(self.lock_stale_after):
+                continue
+            if spool.size() <= spool.committed_offset():
+                # Nothing to replay; let other workers have it (append claims it again)
+                spool.unlock()
+                self._spools.pop(name, None)
+                continue
+            task = asyncio.create_task(self._replay(name, spool))
+            self._replaying[name] = task
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+            task.add_done_callback(lambda _, name=name: self._replaying.pop(name, None))
+
+    async def _replay(self, name, spool):
+        loop = asyncio.get_running_loop()
+        backoff = self.initial_backoff
+        async with self._semaphore:
+            offset = spool.committed_offset()
+            while True:
+                records = await loop.run_in_executor(None, spool.read_records, offset, self.replay_batch)
+                if not records:
+                    # Drained: remove the files unless new records arrived meanwhile
+                    if spool.size() <= offset:
+                        spool.remove()
+                        if "." in name:
+                            spool.unlock()
+                            self._spools.pop(name, None)
+                        logger.info(f"[SUCCESS] Spool {name} fully replayed")
+                    return
+
+                for end_offset, record in records:
+                    rejections = 0
+                    while record is not None:
+                        status = await self._send_batch(record["meeting_id"], record["transcription_data"])
+                        if status == 200:
+                            self.records_replayed += 1
+                            backoff = self.initial_backoff
+                            break
+                        if _rejected(status):
+                            rejections += 1
+                        if rejections >= self.max_attempts:
+                            await loop.run_in_executor(None, spool.dead_letter, record)
+                            self.records_dead += 1
+                            logger.error(f"[ERROR] Spool record for meeting {record['meeting_id']} still rejected "
+                                         f"after {rejections} attempts, moved to the dead-letter file of {name}")
+                            break
+                        delay = backoff * (0.5 + random.random() / 2)
+                        logger.warning(f"Spool replay for {name} failed, retrying in {delay:.1f}s")
+                        await asyncio.sleep(delay)
+                        backoff = min(backoff * 2, self.max_backoff)
+                    offset = end_offset
+                await loop.run_in_executor(None, spool.commit, offset)
+
+    async def aclose(self):
+        """Stop replaying, fsync pending appends and release spool locks"""
+        for task in list(self._tasks):
+            task.cancel()
+        if self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
+        for spool in self._spools.values():
+            try:
+                spool.unlock()
+            except OSError as e:
+                logger.error(f"[ERROR] Failed to close spool {spool.path}: {e}")
+        self._spools.clear()
+        self._started = False
@@ -0,0 +1,127 @@
+import os
+import asyncio
+import logging
+from collections import deque
+
+import aiohttp
+from livekit.plugins import deepgram
+
+from prewarm import PrewarmedResolver
+
+logger = logging.getLogger("transcription-agent")
+
+
+def deepgram_stt(model, http_session):
+    return deepgram.STT(model=model, http_session=http_session)
+
+
+class STTStreamPool:
+    """One shared STT client per worker process plus a few pre-opened streams.
+
+    A Deepgram stream opens its websocket as soon as it is created, so handing
+    out a stream from the pool skips the handshake when a track is subscribed.
+    The pool refills itself right after each hand-out. Deepgram bills open
+    sockets, so a background reaper closes streams that sat idle for
+    `max_idle` seconds; the pool only refills on the next hand-out.
+    `factory(model, http_session)` creates the client; it defaults to Deepgram.
+    """
+
+    def __init__(self, size=None, max_idle=None, model=None, factory=None, api_key_env="DEEPGRAM_API_KEY"):
+        self.size = size if size is not None else int(os.getenv("STT_POOL_SIZE", "2"))
+        self.max_idle = max_idle if max_idle is not None else float(os.getenv("STT_POOL_MAX_IDLE_SECONDS", "300"))
+        self.model = model or os.getenv("STT_MODEL", "nova-2")
+        self.factory = factory or deepgram_stt
+        self.api_key_env = api_key_env
+
+        self._stt = None
+        self._http_session = None
+        self._idle = deque()
+        self._closing = set()
+        self._reaper = None
+
+        # Pool statistics
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+
+    def get_stt(self):
+        """Return the shared STT client, creating it (and its HTTP session) on first use"""
+        if self._stt is None:
+            if self._http_session is None or self._http_session.closed:
+                self._http_session = aiohttp.ClientSession(
+                    connector=aiohttp.TCPConnector(resolver=PrewarmedResolver()))
+            self._stt = self.factory(self.model, self._http_session)
+        return self._stt
+
+    def start(self):
+        """Open streams until the pool is full"""
+        if self.api_key_env and not os.getenv(self.api_key_env):
+            return
+        loop = asyncio.get_running_loop()
+        while len(self._idle) < self.size:
+            self._idle.append((loop.time(), self.get_stt().stream()))
+        if self._idle and self.max_idle > 0 and (self._reaper is None or self._reaper.done()):
+            self._reaper = asyncio.create_task(self._reap())
+
+    async def _reap(self):
+        """Close idle streams once they are older than `max_idle`; ends when the pool is empty"""
+        loop = asyncio.get_running_loop()
+        while self._idle:
+            created_at, stream = self._idle[0]
+            wait = created_at + self.max_idle - loop.time()
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+            self._idle.popleft()
+            self.expired += 1
+            self._discard(stream)
+            logger.debug(f"Closed an STT stream idle for more than {self.max_idle:.0f}s")
+
+    def acquire(self):
+        """Hand out a pre-opened stream (or a new one if the pool is empty) and refill"""
+        loop = asyncio.get_running_loop()
+        stream = None
+        while self._idle:
+            created_at, candidate = self._idle.popleft()
+            if loop.time() - created_at > self.max_idle or self._is_dead(candidate):
+                self._discard(candidate)
+                continue
+            stream = candidate
+            break
+
+        if stream is not None:
+            self.hits += 1
+        else:
+            self.misses += 1
+            stream = self.get_stt().stream()
+
+        self.start()
+        return stream
+
+    @staticmethod
+    def _is_dead(stream):
+        # The stream's main task ends when its connection gave up for good
+        task = getattr(stream, "_task", None)
+        return task is not None and task.done()
+
+    def _discard(self, stream):
+        task = asyncio.create_task(stream.aclose())
+        self._closing.add(task)
+        task.add_done_callback(self._closing.discard)
+
+    async def aclose(self):
+        """Close idle streams, the shared client and its HTTP session"""
+        if self._reaper is not None:
+            self._reaper.cancel()
+            self._reaper = None
+        while self._idle:
+            _, stream = self._idle.popleft()
+            self._discard(stream)
+        if self._closing:
+            await asyncio.gather(*list(self._closing), return_exceptions=True)
+        if self._stt is not None:
+            await self._stt.aclose()
+            self._stt = None
+        if self._http_session is not None and not self._http_session.closed:
+            await self._http_session.close()
+        self._http_session = None
@@ -0,0 +1,438 @@
+"""Routing of tracks across STT provider configurations.
+
+STT_PROVIDERS lists the options as `provider:model` (default
+`deepgram:<STT_MODEL>`); providers are registered with `register_provider`.
+Every option has its own stream pool. Streams handed out are wrapped so the
+option's first-interim and finalization latency (from pushing the audio an
+event covers to receiving the event) is recorded over a rolling window.
+
+A new track goes to the healthy option with the lowest median finalization
+latency. Options with too few recent samples are tried first, so every
+option is measured and one that was slow gets probed again once its samples
+age out. A stream failure takes its option out of rotation for
+STT_ROUTER_COOLDOWN_SECONDS. With STT_HEDGE, a track is transcribed by the
+two best options (or two sessions of the only one) at once, and each
+utterance is taken from whichever stream finalizes it first.
+
+The latency windows are shared by the jobs on a host through
+STT_ROUTER_STATE_FILE (default `<LOAD_STATE_DIR>/stt_router.json`): every
+router merges its samples with the file's every STT_ROUTER_SYNC_SECONDS and
+when it closes, so a new meeting starts with what earlier ones measured.
+"""
+import os
+import json
+import time
+import asyncio
+import logging
+import threading
+import statistics
+from collections import deque
+
+from livekit.agents import stt as lk_stt
+
+import metrics
+from frame_queue import stt_backlog, stt_drained
+from stt_pool import STTStreamPool, deepgram_stt
+
+logger = logging.getLogger("transcription-agent")
+
+FIRST_INTERIM = "first_interim"
+FINAL = "final"
+
+# Two finals overlap (the same speech finalized by both hedged streams) if the
+# later one starts this much before the earlier one ends
+OVERLAP_SLACK = 0.2
+
+
+def _state_file():
+    path = os.getenv("STT_ROUTER_STATE_FILE", "")
+    if path.lower() == "off":
+        return ""
+    return path or os.path.join(os.getenv("LOAD_STATE_DIR", "load_state"), "stt_router.json")
+
+
+# name -> (factory(model, http_session), environment variable holding its API key)
+_providers = {}
+
+
+def register_provider(name, factory, api_key_env=None):
+    """Make `factory(model, http_session)`, returning a livekit STT client, available as `name`"""
+    _providers[name] = (factory, api_key_env)
+
+
+register_provider("deepgram", deepgram_stt, api_key_env="DEEPGRAM_API_KEY")
+
+
+def parse_options(spec=None):
+    """[(provider, model)] from STT_PROVIDERS, e.g. `deepgram:nova-2,deepgram:nova-3`"""
+    spec = spec if spec is not None else os.getenv("STT_PROVIDERS", "")
+    options = []
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        provider, _, model = item.partition(":")
+        options.append((provider, model or os.getenv("STT_MODEL", "nova-2")))
+    return options or [("deepgram", os.getenv("STT_MODEL", "nova-2"))]
+
+
+def missing_credentials(options=None):
+    """API key variables that are unset, if none of the options has its key"""
+    options = options if options is not None else parse_options()
+    keys = [_providers[provider][1] for provider, _ in options if provider in _providers]
+    missing = [key for key in keys if key and not os.getenv(key)]
+    return sorted(set(missing)) if len(missing) == len(keys) else []
+
+
+class LatencyWindow:
+    """Latency samples of the last `max_age` seconds (at most `size` of them)"""
+
+    def __init__(self, size=50, max_age=300.0):
+        self.max_age = max_age
+        self._samples = deque(maxlen=size)
+
+    def add(self, latency, at=None):
+        self._samples.append((time.time() if at is None else at, latency))
+
+    def _prune(self):
+        cutoff = time.time() - self.max_age
+        while self._samples and self._samples[0][0] < cutoff:
+            self._samples.popleft()
+
+    def __len__(self):
+        self._prune()
+        return len(self._samples)
+
+    def median(self):
+        self._prune()
+        return statistics.median(latency for _, latency in self._samples) if self._samples else None
+
+    def dump(self):
+        self._prune()
+        return [list(sample) for sample in self._samples]
+
+    def merge(self, samples):
+        """Add `[at, latency]` samples (e.g. another process's `dump()`) that are not here yet"""
+        merged = set(self._samples) | {(at, latency) for at, latency in samples}
+        self._samples.clear()
+        self._samples.extend(sorted(merged))
+        self._prune()
+
+
+class ProviderOption:
+    """One provider/model configuration: its stream pool, latency windows and health"""
+
+    def __init__(self, provider, model, pool, window=20, max_age=300.0, cooldown=30.0):
+        self.provider = provider
+        self.model = model
+        self.key = f"{provider}:{model}"
+        self.pool = pool
+        self.cooldown = cooldown
+        self.latency = {FIRST_INTERIM: LatencyWindow(window, max_age), FINAL: LatencyWindow(window, max_age)}
+        self.unhealthy_until = 0.0
+        self.routed = 0
+        self.failures = 0
+
+    def observe(self, kind, latency):
+        self.latency[kind].add(latency)
+        metrics.STT_PROVIDER_LATENCY.labels(self.key, kind).observe(latency)
+
+    def failed(self):
+        self.failures += 1
+        self.unhealthy_until = time.monotonic() + self.cooldown
+        metrics.STT_PROVIDER_FAILURES.labels(self.key).inc()
+
+    def healthy(self, now=None):
+        return (now if now is not None else time.monotonic()) >= self.unhealthy_until
+
+    @property
+    def samples(self):
+        return len(self.latency[FINAL])
+
+    def score(self):
+        """Median finalization latency, then median first-interim latency, in seconds"""
+        return self.latency[FINAL].median() or 0.0, self.latency[FIRST_INTERIM].median() or 0.0
+
+
+class RoutedStream:
+    """An STT stream of one option that reports its latencies and failures"""
+
+    def __init__(self, option, stream):
+        self.option = option
+        self.stream = stream
+        self._clock = metrics.PushClock()
+        self._in_utterance = False
+        self._failed = False
+
+    def _fail(self):
+        if not self._failed:
+            self._failed = True
+            self.option.failed()
+
+    def push_frame(self, frame):
+        try:
+            self.stream.push_frame(frame)
+        except Exception:
+            self._fail()
+            raise
+        self._clock.pushed(frame)
+
+    def end_input(self):
+        self.stream.end_input()
+
+    def backlog(self):
+        return stt_backlog(self.stream)
+
+    def drained(self):
+        return stt_drained(self.stream)
+
+    async def aclose(self):
+        await self.stream.aclose()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            event = await self.stream.__anext__()
+        except StopAsyncIteration:
+            raise
+        except Exception:
+            self._fail()
+            raise
+        if event.type in (lk_stt.SpeechEventType.INTERIM_TRANSCRIPT, lk_stt.SpeechEventType.FINAL_TRANSCRIPT):
+            self._observe(event)
+        return event
+
+    def _observe(self, event):
+        final = event.type == lk_stt.SpeechEventType.FINAL_TRANSCRIPT
+        end_time = event.alternatives[0].end_time
+        pushed_at = self._clock.pushed_at(end_time) if end_time > 0 else None
+        if pushed_at is not None:
+            latency = time.monotonic() - pushed_at
+            if final:
+                self.option.observe(FINAL, latency)
+            elif not self._in_utterance:
+                self.option.observe(FIRST_INTERIM, latency)
+        self._in_utterance = not final
+
+
+class HedgedStream:
+    """Two streams fed the same audio, merged into one stream of events.
+
+    A final is kept if it is the first to cover its stretch of audio; the
+    other stream's final for the same speech is dropped. Interims are kept
+    when they reach further into the audio than the last one kept. If one
+    stream fails the other carries on alone.
+    """
+
+    def __init__(self, streams):
+        self.streams = list(streams)
+        self._live = list(self.streams)
+        self._events = asyncio.Queue()
+        self._readers = None
+        self._final_end = 0.0
+        self._interim_end = 0.0
+
+        # Hedging statistics
+        self.wins = {}
+        self.dropped = 0
+
+    def push_frame(self, frame):
+        for stream in list(self._live):
+            try:
+                stream.push_frame(frame)
+            except Exception as e:
+                logger.warning(f"Hedged STT stream of {stream.option.key} failed: {e!r}")
+                self._live.remove(stream)
+        if not self._live:
+            raise RuntimeError("all hedged STT streams failed")
+
+    def end_input(self):
+        for stream in self._live:
+            stream.end_input()
+
+    def backlog(self):
+        return max((stream.backlog() for stream in self._live), default=0)
+
+    def drained(self):
+        # The backlog is the largest one, so wait for that stream
+        if not self._live:
+            return None
+        return max(self._live, key=lambda stream: stream.backlog()).drained()
+
+    async def aclose(self):
+        if self._readers is not None:
+            for reader in self._readers:
+                reader.cancel()
+            await asyncio.gather(*self._readers, return_exceptions=True)
+        await asyncio.gather(*(stream.aclose() for stream in self.streams), return_exceptions=True)
+
+    async def _read(self, stream):
+        try:
+            async for event in stream:
+                self._events.put_nowait((stream, event))
+            self._events.put_nowait((stream, None))
+        except Exception as e:
+            self._events.put_nowait((stream, e))
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self._readers is None:
+            self._readers = [asyncio.create_task(self._read(stream)) for stream in self.streams]
+        while True:
+            if not self._live:
+                raise StopAsyncIteration
+            stream, item = await self._events.get()
+            if item is None or isinstance(item, Exception):
+                if stream in self._live:
+                    self._live.remove(stream)
+                if isinstance(item, Exception):
+                    logger.warning(f"Hedged STT stream of {stream.option.key} failed: {item!r}")
+                    if not self._live:
+                        raise item
+                continue
+            if self._keep(stream, item):
+                return item
+
+    def _keep(self, stream, event):
+        if event.type not in (lk_stt.SpeechEventType.INTERIM_TRANSCRIPT, lk_stt.SpeechEventType.FINAL_TRANSCRIPT):
+            return stream is self.streams[0]
+        alternative = event.alternatives[0]
+        if alternative.start_time < self._final_end - OVERLAP_SLACK:
+            if event.type == lk_stt.SpeechEventType.FINAL_TRANSCRIPT:
+                self.dropped += 1
+            return False  # Speech the other stream already finalized
+        if event.type == lk_stt.SpeechEventType.FINAL_TRANSCRIPT:
+            self._final_end = max(self._final_end, alternative.end_time)
+            self._interim_end = self._final_end
+            self.wins[stream.option.key] = self.wins.get(stream.option.key, 0) + 1
+            metrics.STT_HEDGE_WINS.labels(stream.option.key).inc()
+            return True
+        if alternative.end_time <= self._interim_end:
+            return False
+        self._interim_end = alternative.end_time
+        return True
+
+
+class STTRouter:
+    """Hands out STT streams for new tracks from the fastest healthy provider option"""
+
+    def __init__(self, options=None, hedge=None, min_samples=None, window=None, max_age=None, cooldown=None,
+                 state_file=None, sync_interval=None, pool_factory=None):
+        self.hedge = hedge if hedge is not None else os.getenv("STT_HEDGE", "false").lower() in ("1", "true", "yes")
+        self.min_samples = min_samples if min_samples is not None else int(os.getenv("STT_ROUTER_MIN_SAMPLES", "3"))
+        window = window or int(os.getenv("STT_ROUTER_WINDOW", "20"))
+        max_age = max_age or float(os.getenv("STT_ROUTER_MAX_AGE_SECONDS", "300"))
+        cooldown = cooldown if cooldown is not None else float(os.getenv("STT_ROUTER_COOLDOWN_SECONDS", "30"))
+        self.state_file = state_file if state_file is not None else _state_file()
+        self.sync_interval = sync_interval or float(os.getenv("STT_ROUTER_SYNC_SECONDS", "10"))
+        pool_factory = pool_factory or self._pool
+
+        self.options = [
+            ProviderOption(provider, model, pool_factory(provider, model), window, max_age, cooldown)
+            for provider, model in (options if options is not None else parse_options())
+        ]
+        self._sync_task = None
+        if self.shared:
+            self._merge(self._read())
+
+    @staticmethod
+    def _pool(provider, model):
+        if provider not in _providers:
+            raise ValueError(f"unknown STT provider {provider!r} (registered: {', '.join(_providers)})")
+        factory, api_key_env = _providers[provider]
+        return STTStreamPool(model=model, factory=factory, api_key_env=api_key_env)
+
+    def missing_credentials(self):
+        return missing_credentials([(option.provider, option.model) for option in self.options])
+
+    def choose(self, count=1):
+        """The `count` options new tracks should use, best first"""
+        now = time.monotonic()
+        healthy = [option for option in self.options if option.healthy(now)]
+        if not healthy:
+            # Everything failed recently; use whatever recovers first
+            healthy = sorted(self.options, key=lambda option: option.unhealthy_until)[:1]
+        unmeasured = sorted((o for o in healthy if o.samples < self.min_samples), key=lambda o: o.routed)
+        measured = sorted((o for o in healthy if o.samples >= self.min_samples), key=lambda o: o.score())
+        ranked = unmeasured + measured
+        chosen = ranked[:count]
+        while len(chosen) < count:
+            chosen.append(chosen[0])  # Hedge across two sessions of the same option
+        return chosen
+
+    def _stream(self, option):
+        option.routed += 1
+        metrics.STT_ROUTED.labels(option.key).inc()
+        return RoutedStream(option, option.pool.acquire())
+
+    @property
+    def shared(self):
+        return bool(self.state_file) and len(self.options) > 1
+
+    def start(self):
+        """Pre-open streams of the options new tracks will use first"""
+        for option in self.choose(2 if self.hedge else 1):
+            option.pool.start()
+        if self.shared and self._sync_task is None:
+            self._sync_task = asyncio.create_task(self._sync_loop(), name="stt-router-sync")
+
+    def acquire(self):
+        """A stream for a new track (or a track whose stream failed)"""
+        if not self.hedge:
+            return self._stream(self.choose(1)[0])
+        return HedgedStream([self._stream(option) for option in self.choose(2)])
+
+    def _read(self):
+        try:
+            with open(self.state_file, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _merge(self, state):
+        for option in self.options:
+            for kind, samples in state.get(option.key, {}).items():
+                if kind in option.latency:
+                    option.latency[kind].merge(samples)
+
+    async def sync(self):
+        """Merge the latency samples with the state file's and write the result back.
+
+        Jobs sync without a lock: when two write at once one's new samples are
+        lost from the file, and it adds them again on its next sync.
+        """
+        state = await asyncio.to_thread(self._read)
+        self._merge(state)
+        state.update({option.key: {kind: window.dump() for kind, window in option.latency.items()}
+                      for option in self.options})
+        await asyncio.to_thread(self._write, state)
+
+    def _write(self, state):
+        tmp_path = f"{self.state_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.state_file)), exist_ok=True)
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(state, f)
+            os.replace(tmp_path, self.state_file)
+        except OSError as e:
+            logger.warning(f"Could not save STT latency state: {e}")
+
+    async def _sync_loop(self):
+        while True:
+            await asyncio.sleep(self.sync_interval)
+            await self.sync()
+
+    async def aclose(self):
+        """Close every option's pool and keep the latency samples for the next job"""
+        if self._sync_task is not None:
+            self._sync_task.cancel()
+            await asyncio.gather(self._sync_task, return_exceptions=True)
+            self._sync_task = None
+        if self.shared:
+            await self.sync()
+        for option in self.options:
+            await option.pool.aclose()
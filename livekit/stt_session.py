@@ -0,0 +1,264 @@
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+
+import metrics
+from audio_ring import AudioRingBuffer
+
+logger = logging.getLogger("transcription-agent")
+
+MUTED = "muted"
+SILENCE = "silence"
+FAILED = "failed"
+
+
+class TrackSTTSession:
+    """The upstream STT stream of one track, open only while the track needs one.
+
+    The stream is ended when the track is muted, and (with VAD) once no speech
+    has been heard for STT_SUSPEND_AFTER_SILENCE_SECONDS. An ended stream still
+    delivers the final of the utterance in progress before it is closed. A new
+    stream, pre-opened by the pool, takes over as soon as the track is unmuted
+    or speech returns. `consume(stream)` is run as a task for every stream and
+    forwards its events.
+
+    A stream that fails (its events end or raise, or `push_frame` raises) is
+    replaced in the background, with backoff if failures repeat. The last
+    STT_FAILOVER_BUFFER_SECONDS of pushed audio are kept in a ring buffer, and
+    the audio after the end of the last final is replayed into the new stream,
+    so the utterance in progress is transcribed again from its start. Events
+    that end before that point are dropped by `accept_event`, so nothing is
+    delivered twice across the handover.
+    """
+
+    def __init__(self, acquire, consume, suspend_after=None, name="stt", track_task=None,
+                 on_push=None, stopping=None):
+        self._acquire = acquire
+        self._consume = consume
+        self._track_task = track_task
+        self._on_push = on_push
+        self._stopping = stopping
+        self.suspend_after = suspend_after if suspend_after is not None \
+            else float(os.getenv("STT_SUSPEND_AFTER_SILENCE_SECONDS", "0"))
+        self.name = name
+
+        self.stream = None
+        self.task = None
+        self.muted = False
+        self.suspended = None
+        self._last_speech_at = time.monotonic()
+        self._speech_returned = False
+        self._watcher = None
+        self._finishing = set()
+        self._abort = asyncio.Event()
+        self._closing = False
+
+        # Failover: recent audio, seconds of audio pushed so far, where each
+        # stream's time 0 lies on that timeline, and the end of the last final
+        self.ring = AudioRingBuffer()
+        self._pushed_time = 0.0
+        self._origins = {}
+        self._final_end = 0.0
+        self._failures = deque()
+        self._recovery = None
+
+        # Lifecycle statistics
+        self.suspensions = 0
+        self.resumes = 0
+        self.failovers = 0
+
+    def open(self, origin=None):
+        """Acquire a stream and start forwarding its events"""
+        stream = self._acquire()
+        self._origins[stream] = self._pushed_time if origin is None else origin
+        self.stream = stream
+        self.task = asyncio.create_task(self._consume(stream), name=self.name)
+        self.task.add_done_callback(lambda task: self._consume_done(stream, task))
+        if self._track_task is not None:
+            self._track_task(self.task)
+        self.suspended = None
+        metrics.STT_OPEN_STREAMS.inc()
+        if self.suspend_after > 0 and self._watcher is None:
+            self._watcher = asyncio.create_task(self._watch_silence())
+        return self.stream
+
+    def _resume(self, reason):
+        self.open()
+        self.resumes += 1
+        metrics.STT_RESUMES.labels(reason).inc()
+
+    def suspend(self, reason):
+        """End the current stream in the background; frames are dropped until it is resumed"""
+        if self.stream is None:
+            return
+        stream, task = self.stream, self.task
+        self.stream = self.task = None
+        self.suspended = reason
+        self.suspensions += 1
+        metrics.STT_SUSPENSIONS.labels(reason).inc()
+        self._finish_later(stream, task)
+
+    def _finish_later(self, stream, task, timeout=5.0):
+        finishing = asyncio.create_task(self._finish(stream, task, timeout))
+        self._finishing.add(finishing)
+        finishing.add_done_callback(self._finishing.discard)
+
+    async def _finish(self, stream, task, timeout=5.0):
+        """Let an ended stream deliver its last transcripts (until `timeout` or an abort), then close it"""
+        try:
+            stream.end_input()
+            if timeout > 0:
+                abort = asyncio.create_task(self._abort.wait())
+                await asyncio.wait([task, abort], timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                abort.cancel()
+        except Exception as e:
+            logger.warning(f"Error ending STT stream of {self.name}: {e}")
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        try:
+            await stream.aclose()
+        finally:
+            self._origins.pop(stream, None)
+            metrics.STT_OPEN_STREAMS.dec()
+
+    def push(self, frame):
+        """Push a frame to the current stream and keep it for replay after a failover"""
+        self.ring.write(frame)
+        self._pushed_time += frame.samples_per_channel / frame.sample_rate
+        stream = self.stream
+        if stream is None:
+            return  # Failed; the frame is replayed into the replacement stream
+        try:
+            stream.push_frame(frame)
+        except Exception as e:
+            self._failed(stream, e)
+            return
+        if self._on_push is not None:
+            self._on_push(stream, frame)
+
+    def origin(self, stream):
+        """Seconds of track audio pushed before `stream`'s time 0"""
+        return self._origins.get(stream, 0.0)
+
+    def accept_event(self, stream, final, end_time):
+        """Whether an event of `stream` is new; a replacement stream repeats audio that was already transcribed"""
+        origin = self._origins.get(stream)
+        if origin is None or end_time <= 0:
+            return True
+        end = origin + end_time
+        if end <= self._final_end:
+            return False
+        if final:
+            self._final_end = end
+        return True
+
+    def _consume_done(self, stream, task):
+        if task.cancelled() or stream is not self.stream:
+            return  # Suspended or closed by the session
+        if self._stopping is not None and self._stopping():
+            return
+        error = task.exception()
+        self._failed(stream, error if error is not None else "stream ended")
+
+    def _failed(self, stream, error):
+        if stream is not self.stream or self._closing:
+            return
+        task = self.task
+        self.stream = self.task = None
+        self.suspended = FAILED
+        self.failovers += 1
+        metrics.STT_FAILOVERS.inc()
+        logger.warning(f"STT stream of {self.name} failed ({error}), opening a new one")
+        self._finish_later(stream, task, timeout=0)
+        if self._recovery is None:
+            self._recovery = asyncio.create_task(self._recover())
+
+    async def _recover(self):
+        """Open a replacement stream and replay the audio since the last final into it"""
+        try:
+            while not self._closing:
+                # The first failure is retried at once; repeated ones back off
+                now = time.monotonic()
+                self._failures.append(now)
+                while self._failures and now - self._failures[0] > 60:
+                    self._failures.popleft()
+                if len(self._failures) > 1:
+                    await asyncio.sleep(min(0.5 * 2 ** (len(self._failures) - 2), 10.0))
+                if self._closing or self.suspended != FAILED:
+                    return
+                if self.muted:
+                    self.suspended = MUTED  # Unmuting opens a fresh stream
+                    return
+                replay = min(self.ring.duration, max(0.0, self._pushed_time - self._final_end))
+                try:
+                    stream = self.open(origin=self._pushed_time - replay)
+                    frames = self.ring.frames(replay)
+                    for frame in frames:
+                        stream.push_frame(frame)
+                        if self._on_push is not None:
+                            self._on_push(stream, frame)
+                except Exception as e:
+                    logger.error(f"[ERROR] Failed to replace the STT stream of {self.name}: {e}")
+                    if self.stream is not None:
+                        stream, task = self.stream, self.task
+                        self.stream = self.task = None
+                        self.suspended = FAILED
+                        self._finish_later(stream, task, timeout=0)
+                    continue
+                logger.info(f"[SUCCESS] STT stream of {self.name} replaced, {replay:.1f}s of audio replayed")
+                return
+        finally:
+            self._recovery = None
+
+    def set_muted(self, muted):
+        self.muted = muted
+        if muted:
+            self.suspend(MUTED)
+        elif self.stream is None:
+            self._resume(MUTED)
+
+    def speech_seen(self):
+        """Called for every speech frame at ingest; wakes a stream suspended for silence"""
+        self._last_speech_at = time.monotonic()
+        if self.suspended == SILENCE:
+            self._speech_returned = True
+
+    def accepts_audio(self):
+        """Whether the next frame should be pushed, reopening the stream if speech has returned"""
+        if self.muted:
+            return False
+        if self.suspended == FAILED:
+            return True  # Kept for the replacement stream
+        if self.stream is None:
+            if self.suspended != SILENCE or not self._speech_returned:
+                return False
+            self._speech_returned = False
+            self._resume(SILENCE)
+        return True
+
+    async def _watch_silence(self):
+        while True:
+            await asyncio.sleep(min(1.0, self.suspend_after / 2))
+            if self.stream is not None and time.monotonic() - self._last_speech_at >= self.suspend_after:
+                self.suspend(SILENCE)
+
+    async def aclose(self, graceful=True):
+        """Close the session; `graceful` waits for the last transcripts, otherwise tear down at once"""
+        self._closing = True
+        if self._recovery is not None:
+            self._recovery.cancel()
+            await asyncio.gather(self._recovery, return_exceptions=True)
+        if self._watcher is not None:
+            self._watcher.cancel()
+            await asyncio.gather(self._watcher, return_exceptions=True)
+            self._watcher = None
+        if self.stream is not None:
+            stream, task = self.stream, self.task
+            self.stream = self.task = None
+            await self._finish(stream, task, timeout=5.0 if graceful else 0)
+        if self._finishing:
+            if not graceful:
+                self._abort.set()
+            await asyncio.gather(*list(self._finishing), return_exceptions=True)
@@ -0,0 +1,90 @@
+import asyncio
+
+from coalescer import InterimCoalescer, TranscriptSegments
+
+
+def payload(kind, text):
+    return {"type": kind, "text": text, "participant": "alice", "trackSid": "TR_A"}
+
+
+def make_coalescer(room_max_rate=0, backend_max_rate=0):
+    room, backend = [], []
+
+    async def send_room(p):
+        room.append(p["text"])
+
+    async def send_backend(p):
+        backend.append(p["text"])
+
+    return InterimCoalescer(send_room, send_backend, room_max_rate, backend_max_rate), room, backend
+
+
+def test_unchanged_interims_are_dropped():
+    async def run():
+        coalescer, room, backend = make_coalescer()
+        for text in ["hello", "hello", "hel", "hello world", " hello world "]:
+            await coalescer.interim(payload("interim", text))
+        await coalescer.final(payload("final", "hello world"))
+        # A new utterance may repeat the previous one's text
+        await coalescer.interim(payload("interim", "hello"))
+        return coalescer, room, backend
+
+    coalescer, room, backend = asyncio.run(run())
+    assert room == backend == ["hello", "hello world", "hello world", "hello"]
+    assert coalescer.duplicates_dropped == 3
+
+
+def test_throttled_interims_keep_the_latest_and_flush_before_the_final():
+    async def run():
+        coalescer, room, backend = make_coalescer(room_max_rate=10, backend_max_rate=1)
+        for text in ["a", "a b", "a b c"]:
+            await coalescer.interim(payload("interim", text))
+        await asyncio.sleep(0.15)
+        room_before_final = list(room)
+        await coalescer.final(payload("final", "a b c d"))
+        await coalescer.aclose()
+        return room_before_final, room, backend
+
+    room_before_final, room, backend = asyncio.run(run())
+    assert room_before_final == ["a", "a b c"]
+    assert room == ["a", "a b c", "a b c d"]
+    assert backend == ["a", "a b c", "a b c d"]
+
+
+def test_segments_number_the_updates_of_each_utterance():
+    segments = TranscriptSegments("alice_1")
+    stream = object()
+
+    first = [segments.next(stream, final=False), segments.next(stream, final=False), segments.next(stream, final=True)]
+    second = segments.next(stream, final=False)
+
+    assert first == [{"segmentId": "alice_1_1", "seq": 0}, {"segmentId": "alice_1_1", "seq": 1},
+                     {"segmentId": "alice_1_1", "seq": 2}]
+    assert second == {"segmentId": "alice_1_2", "seq": 0}
+
+
+def test_new_stream_after_failover_starts_its_own_segment():
+    segments = TranscriptSegments("alice_1")
+    failed, replacement = object(), object()
+
+    old = [segments.next(failed, final=False), segments.next(failed, final=False)]
+    segments.release(failed)
+    new = [segments.next(replacement, final=False), segments.next(replacement, final=True)]
+
+    assert {fields["segmentId"] for fields in old}.isdisjoint(fields["segmentId"] for fields in new)
+    assert [fields["seq"] for fields in new] == [0, 1]
+
+
+def test_draining_stream_keeps_its_segment_while_the_next_one_starts():
+    segments = TranscriptSegments("alice_1")
+    suspended, resumed = object(), object()
+
+    interim = segments.next(suspended, final=False)
+    # The resumed stream's interims arrive before the suspended stream's last final
+    new_interim = segments.next(resumed, final=False)
+    old_final = segments.next(suspended, final=True)
+    new_final = segments.next(resumed, final=True)
+
+    assert old_final == {"segmentId": interim["segmentId"], "seq": 1}
+    assert new_final == {"segmentId": new_interim["segmentId"], "seq": 1}
+    assert interim["segmentId"] != new_interim["segmentId"]
@@ -0,0 +1,120 @@
+import asyncio
+import collections
+
+from livekit.agents.utils import aio
+
+from frame_queue import FrameQueue, stt_drained
+from stt_router import ProviderOption, RoutedStream, HedgedStream
+
+FRAME = b"\0" * 320
+
+
+class FakeStream:
+    """Stands in for an STT stream: frames pushed wait in `_input_ch` until sent upstream"""
+
+    def __init__(self, backlog):
+        self._input_ch = aio.Chan()
+        for i in range(backlog):
+            self._input_ch.send_nowait(i)
+
+    def send_upstream(self):
+        self._input_ch.recv_nowait()
+
+
+def test_wait_returns_when_the_backlog_drains():
+    async def run():
+        queue = FrameQueue(capacity=10)
+        stream = FakeStream(backlog=5)
+        waiter = asyncio.create_task(queue.wait_for_stt(stream, 2))
+        for _ in range(2):
+            await asyncio.sleep(0)
+            stream.send_upstream()
+            await asyncio.sleep(0)
+            assert not waiter.done()
+        stream.send_upstream()
+        await asyncio.wait_for(waiter, 1)
+        # No waiter is left behind in the stream's channel
+        assert not stream._input_ch._puts
+
+    asyncio.run(run())
+
+
+def test_queued_frames_do_not_leave_waiters_behind():
+    async def run():
+        queue = FrameQueue(capacity=10)
+        stream = FakeStream(backlog=5)
+        waiter = asyncio.create_task(queue.wait_for_stt(stream, 2))
+        for _ in range(20):
+            queue.put(FRAME, is_speech=True)
+            await asyncio.sleep(0)
+        assert not waiter.done()
+        assert len(stream._input_ch._puts) == 1
+        waiter.cancel()
+
+    asyncio.run(run())
+
+
+def test_wait_ends_when_the_stream_is_replaced_or_closed():
+    async def run():
+        queue = FrameQueue(capacity=10)
+        stream = FakeStream(backlog=5)
+        current = [True]
+        waiter = asyncio.create_task(queue.wait_for_stt(stream, 2, lambda: current[0]))
+        await asyncio.sleep(0)
+        current[0] = False
+        queue.put(FRAME, is_speech=True)
+        await asyncio.wait_for(waiter, 1)
+
+        waiter = asyncio.create_task(queue.wait_for_stt(stream, 2))
+        await asyncio.sleep(0)
+        stream._input_ch.close()
+        await asyncio.wait_for(waiter, 1)
+        await asyncio.wait_for(queue.wait_for_stt(stream, 2), 1)
+
+    asyncio.run(run())
+
+
+def test_wait_ends_when_the_queue_is_closed():
+    async def run():
+        queue = FrameQueue(capacity=10)
+        waiter = asyncio.create_task(queue.wait_for_stt(FakeStream(backlog=5), 2))
+        await asyncio.sleep(0)
+        queue.close()
+        await asyncio.wait_for(waiter, 1)
+
+    asyncio.run(run())
+
+
+def test_recognize_stream_input_channel_wakes_waiters_on_receive():
+    # stt_drained relies on aio.Chan waking its waiting senders on every receive
+    async def run():
+        stream = FakeStream(backlog=2)
+        assert isinstance(stream._input_ch._puts, collections.deque)
+        waiter = stt_drained(stream)
+        assert not waiter.done()
+        stream.send_upstream()
+        await asyncio.sleep(0)
+        assert waiter.done() and not waiter.cancelled()
+
+    asyncio.run(run())
+
+
+def test_wait_goes_through_routed_and_hedged_streams():
+    async def run():
+        option = ProviderOption("sim", "fast", pool=None)
+        fast, slow = FakeStream(backlog=1), FakeStream(backlog=4)
+        routed = RoutedStream(option, slow)
+        hedged = HedgedStream([RoutedStream(option, fast), RoutedStream(option, FakeStream(backlog=4))])
+
+        for stream, backed_up in ((routed, slow), (hedged, hedged.streams[1].stream)):
+            queue = FrameQueue(capacity=10)
+            waiter = asyncio.create_task(queue.wait_for_stt(stream, 2))
+            await asyncio.sleep(0)
+            backed_up.send_upstream()
+            await asyncio.sleep(0)
+            assert not waiter.done()
+            backed_up.send_upstream()
+            await asyncio.wait_for(waiter, 1)
+            assert stream.backlog() == 2
+
+    asyncio.run(run())
@@ -0,0 +1,93 @@
+import os
+import json
+import time
+import asyncio
+
+import pytest
+
+import load
+from load import ProcessLoad, WorkerLoad, WORKER_DIR_ENV
+from watchdog import LoopWatchdog
+
+
+@pytest.fixture(autouse=True)
+def worker_dir_env(monkeypatch):
+    # WorkerLoad exports its directory for job processes; don't leak it into other tests
+    monkeypatch.delenv(WORKER_DIR_ENV, raising=False)
+
+
+def test_only_load_state_files_are_deleted(tmp_path):
+    (tmp_path / "notes.txt").write_text("keep me")
+    (tmp_path / "config.json").write_text("{}")
+    stale = tmp_path / f"worker-{os.getpid()}"
+    stale.mkdir()
+    (stale / "123.json").write_text("{}")
+    (stale / "123.json.456.tmp").write_text("{")
+    (stale / "README").write_text("keep me too")
+
+    worker = WorkerLoad(directory=str(tmp_path))
+
+    assert worker.directory == str(stale)
+    assert sorted(os.listdir(stale)) == ["README"]
+    assert (tmp_path / "notes.txt").read_text() == "keep me"
+    assert (tmp_path / "config.json").exists()
+
+
+def test_workers_keep_separate_state(tmp_path, monkeypatch):
+    other = tmp_path / "worker-1"  # pid 1 is alive: another worker on this host
+    other.mkdir()
+    (other / "77.json").write_text("{}")
+    dead = tmp_path / "worker-999999999"
+    dead.mkdir()
+    (dead / "88.json").write_text("{}")
+    monkeypatch.setattr(load.psutil, "pid_exists", lambda pid: pid != 999999999)
+
+    worker = WorkerLoad(directory=str(tmp_path))
+
+    assert (other / "77.json").exists()
+    assert not dead.exists()
+    assert os.environ[WORKER_DIR_ENV] == worker.directory
+    assert worker._read_states() == []
+
+
+def test_job_process_writes_into_its_workers_directory(tmp_path):
+    # Created at import, before the worker set up its directory
+    process_load = ProcessLoad(lambda: 0.0, interval=60)
+    worker = WorkerLoad(directory=str(tmp_path))
+
+    async def run():
+        tasks = {"track": object()}
+        process_load.job_started(tasks)
+        process_load._write()
+        states = worker._read_states()
+        process_load.job_finished(tasks)
+        return states
+
+    states = asyncio.run(run())
+
+    assert process_load.path == os.path.join(worker.directory, f"{os.getpid()}.json")
+    assert [state["streams"] for state in states] == [1]
+
+
+def test_job_process_reports_the_watchdogs_loop_lag(tmp_path):
+    watchdog = LoopWatchdog(interval=0.01, threshold=0)  # Stall detection off, lag still measured
+    process_load = ProcessLoad(lambda: watchdog.loop_lag, directory=str(tmp_path), interval=60)
+
+    async def run():
+        watchdog.start()
+        await asyncio.sleep(0.02)
+        time.sleep(0.2)  # Block the loop
+        await asyncio.sleep(0.02)
+        tasks = {"track": object()}
+        process_load.job_started(tasks)
+        process_load._write()
+        with open(process_load.path) as f:
+            state = json.load(f)
+        process_load.job_finished(tasks)
+        await watchdog.stop()
+        return state
+
+    state = asyncio.run(run())
+
+    assert state["loop_lag"] >= 0.1
+    assert watchdog.stalls == 0
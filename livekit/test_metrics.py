@@ -0,0 +1,35 @@
+import os
+
+from prometheus_client.mmap_dict import MmapedDict, mmap_key
+
+from metrics import _LiveProcessCollector
+
+DEAD_PIDS = (999999998, 999999999)  # Above any pid_max
+COUNTER = "transcription_frames_ingested_total"
+
+
+def write_samples(path, filename, samples):
+    db = MmapedDict(os.path.join(path, filename))
+    for name, value in samples:
+        db.write_value(mmap_key(name.removesuffix("_total"), name, [], [], ""), value, 0.0)
+    db.close()
+
+
+def collected(collector):
+    return {sample.name: sample.value for metric in collector.collect() for sample in metric.samples}
+
+
+def test_files_of_exited_processes_are_folded_into_an_archive(tmp_path):
+    write_samples(tmp_path, f"counter_{DEAD_PIDS[0]}.db", [(COUNTER, 5)])
+    write_samples(tmp_path, f"counter_{DEAD_PIDS[1]}.db", [(COUNTER, 7)])
+    write_samples(tmp_path, f"counter_{os.getpid()}.db", [(COUNTER, 1)])
+    write_samples(tmp_path, f"gauge_livesum_{DEAD_PIDS[0]}.db", [("transcription_active_rooms", 1)])
+    collector = _LiveProcessCollector(str(tmp_path))
+
+    assert collected(collector)[COUNTER] == 13
+    assert set(os.listdir(tmp_path)) == {"counter_archive.db", f"counter_{os.getpid()}.db"}
+
+    # The next meeting's process exits too
+    write_samples(tmp_path, f"counter_{DEAD_PIDS[1]}.db", [(COUNTER, 2)])
+    assert collected(collector)[COUNTER] == 15
+    assert len(os.listdir(tmp_path)) == 2
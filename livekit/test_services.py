@@ -0,0 +1,44 @@
+import asyncio
+import threading
+
+import main
+from bench.fakes import FakeRoom, LatencyRecorder
+
+
+def run_job(name, started, release, results):
+    """One high-density job: its own thread and event loop"""
+    async def job():
+        state = main.JobState(FakeRoom(name, LatencyRecorder()))
+        results[name] = state.services
+        started.release()
+        await asyncio.to_thread(release.wait)
+        await state.aclose(timeout=1.0)
+
+    asyncio.run(job())
+
+
+def test_jobs_of_one_process_share_one_set_of_services(tmp_path, monkeypatch):
+    monkeypatch.setenv("SPOOL_DIR", str(tmp_path / "spool"))
+    monkeypatch.setenv("TRANSCRIPT_CHECKPOINT_DIR", str(tmp_path / "transcripts"))
+    monkeypatch.setenv("STT_POOL_SIZE", "0")
+    started, release, results = threading.Semaphore(0), threading.Event(), {}
+
+    threads = [threading.Thread(target=run_job, args=(f"meeting-{i}", started, release, results)) for i in range(3)]
+    for thread in threads:
+        thread.start()
+    for _ in threads:
+        started.acquire()
+
+    services = main._services
+    assert services is not None and services.jobs == 3
+    assert all(shared is services for shared in results.values())
+    assert len([t for t in threading.enumerate() if t.name == "shared-services"]) == 1
+
+    release.set()
+    for thread in threads:
+        thread.join(10)
+
+    # Closed with the last job
+    assert main._services is None
+    assert services.loop.is_closed()
+    assert not any(t.name in ("shared-services", "loop-watchdog") for t in threading.enumerate())
@@ -0,0 +1,113 @@
+import os
+import asyncio
+
+import pytest
+
+from spool import DeliverySpool, TranscriptionSpool
+
+
+@pytest.fixture
+def fast_replay(monkeypatch):
+    monkeypatch.setenv("SPOOL_FSYNC_INTERVAL_MS", "5")
+    monkeypatch.setenv("SPOOL_SCAN_INTERVAL_SECONDS", "0.01")
+    monkeypatch.setenv("SPOOL_REPLAY_BACKOFF_INITIAL_SECONDS", "0.001")
+    monkeypatch.setenv("SPOOL_REPLAY_BACKOFF_MAX_SECONDS", "0.001")
+    monkeypatch.setenv("SPOOL_REPLAY_MAX_ATTEMPTS", "3")
+
+
+async def wait_for(condition, timeout=2.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline, "condition not met in time"
+        await asyncio.sleep(0.005)
+
+
+def test_rejected_record_is_dead_lettered(tmp_path, fast_replay):
+    attempts = []
+
+    async def reject(meeting_id, batch):
+        attempts.append(meeting_id)
+        return 400
+
+    async def run():
+        spool = DeliverySpool(reject, directory=str(tmp_path))
+        spool.start()
+        spool.append("m1", [{"type": "final", "text": "hello"}])
+        await wait_for(lambda: spool.records_dead == 1)
+        await wait_for(lambda: not os.path.exists(tmp_path / "m1.spool"))
+        await spool.aclose()
+
+    asyncio.run(run())
+
+    assert len(attempts) == 3
+    dead = TranscriptionSpool(str(tmp_path / "m1.dead")).read_records(0, 10)
+    assert [record for _, record in dead] == [
+        {"meeting_id": "m1", "transcription_data": [{"type": "final", "text": "hello"}]}]
+
+
+def test_record_is_kept_through_a_backend_outage(tmp_path, fast_replay):
+    # Unreachable, then server errors, then a timeout: none of them is a rejection
+    outage = [None] * 5 + [503] * 5 + [408]
+    delivered = []
+
+    async def send(meeting_id, batch):
+        if outage:
+            return outage.pop(0)
+        delivered.append(batch)
+        return 200
+
+    async def run():
+        spool = DeliverySpool(send, directory=str(tmp_path))
+        spool.start()
+        spool.append("m1", [{"type": "final", "text": "hello"}])
+        await wait_for(lambda: spool.records_replayed == 1)
+        await wait_for(lambda: not os.path.exists(tmp_path / "m1.spool"))
+        await spool.aclose()
+        return spool
+
+    spool = asyncio.run(run())
+
+    assert spool.records_dead == 0
+    assert delivered == [[{"type": "final", "text": "hello"}]]
+    assert not os.path.exists(tmp_path / "m1.dead")
+
+
+def test_scan_releases_drained_spools(tmp_path, fast_replay):
+    # Left behind by another worker: every record already delivered
+    drained = TranscriptionSpool(str(tmp_path / "m2.spool"))
+    drained.append({"meeting_id": "m2", "transcription_data": []})
+    drained.close()
+    drained.commit(drained.size())
+
+    async def run():
+        spool = DeliverySpool(lambda meeting_id, batch: None, directory=str(tmp_path))
+        spool._semaphore = asyncio.Semaphore(1)
+        spool._scan()
+        assert not os.path.exists(tmp_path / "m2.spool.lock")
+        assert "m2" not in spool._spools
+
+    asyncio.run(run())
+
+
+def test_fsync_loop_survives_a_failing_spool(tmp_path, fast_replay):
+    async def run():
+        backend_down = asyncio.Event()
+
+        async def hang(meeting_id, batch):
+            await backend_down.wait()
+
+        spool = DeliverySpool(hang, directory=str(tmp_path))
+        broken = spool._spool_for("broken")
+
+        def fail():
+            raise AttributeError("'NoneType' object has no attribute 'fileno'")
+
+        broken.touch_lock = fail
+        spool.start()
+        await asyncio.sleep(0.02)
+        # Only the fsync loop syncs a spool whose replay is still in flight
+        spool.append("m3", [{"type": "final", "text": "hi"}])
+        await wait_for(lambda: not spool._spool_for("m3").dirty)
+        await spool.aclose()
+
+    asyncio.run(run())
@@ -0,0 +1,75 @@
+import asyncio
+
+from stt_pool import STTStreamPool
+
+
+class FakeStream:
+    def __init__(self):
+        self.closed = False
+
+    async def aclose(self):
+        self.closed = True
+
+
+class FakeSTT:
+    def __init__(self):
+        self.streams = []
+
+    def stream(self):
+        stream = FakeStream()
+        self.streams.append(stream)
+        return stream
+
+    async def aclose(self):
+        pass
+
+
+def make_pool(max_idle):
+    stt = FakeSTT()
+    return STTStreamPool(size=2, max_idle=max_idle, factory=lambda model, http_session: stt,
+                         api_key_env=None), stt
+
+
+def test_idle_streams_are_closed_without_an_acquire():
+    async def run():
+        pool, stt = make_pool(max_idle=0.05)
+        pool.start()
+        assert len(stt.streams) == 2
+        await asyncio.sleep(0.15)
+        # Closed by the reaper, and not reopened until a track needs a stream
+        assert all(stream.closed for stream in stt.streams)
+        assert len(stt.streams) == 2
+        assert pool.expired == 2
+        await pool.aclose()
+
+    asyncio.run(run())
+
+
+def test_acquire_after_reaping_refills_the_pool():
+    async def run():
+        pool, stt = make_pool(max_idle=0.05)
+        pool.start()
+        await asyncio.sleep(0.15)
+
+        stream = pool.acquire()
+        assert pool.misses == 1 and not stream.closed
+        assert len(pool._idle) == 2
+        await asyncio.sleep(0.15)
+        assert all(idle.closed for idle in stt.streams if idle is not stream)
+        assert not stream.closed
+        await pool.aclose()
+
+    asyncio.run(run())
+
+
+def test_fresh_streams_are_handed_out():
+    async def run():
+        pool, stt = make_pool(max_idle=10)
+        pool.start()
+        first = stt.streams[0]
+        assert pool.acquire() is first
+        assert pool.hits == 1 and pool.expired == 0
+        await pool.aclose()
+        assert pool._reaper is None
+
+    asyncio.run(run())
@@ -0,0 +1,77 @@
+import json
+import asyncio
+
+from stt_router import STTRouter, FINAL
+
+OPTIONS = [("sim", "fast"), ("sim", "slow")]
+
+
+class FakePool:
+    def start(self):
+        pass
+
+    async def aclose(self):
+        pass
+
+
+def make_router(state_file, sync_interval=60):
+    return STTRouter(options=OPTIONS, min_samples=3, state_file=str(state_file), sync_interval=sync_interval,
+                     pool_factory=lambda provider, model: FakePool())
+
+
+def observe(router, key, latency, count=3):
+    option = next(option for option in router.options if option.key == key)
+    for _ in range(count):
+        option.observe(FINAL, latency)
+
+
+def test_concurrent_jobs_share_their_latencies(tmp_path):
+    state_file = tmp_path / "stt_router.json"
+
+    async def run():
+        first, second = make_router(state_file), make_router(state_file)
+        observe(first, "sim:fast", 0.2)
+        observe(second, "sim:slow", 0.9)
+        await first.sync()
+        await second.sync()
+        await first.sync()
+        return first, second
+
+    first, second = asyncio.run(run())
+
+    # Each job has the other's samples, and a new job starts out measured
+    for router in (first, second, make_router(state_file)):
+        assert [option.samples for option in router.options] == [3, 3]
+        assert router.choose(1)[0].key == "sim:fast"
+
+
+def test_samples_lost_to_a_concurrent_write_come_back_on_the_next_sync(tmp_path):
+    state_file = tmp_path / "stt_router.json"
+
+    async def run():
+        job = make_router(state_file)
+        observe(job, "sim:fast", 0.2)
+        await job.sync()
+        state_file.write_text(json.dumps({}))  # Another job wrote without having read them
+        await job.sync()
+
+    asyncio.run(run())
+
+    assert len(json.loads(state_file.read_text())["sim:fast"][FINAL]) == 3
+
+
+def test_latencies_are_saved_periodically(tmp_path):
+    state_file = tmp_path / "stt_router.json"
+
+    async def run():
+        job = make_router(state_file, sync_interval=0.01)
+        job.start()
+        observe(job, "sim:slow", 0.9)
+        await asyncio.sleep(0.1)
+        saved = json.loads(state_file.read_text())
+        await job.aclose()
+        return saved
+
+    saved = asyncio.run(run())
+
+    assert len(saved["sim:slow"][FINAL]) == 3
@@ -0,0 +1,150 @@
+import asyncio
+
+from livekit import rtc
+
+from stt_session import TrackSTTSession, MUTED, SILENCE, FAILED
+
+SAMPLE_RATE = 16000
+FRAME_SAMPLES = SAMPLE_RATE // 10  # 100 ms
+
+
+def make_frame():
+    return rtc.AudioFrame(b"\0\0" * FRAME_SAMPLES, SAMPLE_RATE, 1, FRAME_SAMPLES)
+
+
+class FakeStream:
+    """An STT stream whose events are fed by the test; `end_input` ends them unless `hangs`"""
+
+    def __init__(self, hangs=False):
+        self.hangs = hangs
+        self.frames = []
+        self.ended = False
+        self.closed = False
+        self.fail_push = False
+        self._events = asyncio.Queue()
+
+    def push_frame(self, frame):
+        if self.fail_push:
+            raise RuntimeError("connection lost")
+        self.frames.append(frame)
+
+    def emit(self, event):
+        self._events.put_nowait(event)
+
+    def end_input(self):
+        self.ended = True
+        if not self.hangs:
+            self._events.put_nowait(None)
+
+    async def aclose(self):
+        self.closed = True
+        self._events.put_nowait(None)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        event = await self._events.get()
+        if event is None:
+            raise StopAsyncIteration
+        return event
+
+
+def make_session(suspend_after=0, hangs=False):
+    streams, delivered = [], []
+
+    def acquire():
+        streams.append(FakeStream(hangs=hangs))
+        return streams[-1]
+
+    async def consume(stream):
+        async for event in stream:
+            delivered.append((stream, event))
+
+    return TrackSTTSession(acquire, consume, suspend_after=suspend_after), streams, delivered
+
+
+def test_mute_suspends_and_unmute_resumes_with_a_new_stream():
+    async def run():
+        session, streams, delivered = make_session()
+        session.open()
+        first = streams[0]
+        first.emit("final before mute")
+
+        session.set_muted(True)
+        assert session.stream is None and session.suspended == MUTED
+        assert not session.accepts_audio()
+        await asyncio.sleep(0.01)
+        # The suspended stream delivered its last transcript and was closed
+        assert first.ended and first.closed
+        assert delivered == [(first, "final before mute")]
+
+        session.set_muted(False)
+        assert session.stream is streams[1] and session.suspended is None
+        assert session.accepts_audio()
+        assert (session.suspensions, session.resumes) == (1, 1)
+        await session.aclose()
+        assert streams[1].closed
+
+    asyncio.run(run())
+
+
+def test_silence_suspends_until_speech_returns():
+    async def run():
+        session, streams, _ = make_session(suspend_after=0.05)
+        session.open()
+        await asyncio.sleep(0.15)
+        assert session.stream is None and session.suspended == SILENCE
+        assert not session.accepts_audio()
+
+        session.speech_seen()
+        assert session.accepts_audio()
+        assert session.stream is streams[1]
+        await session.aclose()
+
+    asyncio.run(run())
+
+
+def test_failed_stream_is_replaced_and_audio_after_the_last_final_replayed():
+    async def run():
+        session, streams, _ = make_session()
+        first = session.open()
+        for _ in range(10):
+            session.push(make_frame())
+        # A final covering the first 0.4 s of audio
+        assert session.accept_event(first, True, 0.4)
+        assert not session.accept_event(first, True, 0.3)
+
+        first.fail_push = True
+        session.push(make_frame())
+        assert session.suspended == FAILED and session.failovers == 1
+        assert session.accepts_audio()  # Frames are kept for the replacement
+        await asyncio.sleep(0.01)
+
+        second = session.stream
+        assert second is streams[1] and first.closed
+        # 1.1 s pushed, 0.4 s already transcribed: 0.7 s replayed
+        replayed = sum(frame.samples_per_channel for frame in second.frames) / SAMPLE_RATE
+        assert abs(replayed - 0.7) < 1e-3
+        assert abs(session.origin(second) - 0.4) < 1e-3
+        # The new stream's time 0 is the end of the last final on the track's timeline
+        assert session.accept_event(second, False, 0.2)
+        await session.aclose()
+
+    asyncio.run(run())
+
+
+def test_teardown_does_not_wait_for_a_stream_that_never_ends():
+    async def run():
+        session, streams, _ = make_session(hangs=True)
+        session.open()
+        session.set_muted(True)  # Leaves a stream finishing in the background
+        session.set_muted(False)
+
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        await session.aclose(graceful=False)
+        assert loop.time() - started < 1.0
+        assert all(stream.ended and stream.closed for stream in streams)
+
+    asyncio.run(run())
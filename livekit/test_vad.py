@@ -0,0 +1,86 @@
+import numpy as np
+from livekit import rtc
+
+from vad import SpeechGate
+
+SAMPLE_RATE = 16000
+FRAME_SAMPLES = SAMPLE_RATE // 100  # 10 ms
+
+
+def make_frame(level_db, rng, voiced=True):
+    """A 10 ms frame at `level_db` dBFS: a 200 Hz tone (voiced) or white noise"""
+    if voiced:
+        t = np.arange(FRAME_SAMPLES) / SAMPLE_RATE
+        signal = np.sqrt(2) * np.sin(2 * np.pi * 200 * t + rng.uniform(0, 2 * np.pi))
+    else:
+        signal = rng.normal(0, 1, FRAME_SAMPLES)
+    samples = np.clip(signal * 32768.0 * 10 ** (level_db / 20), -32768, 32767).astype(np.int16)
+    return rtc.AudioFrame(samples.tobytes(), SAMPLE_RATE, 1, FRAME_SAMPLES)
+
+
+def make_gate():
+    return SpeechGate(threshold_db=-60, margin_db=10, zcr_max=0.35, hangover_ms=200, preroll_ms=100, keepalive_ms=0)
+
+
+def test_gate_stays_open_through_continuous_speech():
+    rng = np.random.default_rng(0)
+    gate = make_gate()
+    for _ in range(100):
+        gate.process(make_frame(-65, rng, voiced=False))
+
+    # 5 s of speech 19 dB above the noise floor
+    frames = [make_frame(-46, rng) for _ in range(500)]
+    forwarded = [frame for frame in frames if frame in gate.process(frame)]
+
+    assert len(forwarded) == len(frames)
+    assert gate.in_speech
+
+
+def test_gate_stays_open_through_short_word_gaps():
+    rng = np.random.default_rng(3)
+    gate = make_gate()
+    for _ in range(100):
+        gate.process(make_frame(-65, rng, voiced=False))
+
+    # 8 s of speech with a quiet 30 ms gap (above the noise) every 300 ms
+    speech_frames = forwarded = 0
+    for i in range(800):
+        if i % 30 < 27:
+            speech_frames += 1
+            frame = make_frame(-46, rng)
+            forwarded += sum(1 for out in gate.process(frame) if out is frame)
+        else:
+            gate.process(make_frame(-58, rng, voiced=False))
+
+    assert forwarded == speech_frames
+
+
+def test_gate_closes_after_hangover_and_keeps_preroll():
+    rng = np.random.default_rng(1)
+    gate = make_gate()
+    for _ in range(100):
+        gate.process(make_frame(-65, rng, voiced=False))
+    for _ in range(50):
+        gate.process(make_frame(-40, rng))
+
+    # 200 ms of hangover is forwarded, then silence is held back
+    silence = [gate.process(make_frame(-65, rng, voiced=False)) for _ in range(100)]
+    assert sum(len(out) for out in silence[:20]) == 20
+    assert sum(len(out) for out in silence[20:]) == 0
+    assert not gate.in_speech
+
+    # Speech resumes with the last 100 ms of pre-roll in front of it
+    out = gate.process(make_frame(-40, rng))
+    assert len(out) == 11
+
+
+def test_noise_floor_follows_background_noise():
+    rng = np.random.default_rng(2)
+    gate = make_gate()
+    for _ in range(100):
+        gate.process(make_frame(-65, rng, voiced=False))
+    # Background noise rises slowly; it must not be mistaken for speech
+    forwarded = 0
+    for i in range(1000):
+        forwarded += len(gate.process(make_frame(-65 + 8 * i / 1000, rng, voiced=False)))
+    assert forwarded == 0
@@ -0,0 +1,63 @@
+from wire_format import CompactEncoder, CompactDecoder, KIND_DELTA, KIND_INTERIM, PACKET_HEADER, RECORD_HEADER
+
+
+def payload(kind, text):
+    return {"type": kind, "text": text, "participant": "alice", "trackSid": "TR_A"}
+
+
+def kinds(packet):
+    found = []
+    offset = PACKET_HEADER.size
+    while offset < len(packet):
+        kind, length = RECORD_HEADER.unpack_from(packet, offset)
+        found.append(kind)
+        offset += RECORD_HEADER.size + length
+    return found
+
+
+INTERIMS = ["the", "the quick", "the quick brown", "the quick brown fox", "the quick brown fox jumps",
+            "the quick brown fox jumps over", "the quick brown fox jumps over the lazy dog"]
+
+
+def test_lossy_interims_use_deltas_between_keyframes():
+    encoder = CompactEncoder(lossy_interims=True, keyframe_interval=3)
+    packets = [encoder.encode(payload("interim", text)) for text in INTERIMS]
+
+    full = [i for i, packet in enumerate(packets) if KIND_INTERIM in kinds(packet)]
+    assert full == [0, 3, 6]
+    assert all(KIND_DELTA in kinds(packet) for i, packet in enumerate(packets) if i not in full)
+
+    decoder = CompactDecoder()
+    decoded = [p["text"] for packet in packets for p in decoder.decode(packet)]
+    assert decoded == INTERIMS
+
+
+def test_lost_interim_is_recovered_at_the_next_keyframe():
+    encoder = CompactEncoder(lossy_interims=True, keyframe_interval=3)
+    packets = [encoder.encode(payload("interim", text)) for text in INTERIMS]
+    final = encoder.encode(payload("final", INTERIMS[-1] + "."))
+
+    decoder = CompactDecoder()
+    received = [packet for i, packet in enumerate(packets) if i != 1] + [final]
+    decoded = [p["text"] for packet in received for p in decoder.decode(packet)]
+
+    # Deltas built on the lost interim are skipped instead of decoded onto a stale base
+    assert decoded == [INTERIMS[0]] + INTERIMS[3:] + [INTERIMS[-1] + "."]
+
+
+def test_late_joiner_decodes_from_a_keyframe():
+    encoder = CompactEncoder(lossy_interims=True, keyframe_interval=3)
+    packets = [encoder.encode(payload("interim", text)) for text in INTERIMS]
+
+    decoder = CompactDecoder()
+    decoded = [p for packet in packets[2:] for p in decoder.decode(packet)]
+
+    assert [p["text"] for p in decoded] == INTERIMS[3:]
+    assert {p["trackSid"] for p in decoded} == {"TR_A"}
+
+
+def test_reliable_interims_are_deltas_after_the_first():
+    encoder = CompactEncoder(lossy_interims=False, keyframe_interval=3)
+    packets = [encoder.encode(payload("interim", text)) for text in INTERIMS]
+
+    assert [KIND_INTERIM in kinds(packet) for packet in packets] == [True] + [False] * (len(INTERIMS) - 1)
@@ -0,0 +1,123 @@
+"""Optional OpenTelemetry tracing of the transcription pipeline.
+
+With TRACING_EXPORTER set, every audio track gets a `transcribe_and_forward`
+span, with one `stt.event` child per interim or final transcript. Each event
+span in turn has a `room.publish` child for the data-channel publish and a
+`backend.delivery` child for the time from queueing the event until the
+batch holding it was accepted (or spooled). Spans carry `meeting_id`,
+`participant`, `track` and `segment` attributes.
+
+Exporters: `otlp` (OTLP/HTTP to a local collector), `file` (one JSON span per
+line) and `console`. Spans are exported from a background thread. Without an
+exporter, or without the OpenTelemetry SDK, all helpers are no-ops.
+"""
+import os
+import atexit
+import logging
+import contextlib
+
+logger = logging.getLogger("transcription-agent")
+
+try:
+    from opentelemetry import context as otel_context
+    from opentelemetry import trace
+    from opentelemetry.trace import Status, StatusCode
+except ImportError:  # pragma: no cover - OpenTelemetry is optional
+    trace = None
+
+_tracer = None
+_provider = None
+
+
+def _exporter(kind):
+    if kind == "otlp":
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        return OTLPSpanExporter(endpoint=os.getenv("TRACING_OTLP_ENDPOINT", "http://localhost:4318/v1/traces"))
+    from opentelemetry.sdk.trace.export import ConsoleSpanExporter
+    if kind == "file":
+        out = open(os.getenv("TRACING_FILE", "traces.jsonl"), "a", encoding="utf-8")
+        return ConsoleSpanExporter(out=out, formatter=lambda span: span.to_json(indent=None) + "\n")
+    return ConsoleSpanExporter()
+
+
+def _get_tracer():
+    """The agent's tracer, set up on first use in each job process"""
+    global _tracer, _provider
+    if _tracer is not None:
+        return _tracer
+
+    kind = os.getenv("TRACING_EXPORTER", "").lower()
+    if not kind or kind == "none" or trace is None:
+        _tracer = False
+        return _tracer
+
+    try:
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+        from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+
+        sampler = ParentBased(TraceIdRatioBased(float(os.getenv("TRACING_SAMPLE_RATIO", "1.0"))))
+        _provider = TracerProvider(
+            resource=Resource.create({"service.name": os.getenv("TRACING_SERVICE_NAME", "transcription-agent")}),
+            sampler=sampler,
+        )
+        _provider.add_span_processor(BatchSpanProcessor(_exporter(kind)))
+        atexit.register(_provider.shutdown)
+        # A private provider, so LiveKit's own tracing setup is left alone
+        _tracer = _provider.get_tracer("transcription-agent")
+        logger.info(f"Tracing enabled with the {kind} exporter")
+    except Exception as e:
+        logger.error(f"[ERROR] Failed to set up tracing, continuing without it: {e}")
+        _tracer = False
+    return _tracer
+
+
+def enabled():
+    return bool(_get_tracer())
+
+
+def _attributes(attributes):
+    # OpenTelemetry rejects None attribute values
+    return {key: value for key, value in attributes.items() if value is not None}
+
+
+@contextlib.contextmanager
+def span(name, **attributes):
+    """Run a block inside a span that is a child of the current one"""
+    tracer = _get_tracer()
+    if not tracer:
+        yield None
+        return
+    with tracer.start_as_current_span(name, attributes=_attributes(attributes)) as current:
+        yield current
+
+
+def start_span(name, **attributes):
+    """Start a child of the current span that is ended later with `end_span`"""
+    tracer = _get_tracer()
+    if not tracer:
+        return None
+    return tracer.start_span(name, attributes=_attributes(attributes))
+
+
+def end_span(current, error=None, **attributes):
+    if current is None:
+        return
+    if attributes:
+        current.set_attributes(_attributes(attributes))
+    if error is not None:
+        current.set_status(Status(StatusCode.ERROR, error))
+    current.end()
+
+
+def activate(current):
+    """Make `current` the parent of spans started from here, including in tasks created later"""
+    if current is None:
+        return None
+    return otel_context.attach(trace.set_span_in_context(current))
+
+
+def deactivate(token):
+    if token is not None:
+        otel_context.detach(token)
@@ -0,0 +1,165 @@
+import os
+import re
+import gzip
+import json
+import time
+import asyncio
+import logging
+
+logger = logging.getLogger("transcription-agent")
+
+
+def bulk_only():
+    """Whether finals reach the backend only through the end-of-meeting upload"""
+    return os.getenv("TRANSCRIPT_BULK_ONLY", "false").lower() in ("1", "true", "yes")
+
+
+class MeetingTranscript:
+    """Ordered transcript of one meeting's finals, kept by the agent.
+
+    Finals are held as compact tuples in the order they were produced. Every
+    `interval` seconds the finals added since the last checkpoint are appended
+    to `<TRANSCRIPT_CHECKPOINT_DIR>/<meeting>.ndjson.gz` as one gzip member of
+    NDJSON, so a checkpoint costs only the delta. When the room ends, the whole
+    transcript is uploaded in one request if the backend may be missing some of
+    it, and the checkpoint file is removed; if the upload fails the file is left
+    for a later job of the same meeting, which loads it on start.
+    """
+
+    def __init__(self, meeting_id, directory=None, interval=None):
+        self.meeting_id = meeting_id
+        self.directory = os.path.abspath(directory or os.getenv("TRANSCRIPT_CHECKPOINT_DIR", "transcripts"))
+        self.interval = interval or float(os.getenv("TRANSCRIPT_CHECKPOINT_SECONDS", "30"))
+        safe_id = re.sub(r"[^A-Za-z0-9_.-]", "_", meeting_id)
+        self.path = os.path.join(self.directory, f"{safe_id}.ndjson.gz")
+
+        # (segmentId, participant, trackSid, text, finalized at)
+        self._segments = []
+        self._segment_ids = set()
+        self._checkpointed = 0
+        self._task = None
+        self._wakeup = asyncio.Event()
+        # Finals resumed from a previous job's checkpoint, which its live deliveries may have missed
+        self.resumed = 0
+
+    def __len__(self):
+        return len(self._segments)
+
+    def add(self, payload):
+        """Record a final; repeated finals of the same segment are ignored"""
+        segment_id = payload.get("segmentId")
+        if segment_id in self._segment_ids:
+            return
+        self._segment_ids.add(segment_id)
+        self._segments.append((segment_id, payload["participant"], payload.get("trackSid"),
+                               payload["text"], time.time()))
+
+    @staticmethod
+    def _record(segment):
+        segment_id, participant, track_sid, text, at = segment
+        return {"segmentId": segment_id, "participant": participant, "trackSid": track_sid, "text": text, "at": at}
+
+    def records(self):
+        return [self._record(segment) for segment in self._segments]
+
+    def load(self):
+        """Resume from a checkpoint left by a previous job of this meeting"""
+        if not os.path.exists(self.path):
+            return 0
+        loaded = 0
+        truncated = False
+        try:
+            with gzip.open(self.path, "rt", encoding="utf-8") as f:
+                for line in f:
+                    record = json.loads(line)
+                    if record["segmentId"] in self._segment_ids:
+                        continue
+                    self._segment_ids.add(record["segmentId"])
+                    self._segments.append((record["segmentId"], record["participant"], record.get("trackSid"),
+                                           record["text"], record["at"]))
+                    loaded += 1
+        except (OSError, EOFError, ValueError, KeyError) as e:
+            # A checkpoint cut short by a crash still yields every complete line before it
+            logger.warning(f"Transcript checkpoint {self.path} is truncated: {e}")
+            truncated = True
+        if truncated:
+            # Rewrite the checkpoint from scratch rather than appending after the damage
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+            self._checkpointed = 0
+        else:
+            self._checkpointed = len(self._segments)
+        self.resumed += loaded
+        if loaded:
+            logger.info(f"Resumed {loaded} transcript segments for meeting {self.meeting_id} from checkpoint")
+        return loaded
+
+    def _append(self, records):
+        data = "".join(json.dumps(record) + "\n" for record in records).encode("utf-8")
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self.path, "ab") as f:
+            f.write(gzip.compress(data))
+            f.flush()
+            os.fsync(f.fileno())
+
+    async def checkpoint(self):
+        """Append the finals added since the last checkpoint; returns how many were written"""
+        end = len(self._segments)
+        if end == self._checkpointed:
+            return 0
+        records = [self._record(segment) for segment in self._segments[self._checkpointed:end]]
+        try:
+            await asyncio.to_thread(self._append, records)
+        except OSError as e:
+            logger.error(f"[ERROR] Failed to checkpoint transcript for meeting {self.meeting_id}: {e}")
+            return 0
+        self._checkpointed = end
+        return len(records)
+
+    def start(self):
+        """Start periodic checkpoints"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.interval)
+                return
+            except asyncio.TimeoutError:
+                await self.checkpoint()
+
+    async def _stop(self):
+        if self._task is not None:
+            self._wakeup.set()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def _remove(self):
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+    async def discard(self):
+        """Stop checkpointing and remove the checkpoint; the backend already has every final"""
+        await self._stop()
+        self._remove()
+
+    async def upload(self, send_bulk):
+        """Upload the whole transcript in one request; returns True once the backend has it"""
+        await self._stop()
+
+        if not self._segments:
+            return True
+        # Keep the checkpoint complete in case the upload fails
+        await self.checkpoint()
+
+        if not await send_bulk(self.meeting_id, self.records()):
+            logger.error(f"[ERROR] Transcript upload failed for meeting {self.meeting_id}, "
+                         f"kept checkpoint {self.path}")
+            return False
+        self._remove()
+        return True
@@ -0,0 +1,108 @@
+import os
+from collections import deque
+
+import numpy as np
+
+
+def vad_enabled():
+    return os.getenv("VAD_ENABLED", "false").lower() in ("1", "true", "yes")
+
+
+class SpeechGate:
+    """Energy / zero-crossing voice-activity gate in front of the STT stream.
+
+    Each frame is classified from its RMS level (dBFS) and zero-crossing rate,
+    computed with NumPy over the whole frame buffer. The level threshold adapts
+    to a tracked noise floor. Only speech is forwarded, together with:
+
+    - pre-roll: the last `preroll_ms` of audio before speech starts, so word
+      onsets are not clipped;
+    - hangover: `hangover_ms` of audio after speech stops, so trailing words
+      survive and the provider sees enough silence to end the utterance;
+    - keep-alive: one frame every `keepalive_ms` during long silences.
+    """
+
+    def __init__(self, threshold_db=None, margin_db=None, zcr_max=None,
+                 hangover_ms=None, preroll_ms=None, keepalive_ms=None):
+        self.threshold_db = threshold_db if threshold_db is not None else float(os.getenv("VAD_THRESHOLD_DB", "-50"))
+        self.margin_db = margin_db if margin_db is not None else float(os.getenv("VAD_NOISE_MARGIN_DB", "10"))
+        self.zcr_max = zcr_max if zcr_max is not None else float(os.getenv("VAD_ZCR_MAX", "0.35"))
+        self.hangover_ms = hangover_ms if hangover_ms is not None else float(os.getenv("VAD_HANGOVER_MS", "600"))
+        self.preroll_ms = preroll_ms if preroll_ms is not None else float(os.getenv("VAD_PREROLL_MS", "300"))
+        self.keepalive_ms = keepalive_ms if keepalive_ms is not None else float(os.getenv("VAD_KEEPALIVE_MS", "5000"))
+
+        self._noise_floor_db = None
+        self._preroll = deque()
+        self._preroll_ms = 0.0
+        self._hangover_left_ms = 0.0
+        self._silence_ms = 0.0
+        self.in_speech = False
+
+        # Gate statistics
+        self.frames_in = 0
+        self.frames_forwarded = 0
+
+    @staticmethod
+    def frame_features(samples):
+        """Return (level in dBFS, zero-crossing rate) for int16 samples"""
+        if samples.size == 0:
+            return -120.0, 0.0
+        x = samples.astype(np.float32)
+        rms = np.sqrt(np.mean(x * x))
+        level_db = 20.0 * np.log10(max(rms, 1e-6) / 32768.0)
+        zcr = np.count_nonzero(np.diff(np.signbit(x))) / x.size
+        return float(level_db), float(zcr)
+
+    def is_speech(self, samples):
+        level_db, zcr = self.frame_features(samples)
+        if self._noise_floor_db is None:
+            self._noise_floor_db = level_db
+
+        threshold = max(self.threshold_db, self._noise_floor_db + self.margin_db)
+        # Loud enough; very noisy (high ZCR) frames only count if clearly above threshold
+        speech = level_db >= threshold and (zcr <= self.zcr_max or level_db >= threshold + self.margin_db)
+
+        # Track the noise floor: follow quickly downwards, and slowly upwards only on
+        # non-speech frames, so continuous speech cannot lift the floor above itself
+        if level_db < self._noise_floor_db:
+            self._noise_floor_db += 0.5 * (level_db - self._noise_floor_db)
+        elif not speech:
+            self._noise_floor_db += 0.01 * (level_db - self._noise_floor_db)
+        return speech
+
+    def process(self, frame):
+        """Return the frames that should be forwarded to STT for this input frame"""
+        self.frames_in += 1
+        duration_ms = self._frame_ms(frame)
+        samples = np.frombuffer(frame.data, dtype=np.int16)
+
+        if self.is_speech(samples):
+            self._hangover_left_ms = self.hangover_ms
+            self._silence_ms = 0.0
+            out = list(self._preroll) if not self.in_speech else []
+            self._preroll.clear()
+            self._preroll_ms = 0.0
+            self.in_speech = True
+            out.append(frame)
+        elif self._hangover_left_ms > 0:
+            self._hangover_left_ms -= duration_ms
+            out = [frame]
+        else:
+            self.in_speech = False
+            self._silence_ms += duration_ms
+            out = []
+            if self.keepalive_ms > 0 and self._silence_ms >= self.keepalive_ms:
+                self._silence_ms = 0.0
+                out.append(frame)
+            else:
+                self._preroll.append(frame)
+                self._preroll_ms += duration_ms
+                while self._preroll and self._preroll_ms - self._frame_ms(self._preroll[0]) >= self.preroll_ms:
+                    self._preroll_ms -= self._frame_ms(self._preroll.popleft())
+
+        self.frames_forwarded += len(out)
+        return out
+
+    @staticmethod
+    def _frame_ms(frame):
+        return 1000.0 * frame.samples_per_channel / frame.sample_rate
@@ -0,0 +1,132 @@
+import os
+import sys
+import time
+import asyncio
+import logging
+import threading
+import traceback
+
+import metrics
+
+logger = logging.getLogger("transcription-agent")
+
+
+class _WatchedLoop:
+    """Tick state of one watched event loop"""
+
+    def __init__(self, loop, thread_id):
+        self.loop = loop
+        self.thread_id = thread_id
+        self.last_tick = time.monotonic()
+        self.capture = None
+        self.task = None
+        self.lag = 0.0
+
+
+class LoopWatchdog:
+    """Detects stalls of the event loops of one process and reports what was blocking them.
+
+    Each watched loop runs a task that ticks every LOOP_WATCHDOG_INTERVAL_MS;
+    how late each tick runs is the loop lag. One sidecar thread per process
+    watches the ticks of every loop. When none has run on a loop for
+    LOOP_STALL_THRESHOLD_MS that loop is blocked, and the thread captures the
+    loop thread's stack and the asyncio task that is running. Transcription
+    tasks are named after their room and participant. The report is logged
+    when the loop recovers, together with the stall's length.
+
+    `loop_lag` is the worst recent lag of the watched loops; the load
+    reporting of the process reads it (see load.py). The ticks keep
+    measuring it when stall detection is off (LOOP_STALL_THRESHOLD_MS=0).
+    """
+
+    # A lag spike counts in `loop_lag` for a while, halving every this many seconds
+    LAG_HALF_LIFE = 0.5
+
+    def __init__(self, interval=None, threshold=None, stack_depth=25):
+        self.interval = interval if interval is not None else float(os.getenv("LOOP_WATCHDOG_INTERVAL_MS", "100")) / 1000
+        self.threshold = threshold if threshold is not None else float(os.getenv("LOOP_STALL_THRESHOLD_MS", "250")) / 1000
+        self.stack_depth = stack_depth
+        self.stalls = 0
+
+        self._loops = {}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    @property
+    def loop_lag(self):
+        """Worst recent lag of the watched loops, in seconds"""
+        with self._lock:
+            return max((watched.lag for watched in self._loops.values()), default=0.0)
+
+    def start(self):
+        """Start watching the running event loop (idempotent)"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if loop in self._loops:
+                return
+            watched = self._loops[loop] = _WatchedLoop(loop, threading.get_ident())
+            if self._thread is None and self.threshold > 0:
+                self._stopped.clear()
+                self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+                self._thread.start()
+        watched.task = asyncio.create_task(self._tick(watched), name="loop-watchdog")
+
+    async def stop(self):
+        """Stop watching the running event loop; the thread ends with the last watched loop"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            watched = self._loops.pop(loop, None)
+            thread = self._thread if not self._loops else None
+            if thread is not None:
+                self._thread = None
+                self._stopped.set()
+        if watched is not None:
+            watched.task.cancel()
+            await asyncio.gather(watched.task, return_exceptions=True)
+        if thread is not None:
+            await asyncio.to_thread(thread.join, 1.0)
+
+    async def _tick(self, watched):
+        decay = 0.5 ** (self.interval / self.LAG_HALF_LIFE)
+        while True:
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(0.0, now - watched.last_tick - self.interval)
+            watched.last_tick = now
+            watched.lag = max(lag, watched.lag * decay)
+            metrics.LOOP_LAG.observe(lag)
+            if 0 < self.threshold <= lag:
+                self._report(watched, lag)
+
+    def _watch(self):
+        while not self._stopped.wait(min(self.interval, self.threshold / 2)):
+            with self._lock:
+                loops = list(self._loops.values())
+            for watched in loops:
+                if time.monotonic() - watched.last_tick - self.interval < self.threshold:
+                    continue
+                with self._lock:
+                    if watched.capture is not None:
+                        continue  # Already captured this stall
+                frame = sys._current_frames().get(watched.thread_id)
+                stack = "".join(traceback.format_stack(frame, limit=self.stack_depth)) if frame is not None else ""
+                try:
+                    task = asyncio.current_task(watched.loop)
+                except RuntimeError:
+                    task = None
+                with self._lock:
+                    watched.capture = (task.get_name() if task is not None else "a callback outside any task", stack)
+
+    def _report(self, watched, lag):
+        with self._lock:
+            capture, watched.capture = watched.capture, None
+        self.stalls += 1
+        metrics.LOOP_STALLS.inc()
+        metrics.LOOP_STALL_DURATION.observe(lag)
+        if capture is None:
+            logger.warning(f"Event loop stalled for {lag * 1000:.0f} ms (ended before its stack was captured)")
+            return
+        running, stack = capture
+        logger.warning(f"Event loop stalled for {lag * 1000:.0f} ms while running {running}; "
+                       f"blocked in:\n{stack.rstrip()}")
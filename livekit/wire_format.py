@@ -0,0 +1,194 @@
+"""Compact binary encoding for the lk.transcription data topic.
+
+Version 1 packet layout (all integers big-endian):
+
+    packet  = "LT" version:u8 record*
+    record  = kind:u8 length:u16 body
+    ALIAS   = alias:u16 sid_len:u16 sid identity_len:u16 identity
+    INTERIM = alias:u16 segment:u32 seq:u16 text            (full text)
+    DELTA   = alias:u16 segment:u32 seq:u16 keep:u16 tail   (text = previous[:keep] + tail)
+    FINAL   = alias:u16 segment:u32 seq:u16 text
+
+Text is UTF-8; `keep` counts bytes of the previous interim of the same segment,
+and a DELTA only applies on top of the record with `seq - 1`: a decoder that
+missed that record skips the delta. A track's alias is (re)announced with the
+first record of every segment, so a listener that joins late can decode from
+the next utterance on. When interims are sent on the lossy channel, every
+`keyframe_interval`-th interim of a segment is a keyframe, a full INTERIM with
+the alias announced again, and every FINAL also re-announces the alias, so a
+lost packet is recovered from within a few interims.
+"""
+import os
+import struct
+
+MAGIC = b"LT"
+VERSION = 1
+
+# Participants opt in by setting this attribute to COMPACT_FORMAT
+FORMAT_ATTRIBUTE = "lk.transcription.format"
+COMPACT_FORMAT = "compact-v1"
+
+KIND_ALIAS = 1
+KIND_INTERIM = 2
+KIND_DELTA = 3
+KIND_FINAL = 4
+
+PACKET_HEADER = struct.Struct(">2sB")
+RECORD_HEADER = struct.Struct(">BH")
+TEXT_HEADER = struct.Struct(">HIH")
+KEEP = struct.Struct(">H")
+LENGTH = struct.Struct(">H")
+
+
+def compact_enabled():
+    return os.getenv("TRANSCRIPTION_COMPACT_FORMAT", "false").lower() in ("1", "true", "yes")
+
+
+def split_recipients(room, identities=None):
+    """Return (compact, json) lists of remote participant identities, out of `identities` if given"""
+    compact, legacy = [], []
+    for participant in room.remote_participants.values():
+        if identities is not None and participant.identity not in identities:
+            continue
+        attributes = getattr(participant, "attributes", None) or {}
+        if attributes.get(FORMAT_ATTRIBUTE) == COMPACT_FORMAT:
+            compact.append(participant.identity)
+        else:
+            legacy.append(participant.identity)
+    return compact, legacy
+
+
+def _record(kind, body):
+    return RECORD_HEADER.pack(kind, len(body)) + body
+
+
+def _common_prefix(a, b):
+    n = min(len(a), len(b))
+    i = 0
+    while i < n and a[i] == b[i]:
+        i += 1
+    return i
+
+
+class CompactEncoder:
+    """Encodes transcript payloads of one room, keeping per-track alias and segment state"""
+
+    def __init__(self, lossy_interims=False, keyframe_interval=None):
+        self.lossy_interims = lossy_interims
+        self.keyframe_interval = max(1, keyframe_interval if keyframe_interval is not None
+                                     else int(os.getenv("CAPTION_KEYFRAME_INTERVAL", "5")))
+        self._aliases = {}
+        self._tracks = {}
+
+    def _track(self, payload):
+        sid = payload["trackSid"]
+        track = self._tracks.get(sid)
+        if track is None:
+            alias = len(self._aliases) % 0x10000
+            self._aliases[sid] = alias
+            track = self._tracks[sid] = {"alias": alias, "segment": 0, "seq": 0, "previous": None,
+                                           "announced": False, "since_keyframe": 0}
+        return track
+
+    def encode(self, payload):
+        """Encode one interim or final payload as a binary packet"""
+        track = self._track(payload)
+        records = []
+        keyframe = payload["type"] != "final" and (
+            track["previous"] is None
+            or (self.lossy_interims and track["since_keyframe"] >= self.keyframe_interval))
+        if not track["announced"] or (self.lossy_interims and (keyframe or payload["type"] == "final")):
+            sid = payload["trackSid"].encode("utf-8")
+            identity = payload["participant"].encode("utf-8")
+            records.append(_record(KIND_ALIAS, KEEP.pack(track["alias"]) + LENGTH.pack(len(sid)) + sid
+                                   + LENGTH.pack(len(identity)) + identity))
+            track["announced"] = True
+
+        text = payload["text"]
+        header = TEXT_HEADER.pack(track["alias"], track["segment"] % 0x100000000, track["seq"] % 0x10000)
+        track["seq"] += 1
+
+        if payload["type"] == "final":
+            records.append(_record(KIND_FINAL, header + text.encode("utf-8")))
+            # The next interim starts a new segment, announced again for late joiners
+            track["segment"] += 1
+            track["seq"] = 0
+            track["previous"] = None
+            track["announced"] = False
+        else:
+            previous = track["previous"]
+            if keyframe:
+                records.append(_record(KIND_INTERIM, header + text.encode("utf-8")))
+                track["since_keyframe"] = 1
+            else:
+                track["since_keyframe"] += 1
+                common = _common_prefix(previous, text)
+                keep = len(previous[:common].encode("utf-8"))
+                records.append(_record(KIND_DELTA, header + KEEP.pack(keep) + text[common:].encode("utf-8")))
+            track["previous"] = text
+
+        return PACKET_HEADER.pack(MAGIC, VERSION) + b"".join(records)
+
+
+class CompactDecoder:
+    """Reference decoder: turns packets back into transcript payloads"""
+
+    def __init__(self):
+        self._aliases = {}
+        self._previous = {}
+
+    def decode(self, packet):
+        """Return the list of payloads in a packet; deltas without their base are skipped"""
+        magic, version = PACKET_HEADER.unpack_from(packet, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"unsupported transcription packet (magic {magic!r}, version {version})")
+
+        payloads = []
+        offset = PACKET_HEADER.size
+        while offset < len(packet):
+            kind, length = RECORD_HEADER.unpack_from(packet, offset)
+            offset += RECORD_HEADER.size
+            body = packet[offset:offset + length]
+            offset += length
+
+            if kind == KIND_ALIAS:
+                (alias,) = KEEP.unpack_from(body, 0)
+                (sid_len,) = LENGTH.unpack_from(body, 2)
+                sid = body[4:4 + sid_len].decode("utf-8")
+                (identity_len,) = LENGTH.unpack_from(body, 4 + sid_len)
+                identity = body[6 + sid_len:6 + sid_len + identity_len].decode("utf-8")
+                self._aliases[alias] = (sid, identity)
+                continue
+            if kind not in (KIND_INTERIM, KIND_DELTA, KIND_FINAL):
+                continue  # Unknown record kinds are skipped for forward compatibility
+
+            alias, segment, seq = TEXT_HEADER.unpack_from(body, 0)
+            rest = body[TEXT_HEADER.size:]
+            if kind == KIND_DELTA:
+                base_segment, base_seq, base = self._previous.get(alias, (None, None, None))
+                (keep,) = KEEP.unpack_from(rest, 0)
+                if base_segment != segment or base_seq != (seq - 1) % 0x10000 or keep > len(base):
+                    # The interim it builds on was lost; the next keyframe resynchronizes
+                    self._previous.pop(alias, None)
+                    continue
+                data = base[:keep] + rest[KEEP.size:]
+            else:
+                data = bytes(rest)
+
+            if kind == KIND_FINAL:
+                self._previous.pop(alias, None)
+            else:
+                self._previous[alias] = (segment, seq, data)
+
+            if alias not in self._aliases:
+                continue
+            sid, identity = self._aliases[alias]
+            payloads.append({
+                "type": "final" if kind == KIND_FINAL else "interim",
+                "text": data.decode("utf-8"),
+                "participant": identity,
+                "trackSid": sid,
+                "segment": segment,
+                "seq": seq,
+            })
+        return payloads